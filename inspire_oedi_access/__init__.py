@@ -11,4 +11,17 @@ except PackageNotFoundError:
 
 
 from inspire_oedi_access.main import downloadAgriPVData, concatenateData
-from inspire_oedi_access.main import load_lookup_table, open_zarr_dataset, load_data_by_gid, load_data_by_gid_multiple_setups, find_nearest_gid, load_data_by_lat_lon, load_data_by_lat_lon_multiple_setups, load_data_by_lat_lon_range, load_data_by_lat_lon_range_multiple_setups
\ No newline at end of file
+from inspire_oedi_access.main import resample_time
+from inspire_oedi_access.main import load_lookup_table, open_zarr_dataset, load_data_by_gid, load_data_by_gid_multiple_setups, find_nearest_gid, load_data_by_lat_lon, load_data_by_lat_lon_multiple_setups, load_data_by_lat_lon_range, load_data_by_lat_lon_range_multiple_setups
+from inspire_oedi_access.sync import sync_zarr_store, sync_zarr_stores
+from inspire_oedi_access.catalog import build_catalog, load_catalog, list_versions, list_setups, dataset_path, get_store_metadata, plan_gid_query
+from inspire_oedi_access.merge import merge_files
+from inspire_oedi_access.aio import aload_lookup_table, aopen_zarr_group, aload_data_by_gid, aload_data_by_gid_multiple_setups, afind_nearest_gid, aload_data_by_lat_lon, aload_data_by_lat_lon_multiple_setups, aload_data_by_lat_lon_range, aload_data_by_lat_lon_range_multiple_setups
+from inspire_oedi_access.s3 import configure_s3, get_s3_client, get_s3_filesystem, get_s3_resource
+from inspire_oedi_access.cache import cached_load_data_by_gid_multiple_setups, cached_load_data_by_lat_lon_range_multiple_setups, clear_result_cache, query_key
+from inspire_oedi_access.batch import run_batch, read_sites, assign_nearest_gids, partition_sites
+from inspire_oedi_access.interpolate import find_nearest_gids, interpolation_weights, load_data_by_lat_lon_interpolated, load_data_by_lat_lon_interpolated_multiple_setups
+from inspire_oedi_access.lookup_index import build_lookup_index, open_lookup_index, lookup_index_dataframe, find_nearest_gid_indexed, find_gids_in_box, find_gids_in_boxes
+from inspire_oedi_access.compare import compare_setups, load_aligned_setups
+from inspire_oedi_access.profiling import profile_queries
+from inspire_oedi_access.rechunk import rechunk_setup, rechunk_setups, choose_layout
@@ -0,0 +1,347 @@
+import io
+import asyncio
+import weakref
+import fsspec
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from inspire_oedi_access.main import (
+    S3_BUCKET_PATH,
+    LOOKUP_TABLE_PATH,
+    ZARR_FILENAME_TEMPLATE,
+    _gids_in_box,
+    _store_url,
+    find_nearest_gid,
+)
+from inspire_oedi_access.s3 import s3_storage_options
+from inspire_oedi_access.sync import _synced_positions
+
+
+# One async S3 filesystem (and aiohttp/aiobotocore session) per event loop
+_ASYNC_FILESYSTEMS = weakref.WeakKeyDictionary()
+
+
+async def get_async_filesystem(url="s3://"):
+    """
+    Async fsspec filesystem for a URL.
+
+    S3 URLs share one anonymous S3 filesystem per event loop, so all queries
+    issued from that loop reuse the same session and connection pool
+    (configured with configure_s3).
+    Other protocols get a (wrapped) async filesystem of their own.
+    """
+    if url.startswith("s3://"):
+        loop = asyncio.get_running_loop()
+        fs = _ASYNC_FILESYSTEMS.get(loop)
+        if fs is None:
+            import s3fs
+            fs = s3fs.S3FileSystem(
+                asynchronous=True, loop=loop, skip_instance_cache=True, **s3_storage_options()
+            )
+            await fs.set_session()
+            _ASYNC_FILESYSTEMS[loop] = fs
+        return fs
+    fs, _ = fsspec.core.url_to_fs(url)
+    if not fs.async_impl:
+        from fsspec.implementations.asyn_wrapper import AsyncFileSystemWrapper
+        fs = AsyncFileSystemWrapper(fs)
+    return fs
+
+
+async def aload_lookup_table(lookup_table_path=LOOKUP_TABLE_PATH):
+    """
+    Async variant of load_lookup_table.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with columns: gid, latitude, longitude
+    """
+    fs = await get_async_filesystem(lookup_table_path)
+    content = await fs._cat_file(fs._strip_protocol(lookup_table_path))
+
+    def parse():
+        df = pd.read_csv(io.BytesIO(content), index_col=0)
+        return df.reset_index(names='gid')
+
+    return await asyncio.to_thread(parse)
+
+
+async def aopen_zarr_group(setup_num, s3_bucket_path=S3_BUCKET_PATH):
+    """
+    Open a setup's zarr store as an async zarr group (requires zarr>=3).
+
+    Parameters
+    ----------
+    setup_num : int
+        Setup number (1-10)
+    s3_bucket_path : str
+        S3 path to the zarr files directory
+
+    Returns
+    -------
+    zarr.AsyncGroup
+        Opened async zarr group
+    """
+    from zarr.api.asynchronous import open_group
+    from zarr.storage import FsspecStore
+
+    zarr_path = _store_url(s3_bucket_path, ZARR_FILENAME_TEMPLATE.format(setup_num=setup_num))
+    fs = await get_async_filesystem(zarr_path)
+    store = FsspecStore(fs, read_only=True, path=fs._strip_protocol(zarr_path))
+    return await open_group(store=store, mode="r")
+
+
+def _array_dims(array):
+    dims = getattr(array.metadata, "dimension_names", None)
+    if dims is None:
+        dims = array.attrs.get("_ARRAY_DIMENSIONS", [])
+    return tuple(dims)
+
+
+def _array_attrs(array):
+    # Mirror xarray's zarr backend so decode_cf masks and decodes identically
+    attrs = {k: v for k, v in array.attrs.items() if k != "_ARRAY_DIMENSIONS"}
+    fill_value = array.metadata.fill_value
+    if array.metadata.zarr_format == 2 and fill_value is not None and "_FillValue" not in attrs:
+        attrs["_FillValue"] = fill_value
+    return attrs
+
+
+async def aload_data_by_gid(setup_num, gids, s3_bucket_path=S3_BUCKET_PATH, variables=None):
+    """
+    Async variant of load_data_by_gid.
+
+    Unlike load_data_by_gid, the returned dataset is already loaded into
+    memory: all chunks are fetched concurrently without blocking the event loop.
+
+    Parameters
+    ----------
+    setup_num : int
+        Setup number (1-10)
+    gids : list of int
+        List of GIDs to load
+    s3_bucket_path : str
+        S3 path to the zarr files directory
+    variables : list of str, optional
+        Data variables to load. If None, all variables are loaded.
+
+    Returns
+    -------
+    xr.Dataset
+        Dataset subset containing only the specified GIDs, or None if no matching GIDs found
+    list
+        List of matching GIDs found in the dataset
+    """
+    group = await aopen_zarr_group(setup_num, s3_bucket_path)
+    arrays = {name: array async for name, array in group.arrays()}
+
+    dataset_gids = await arrays['gid'].getitem(...)
+    gid_mask = np.isin(dataset_gids, gids)
+    # Mirrors synced for a GID or time range only hold the chunks of that range
+    subset = _synced_positions(
+        _store_url(s3_bucket_path, ZARR_FILENAME_TEMPLATE.format(setup_num=setup_num))
+    )
+    if "gid" in subset:
+        gid_mask &= np.isin(np.arange(len(dataset_gids)), subset["gid"])
+    matching_gids = dataset_gids[gid_mask].tolist()
+
+    if len(matching_gids) == 0:
+        return None, []
+
+    gid_indices = np.where(gid_mask)[0]
+
+    all_dims = {dim for array in arrays.values() for dim in _array_dims(array)}
+    if variables is not None:
+        arrays = {
+            name: array for name, array in arrays.items()
+            if name in variables or name in all_dims
+        }
+
+    selections = dict(subset, gid=gid_indices)
+
+    async def read(array):
+        dims = _array_dims(array)
+        if not any(dim in selections for dim in dims):
+            return await array.getitem(...)
+        selection = tuple(selections.get(dim, slice(None)) for dim in dims)
+        return await array.get_orthogonal_selection(selection)
+
+    values = await asyncio.gather(*(read(array) for array in arrays.values()))
+
+    ds = xr.Dataset(
+        {
+            name: xr.Variable(_array_dims(array), data, _array_attrs(array))
+            for (name, array), data in zip(arrays.items(), values)
+        },
+        attrs=dict(group.attrs),
+    )
+    ds = xr.decode_cf(ds)
+
+    return ds, matching_gids
+
+
+async def aload_data_by_gid_multiple_setups(setup_nums, gids, s3_bucket_path=S3_BUCKET_PATH,
+                                            variables=None):
+    """
+    Async variant of load_data_by_gid_multiple_setups; setups are read concurrently.
+
+    Returns
+    -------
+    xr.Dataset
+        Combined dataset with a 'setup' dimension, or None if no matching GIDs found
+    dict
+        Dictionary mapping setup numbers to lists of matching GIDs found in each dataset
+    """
+    results = await asyncio.gather(*(
+        aload_data_by_gid(setup_num, gids, s3_bucket_path, variables=variables)
+        for setup_num in setup_nums
+    ))
+
+    datasets = []
+    matching_gids_dict = {}
+    for setup_num, (data, matching_gids) in zip(setup_nums, results):
+        if data is not None:
+            data = data.expand_dims('setup')
+            data = data.assign_coords(setup=[setup_num])
+            datasets.append(data)
+            matching_gids_dict[setup_num] = matching_gids
+
+    if len(datasets) == 0:
+        return None, {}
+
+    combined_data = xr.concat(datasets, dim='setup')
+
+    return combined_data, matching_gids_dict
+
+
+async def afind_nearest_gid(latitude, longitude, lookup_df=None):
+    """
+    Async variant of find_nearest_gid.
+
+    Returns
+    -------
+    int
+        Nearest GID
+    float
+        Distance to nearest point (in degrees)
+    float
+        Nearest latitude
+    float
+        Nearest longitude
+    """
+    if lookup_df is None:
+        lookup_df = await aload_lookup_table()
+    return await asyncio.to_thread(find_nearest_gid, latitude, longitude, lookup_df)
+
+
+async def aload_data_by_lat_lon(latitude, longitude, setup_num, s3_bucket_path=S3_BUCKET_PATH,
+                                lookup_df=None, variables=None):
+    """
+    Async variant of load_data_by_lat_lon.
+
+    Returns
+    -------
+    xr.Dataset or None
+        Dataset for the nearest GID, or None if GID not found
+    int
+        GID that was used
+    float
+        Distance to nearest point (in degrees)
+    float
+        Nearest latitude
+    float
+        Nearest longitude
+    """
+    nearest_gid, distance, nearest_lat, nearest_lon = await afind_nearest_gid(
+        latitude, longitude, lookup_df=lookup_df
+    )
+    data, matching_gids = await aload_data_by_gid(
+        setup_num, [nearest_gid], s3_bucket_path, variables=variables
+    )
+    return data, nearest_gid, distance, nearest_lat, nearest_lon
+
+
+async def aload_data_by_lat_lon_multiple_setups(latitude, longitude, setup_nums,
+                                                s3_bucket_path=S3_BUCKET_PATH, lookup_df=None,
+                                                variables=None):
+    """
+    Async variant of load_data_by_lat_lon_multiple_setups.
+
+    Returns
+    -------
+    xr.Dataset or None
+        Combined dataset with a 'setup' dimension, or None if GID not found
+    int
+        GID that was used
+    float
+        Distance to nearest point (in degrees)
+    float
+        Nearest latitude
+    float
+        Nearest longitude
+    """
+    nearest_gid, distance, nearest_lat, nearest_lon = await afind_nearest_gid(
+        latitude, longitude, lookup_df=lookup_df
+    )
+    data, matching_gids_dict = await aload_data_by_gid_multiple_setups(
+        setup_nums, [nearest_gid], s3_bucket_path, variables=variables
+    )
+    return data, nearest_gid, distance, nearest_lat, nearest_lon
+
+
+async def aload_data_by_lat_lon_range(lat_min, lat_max, lon_min, lon_max, setup_num,
+                                      s3_bucket_path=S3_BUCKET_PATH, lookup_df=None,
+                                      variables=None):
+    """
+    Async variant of load_data_by_lat_lon_range.
+
+    Returns
+    -------
+    xr.Dataset or None
+        Dataset containing all GIDs within the bounding box, or None if no GIDs found
+    pd.DataFrame
+        DataFrame of GIDs and their coordinates within the range
+    list
+        List of matching GIDs found in the dataset
+    """
+    if lookup_df is None:
+        lookup_df = await aload_lookup_table()
+
+    gids_in_range = _gids_in_box(lookup_df, lat_min, lat_max, lon_min, lon_max)
+    if len(gids_in_range) == 0:
+        return None, None, []
+
+    data, matching_gids = await aload_data_by_gid(
+        setup_num, gids_in_range['gid'].tolist(), s3_bucket_path, variables=variables
+    )
+    return data, gids_in_range, matching_gids
+
+
+async def aload_data_by_lat_lon_range_multiple_setups(lat_min, lat_max, lon_min, lon_max,
+                                                      setup_nums, s3_bucket_path=S3_BUCKET_PATH,
+                                                      lookup_df=None, variables=None):
+    """
+    Async variant of load_data_by_lat_lon_range_multiple_setups.
+
+    Returns
+    -------
+    xr.Dataset or None
+        Combined dataset with a 'setup' dimension, or None if no GIDs found
+    pd.DataFrame
+        DataFrame of GIDs and their coordinates within the range
+    dict
+        Dictionary mapping setup numbers to lists of matching GIDs found in each dataset
+    """
+    if lookup_df is None:
+        lookup_df = await aload_lookup_table()
+
+    gids_in_range = _gids_in_box(lookup_df, lat_min, lat_max, lon_min, lon_max)
+    if len(gids_in_range) == 0:
+        return None, None, {}
+
+    data, matching_gids_dict = await aload_data_by_gid_multiple_setups(
+        setup_nums, gids_in_range['gid'].tolist(), s3_bucket_path, variables=variables
+    )
+    return data, gids_in_range, matching_gids_dict
@@ -0,0 +1,283 @@
+import os
+import json
+import hashlib
+import argparse
+import dask
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from scipy.spatial import cKDTree
+
+from inspire_oedi_access.main import (
+    S3_BUCKET_PATH,
+    LOOKUP_TABLE_FILENAME,
+    _store_url,
+    load_lookup_table,
+    open_zarr_dataset,
+)
+
+
+PARTITIONS_FILENAME = "partitions.json"
+AGGREGATIONS = ("mean", "sum", "min", "max", "std")
+
+# Datasets opened by a worker process, reused across all partitions it handles
+_WORKER_DATASETS = {}
+_WORKER_S3_BUCKET_PATH = None
+
+
+def read_sites(sites_file):
+    """
+    Read site coordinates from a CSV or Parquet file.
+
+    The file needs latitude and longitude columns; a site_id column is added
+    (from the row number) if missing.
+    """
+    if sites_file.endswith((".parquet", ".pq")):
+        sites = pd.read_parquet(sites_file)
+    else:
+        sites = pd.read_csv(sites_file)
+    return _normalize_sites(sites)
+
+
+def _normalize_sites(sites):
+    missing = {"latitude", "longitude"} - set(sites.columns)
+    if missing:
+        raise ValueError(f"Sites are missing columns: {sorted(missing)}")
+    sites = sites.reset_index(drop=True)
+    if "site_id" not in sites.columns:
+        sites.insert(0, "site_id", np.arange(len(sites)))
+    return sites
+
+
+def _sites_hash(sites):
+    coords = np.ascontiguousarray(sites[['latitude', 'longitude']].to_numpy(dtype=np.float64))
+    return hashlib.sha1(coords.tobytes()).hexdigest()
+
+
+def assign_nearest_gids(sites, lookup_df=None):
+    """
+    Add the nearest GID and its distance (in degrees, as gid_distance) to every site.
+
+    Uses the same Euclidean lat/lon distance as find_nearest_gid, with a KD-tree
+    so that all sites are matched in one vectorized query.
+    """
+    if lookup_df is None:
+        lookup_df = load_lookup_table()
+    tree = cKDTree(lookup_df[['latitude', 'longitude']].values)
+    distances, indices = tree.query(sites[['latitude', 'longitude']].values)
+    sites = sites.copy()
+    sites['gid'] = lookup_df['gid'].values[indices]
+    # Not 'distance', which is a dimension of the ground irradiance variables
+    sites['gid_distance'] = distances
+    return sites
+
+
+def partition_sites(sites, dataset_gids, gid_chunk_size, partition_size=1000):
+    """
+    Group sites into partitions of spatially close sites that share zarr chunks.
+
+    Sites are ordered by the position of their GID in the store, so each
+    partition touches a contiguous run of gid chunks, and are then split at
+    chunk boundaries into partitions of roughly partition_size sites.
+
+    Returns
+    -------
+    list of list of int
+        Row positions of the sites in each partition
+    """
+    gid_positions = pd.Index(dataset_gids).get_indexer(sites['gid'].values)
+    order = np.argsort(gid_positions, kind="stable")
+    chunks = gid_positions[order] // gid_chunk_size
+
+    partitions = []
+    current = []
+    for position, chunk, next_chunk in zip(order, chunks, np.append(chunks[1:], -1)):
+        current.append(int(position))
+        # Only close a partition where the next site falls into another chunk
+        if len(current) >= partition_size and chunk != next_chunk:
+            partitions.append(current)
+            current = []
+    if current:
+        partitions.append(current)
+    return partitions
+
+
+def _gid_chunk_size(ds, variables):
+    for variable in variables:
+        chunks = ds[variable].encoding.get("chunks")
+        if chunks is not None and "gid" in ds[variable].dims:
+            return chunks[ds[variable].dims.index("gid")]
+    return ds.sizes["gid"]
+
+
+def _init_worker(s3_bucket_path):
+    global _WORKER_S3_BUCKET_PATH
+    _WORKER_S3_BUCKET_PATH = s3_bucket_path
+    _WORKER_DATASETS.clear()
+    # Partitions already run in parallel across processes; a forked worker also
+    # inherits the parent's dask thread pool without its threads, and would hang on it
+    dask.config.set(scheduler="synchronous")
+
+
+def _worker_dataset(setup_num):
+    if setup_num not in _WORKER_DATASETS:
+        _WORKER_DATASETS[setup_num] = open_zarr_dataset(setup_num, _WORKER_S3_BUCKET_PATH)
+    return _WORKER_DATASETS[setup_num]
+
+
+def _extract_partition(partition_id, sites, setup_nums, variables, aggregate, output_dir):
+    """
+    Extract (and optionally aggregate over time) the data of one partition of sites.
+    """
+    frames = []
+    for setup_num in setup_nums:
+        ds = _worker_dataset(setup_num)
+        dataset_gids = pd.Index(ds['gid'].values)
+        unique_gids = np.unique(sites['gid'].values)
+        gid_indices = dataset_gids.get_indexer(unique_gids)
+        gid_indices = np.sort(gid_indices[gid_indices >= 0])
+        if len(gid_indices) == 0:
+            continue
+
+        data = ds[list(variables)].isel(gid=gid_indices)
+        if aggregate is not None:
+            data = getattr(data, aggregate)(dim="time")
+        df = data.load().to_dataframe().reset_index()
+        df.insert(0, "setup", setup_num)
+        frames.append(df)
+
+    if frames:
+        result = sites.merge(pd.concat(frames, ignore_index=True), on="gid")
+    else:
+        result = sites.iloc[:0]
+
+    output_file = os.path.join(output_dir, f"partition_{partition_id:05d}.parquet")
+    result.to_parquet(output_file + ".tmp", index=False)
+    os.replace(output_file + ".tmp", output_file)
+    return partition_id, len(result)
+
+
+def run_batch(sites, output_dir, setup_nums, variables, aggregate=None,
+              s3_bucket_path=S3_BUCKET_PATH, lookup_df=None, partition_size=1000,
+              max_workers=None):
+    """
+    Extract data for many sites across setups with a process pool.
+
+    Sites are matched to their nearest GID, partitioned by spatial locality and
+    zarr chunk, and each partition is written to
+    ``output_dir/partition_XXXXX.parquet``. Re-running the same query with the
+    same output_dir resumes: partitions whose output already exists are
+    skipped. A different query (sites, setups, variables, aggregate, dataset
+    or partition_size) in that output_dir raises a ValueError.
+
+    Parameters
+    ----------
+    sites : pd.DataFrame or str
+        Site coordinates (latitude, longitude, optional site_id), or a CSV/Parquet file of them
+    output_dir : str
+        Directory for the per-partition outputs
+    setup_nums : list of int
+        List of setup numbers (1-10)
+    variables : list of str
+        Data variables to extract
+    aggregate : str, optional
+        Aggregate each site's time series with 'mean', 'sum', 'min', 'max' or
+        'std'. If None, full time series are written.
+    s3_bucket_path : str
+        S3 path to the zarr files directory
+    lookup_df : pd.DataFrame, optional
+        Lookup table DataFrame. If None, will load from s3_bucket_path.
+    partition_size : int
+        Approximate number of sites per partition
+    max_workers : int, optional
+        Number of worker processes (number of CPUs if None)
+
+    Returns
+    -------
+    list of str
+        Paths of all partition outputs
+    """
+    if aggregate is not None and aggregate not in AGGREGATIONS:
+        raise ValueError(f"aggregate must be one of {AGGREGATIONS}, not {aggregate!r}")
+    if isinstance(sites, str):
+        sites = read_sites(sites)
+    else:
+        sites = _normalize_sites(sites)
+
+    os.makedirs(output_dir, exist_ok=True)
+    partitions_file = os.path.join(output_dir, PARTITIONS_FILENAME)
+
+    if lookup_df is None:
+        lookup_df = load_lookup_table(_store_url(s3_bucket_path, LOOKUP_TABLE_FILENAME))
+    sites = assign_nearest_gids(sites, lookup_df)
+    query = {
+        "sites": _sites_hash(sites),
+        "n_sites": len(sites),
+        "setups": [int(s) for s in setup_nums],
+        "variables": list(variables),
+        "aggregate": aggregate,
+        "dataset": s3_bucket_path,
+        "partition_size": partition_size,
+    }
+    if os.path.exists(partitions_file):
+        # Resume with the partitioning of the interrupted run
+        with open(partitions_file) as f:
+            saved = json.load(f)
+        if saved.get("query") != query:
+            raise ValueError(f"{output_dir} holds the outputs of a different batch query")
+        partitions = saved["partitions"]
+    else:
+        ds = open_zarr_dataset(setup_nums[0], s3_bucket_path)
+        partitions = partition_sites(
+            sites, ds['gid'].values, _gid_chunk_size(ds, variables), partition_size
+        )
+        with open(partitions_file, "w") as f:
+            json.dump({"query": query, "partitions": partitions}, f)
+
+    output_files = [
+        os.path.join(output_dir, f"partition_{i:05d}.parquet") for i in range(len(partitions))
+    ]
+    pending = [i for i, output_file in enumerate(output_files) if not os.path.exists(output_file)]
+    print(f"{len(partitions)} partitions, {len(partitions) - len(pending)} already done")
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(s3_bucket_path,)) as executor:
+        futures = [
+            executor.submit(
+                _extract_partition, i, sites.iloc[partitions[i]], setup_nums, variables,
+                aggregate, output_dir,
+            )
+            for i in pending
+        ]
+        for done, future in enumerate(as_completed(futures), start=1):
+            partition_id, rows = future.result()
+            print(f"Partition {partition_id} done ({rows} rows), {done}/{len(pending)}")
+
+    return output_files
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Extract agrivoltaics irradiance data for many sites with a process pool."
+    )
+    parser.add_argument("sites_file", help="CSV or Parquet file with latitude/longitude columns")
+    parser.add_argument("output_dir", help="Directory for the per-partition Parquet outputs")
+    parser.add_argument("--setups", type=int, nargs="+", default=list(range(1, 11)),
+                        help="Setup numbers (default: 1-10)")
+    parser.add_argument("--variables", nargs="+", required=True, help="Data variables to extract")
+    parser.add_argument("--aggregate", choices=AGGREGATIONS, default=None,
+                        help="Aggregate each time series instead of writing it in full")
+    parser.add_argument("--partition-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--source", default=S3_BUCKET_PATH,
+                        help="Path of the zarr files directory")
+    args = parser.parse_args(argv)
+
+    run_batch(
+        args.sites_file, args.output_dir, args.setups, args.variables, aggregate=args.aggregate,
+        s3_bucket_path=args.source, partition_size=args.partition_size, max_workers=args.workers,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from inspire_oedi_access.main import (
+    CACHE_DIR,
+    S3_BUCKET_PATH,
+    _gids_in_box,
+    load_data_by_gid_multiple_setups,
+)
+
+
+RESULT_CACHE_DIR = os.path.join(CACHE_DIR, "results")
+# Size bound of the result cache in bytes; least recently used results are evicted first
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("INSPIRE_OEDI_RESULT_CACHE_MAX_BYTES", 10 * 2**30))
+# Results used more recently than this (in seconds) are never evicted, so a
+# result another process has just opened is not removed under it
+RESULT_CACHE_MIN_AGE = 60
+# Partial writes left by killed processes are removed after this many seconds
+RESULT_CACHE_TMP_MAX_AGE = 24 * 3600
+
+_DATA_NAME = "data.zarr"
+_QUERY_NAME = "query.json"
+
+
+def query_key(setup_nums, gids, s3_bucket_path=S3_BUCKET_PATH, variables=None, time_range=None):
+    """
+    Content-addressed key of a normalized query.
+
+    Queries that resolve to the same GID set, setups, variables, time window and
+    dataset version get the same key regardless of argument order or duplicates.
+    """
+    normalized = {
+        "dataset": s3_bucket_path.rstrip("/"),
+        "setups": sorted({int(s) for s in setup_nums}),
+        "gids": np.unique(np.asarray(gids, dtype=np.int64)).tolist(),
+        "variables": None if variables is None else sorted(set(variables)),
+        "time_range": None if time_range is None else [
+            None if t is None else pd.Timestamp(t).isoformat() for t in time_range
+        ],
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+
+
+def _entry_size(path):
+    return sum(
+        os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files
+    )
+
+
+def _evict(cache_dir, max_bytes):
+    """
+    Remove least recently used results until the cache fits in max_bytes.
+
+    Results used in the last RESULT_CACHE_MIN_AGE seconds are kept even if
+    the cache stays above max_bytes. Results are opened lazily, so a process
+    still reading a result it opened earlier fails if it is evicted meanwhile.
+    """
+    now = time.time()
+    entries = []
+    for key in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, key)
+        query_file = os.path.join(path, _QUERY_NAME)
+        if not os.path.exists(query_file):
+            if key.endswith(".tmp") and now - os.path.getmtime(path) > RESULT_CACHE_TMP_MAX_AGE:
+                shutil.rmtree(path, ignore_errors=True)
+            continue
+        entries.append((os.path.getmtime(query_file), _entry_size(path), path))
+
+    total = sum(size for _, size, _ in entries)
+    for used, size, path in sorted(entries):
+        if total <= max_bytes or now - used < RESULT_CACHE_MIN_AGE:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+def _open_entry(entry, matching_gids_dict, setup_nums):
+    """
+    Open a cached result with its setups in the requested order.
+
+    Cache keys ignore the order of the setups, so the entry may have been
+    written for the same setups in another order.
+    """
+    setups = [int(s) for s in setup_nums if int(s) in matching_gids_dict]
+    data = xr.open_zarr(os.path.join(entry, _DATA_NAME)).sel(setup=setups)
+    return data, {s: matching_gids_dict[s] for s in setups}
+
+
+def clear_result_cache(cache_dir=RESULT_CACHE_DIR):
+    """
+    Remove all cached query results.
+    """
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def cached_load_data_by_gid_multiple_setups(setup_nums, gids, s3_bucket_path=S3_BUCKET_PATH,
+                                            variables=None, time_range=None,
+                                            cache_dir=RESULT_CACHE_DIR,
+                                            max_bytes=RESULT_CACHE_MAX_BYTES, layout=None):
+    """
+    Memoized load_data_by_gid_multiple_setups.
+
+    The first call for a query materializes the result into a local zarr store;
+    identical queries afterwards are read from local disk instead of S3.
+
+    Parameters
+    ----------
+    setup_nums : list of int
+        List of setup numbers (1-10)
+    gids : list of int
+        List of GIDs to load
+    s3_bucket_path : str
+        S3 path to the zarr files directory
+    variables : list of str, optional
+        Data variables to keep. If None, all variables are kept.
+    time_range : tuple, optional
+        Inclusive (start, end) time window; either bound may be None.
+    cache_dir : str
+        Local directory of the result cache
+    max_bytes : int
+        Size bound of the result cache in bytes
+    layout : str, optional
+        Chunk layout read on a cache miss, see load_data_by_gid. The layout
+        does not change the result, so it is not part of the cache key.
+
+    Returns
+    -------
+    xr.Dataset
+        Combined dataset with a 'setup' dimension, or None if no matching GIDs found
+    dict
+        Dictionary mapping setup numbers to lists of matching GIDs found in each dataset
+    """
+    key = query_key(setup_nums, gids, s3_bucket_path, variables, time_range)
+    entry = os.path.join(cache_dir, key)
+    query_file = os.path.join(entry, _QUERY_NAME)
+
+    if os.path.exists(query_file):
+        # Touch the entry so eviction sees it as recently used
+        os.utime(query_file)
+        with open(query_file) as f:
+            matching_gids_dict = {int(k): v for k, v in json.load(f)["matching_gids"].items()}
+        if len(matching_gids_dict) == 0:
+            return None, {}
+        return _open_entry(entry, matching_gids_dict, setup_nums)
+
+    data, matching_gids_dict = load_data_by_gid_multiple_setups(
+        setup_nums, gids, s3_bucket_path, layout=layout, time_range=time_range
+    )
+
+    tmp_entry = f"{entry}.{os.getpid()}.tmp"
+    os.makedirs(tmp_entry, exist_ok=True)
+    try:
+        if data is not None:
+            if variables is not None:
+                data = data[list(variables)]
+            for var in data.variables.values():
+                var.encoding = {}
+            data.chunk({dim: "auto" for dim in data.dims}).to_zarr(
+                os.path.join(tmp_entry, _DATA_NAME), mode="w", consolidated=True, zarr_format=2
+            )
+        with open(os.path.join(tmp_entry, _QUERY_NAME), "w") as f:
+            json.dump({
+                "setups": list(setup_nums),
+                "dataset": s3_bucket_path,
+                "variables": variables,
+                "created": time.time(),
+                "matching_gids": {str(k): v for k, v in matching_gids_dict.items()},
+            }, f)
+    except BaseException:
+        # A partial entry has no query.json, so eviction would never see it
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        raise
+
+    try:
+        os.rename(tmp_entry, entry)
+    except OSError:
+        # Another process cached the same query first
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+
+    _evict(cache_dir, max_bytes)
+
+    if data is None or not os.path.exists(entry):
+        return data, matching_gids_dict
+    return _open_entry(entry, matching_gids_dict, setup_nums)
+
+
+def cached_load_data_by_lat_lon_range_multiple_setups(lat_min, lat_max, lon_min, lon_max,
+                                                      setup_nums, s3_bucket_path=S3_BUCKET_PATH,
+                                                      lookup_df=None, variables=None,
+                                                      time_range=None, cache_dir=RESULT_CACHE_DIR,
+                                                      max_bytes=RESULT_CACHE_MAX_BYTES):
+    """
+    Memoized load_data_by_lat_lon_range_multiple_setups.
+
+    The bounding box is resolved to its GID set first, so boxes that cover the
+    same grid points share one cached result.
+
+    Returns
+    -------
+    xr.Dataset or None
+        Combined dataset with a 'setup' dimension, or None if no GIDs found
+    pd.DataFrame
+        DataFrame of GIDs and their coordinates within the range
+    dict
+        Dictionary mapping setup numbers to lists of matching GIDs found in each dataset
+    """
+    gids_in_range = _gids_in_box(lookup_df, lat_min, lat_max, lon_min, lon_max)
+
+    if len(gids_in_range) == 0:
+        return None, None, {}
+
+    data, matching_gids_dict = cached_load_data_by_gid_multiple_setups(
+        setup_nums, gids_in_range['gid'].tolist(), s3_bucket_path, variables=variables,
+        time_range=time_range, cache_dir=cache_dir, max_bytes=max_bytes,
+    )
+
+    return data, gids_in_range, matching_gids_dict
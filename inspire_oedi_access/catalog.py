@@ -0,0 +1,279 @@
+import os
+import re
+import json
+import time
+import hashlib
+import numpy as np
+import xarray as xr
+
+from inspire_oedi_access.main import (
+    CACHE_DIR,
+    DATASET_ROOT,
+    _store_url,
+    _get_mapper,
+    _url_to_fs,
+)
+from inspire_oedi_access.sync import _read_zarr_metadata, _synced_positions
+
+
+# Cached catalogs older than this (in seconds) are rebuilt on load
+CATALOG_MAX_AGE = 7 * 24 * 3600
+
+_VERSION_PATTERN = re.compile(r"^v(\d+(?:\.\d+)*)$")
+_STORE_PATTERN = re.compile(r"^(?P<name>.+)_(?P<setup>\d+)\.zarr$")
+
+
+def _catalog_dir(dataset_root):
+    root_hash = hashlib.sha1(dataset_root.encode()).hexdigest()[:12]
+    return os.path.join(CACHE_DIR, "catalog", root_hash)
+
+
+def _version_key(version):
+    return tuple(int(part) for part in _VERSION_PATTERN.match(version).group(1).split("."))
+
+
+def _describe_store(fs, root, store_url):
+    """
+    Record the layout of one zarr store: dimensions, variables with shapes and
+    chunking, GID range and time range.
+    """
+    # Consolidated stores are described from .zmetadata alone; listing a store
+    # enumerates every chunk object, so it is only done for unconsolidated ones
+    if fs.exists(f"{root}/.zmetadata"):
+        listing = [".zmetadata"]
+    else:
+        listing = [p[len(root) + 1:] for p in fs.find(root)]
+    metadata = _read_zarr_metadata(fs, root, listing)
+
+    variables = {}
+    dims = {}
+    for key, meta in metadata.items():
+        if not key.endswith("/.zarray"):
+            continue
+        name = key[: -len("/.zarray")]
+        var_dims = metadata.get(f"{name}/.zattrs", {}).get("_ARRAY_DIMENSIONS", [])
+        variables[name] = {
+            "dims": var_dims,
+            "shape": meta["shape"],
+            "chunks": meta["chunks"],
+            "dtype": meta["dtype"],
+        }
+        dims.update(zip(var_dims, meta["shape"]))
+
+    # Positions are recorded as the loaders see them, i.e. within a mirror's synced ranges
+    ds = xr.open_zarr(_get_mapper(store_url)).isel(_synced_positions(store_url))
+    gids = ds["gid"].values
+    description = {
+        "dims": dims,
+        "variables": variables,
+        "n_gid": int(len(gids)),
+        "gid_min": int(gids.min()) if len(gids) else None,
+        "gid_max": int(gids.max()) if len(gids) else None,
+    }
+    if "time" in ds.coords:
+        times = ds["time"].values
+        description["time_start"] = str(times[0])
+        description["time_end"] = str(times[-1])
+
+    return description, gids
+
+
+def build_catalog(dataset_root=DATASET_ROOT):
+    """
+    Discover all dataset versions and setups below dataset_root and record
+    their store metadata in the local cache.
+
+    Parameters
+    ----------
+    dataset_root : str
+        S3 path (or local directory) containing the version directories (v1.0, v1.1, ...)
+
+    Returns
+    -------
+    dict
+        Catalog with the discovered versions, their paths and per-setup store metadata
+    """
+    root_url = _store_url(dataset_root, "").rstrip("/")
+    fs, root = _url_to_fs(root_url)
+    catalog_dir = _catalog_dir(dataset_root)
+
+    versions = {}
+    for version_path in fs.ls(root, detail=False):
+        version = os.path.basename(version_path.rstrip("/"))
+        if not _VERSION_PATTERN.match(version):
+            continue
+        print("Cataloging version " + version)
+        setups = {}
+        for store_path in fs.ls(version_path, detail=False):
+            store = os.path.basename(store_path.rstrip("/"))
+            match = _STORE_PATTERN.match(store)
+            if match is None:
+                continue
+            setup_num = int(match.group("setup"))
+            store_url = _store_url(f"{dataset_root}/{version}", store)
+            description, gids = _describe_store(fs, store_path.rstrip("/"), store_url)
+            description["store"] = store
+
+            gid_file = os.path.join(catalog_dir, version, f"{setup_num:02d}_gid.npy")
+            os.makedirs(os.path.dirname(gid_file), exist_ok=True)
+            np.save(gid_file, gids)
+            description["gid_file"] = gid_file
+
+            setups[str(setup_num)] = description
+        versions[version] = {"path": f"{dataset_root}/{version}", "setups": setups}
+
+    catalog = {"root": dataset_root, "created": time.time(), "versions": versions}
+
+    os.makedirs(catalog_dir, exist_ok=True)
+    catalog_file = os.path.join(catalog_dir, "catalog.json")
+    with open(catalog_file + ".tmp", "w") as f:
+        json.dump(catalog, f, indent=1)
+    os.replace(catalog_file + ".tmp", catalog_file)
+
+    return catalog
+
+
+def load_catalog(dataset_root=DATASET_ROOT, refresh=False, max_age=CATALOG_MAX_AGE):
+    """
+    Load the dataset catalog from the local cache, building it if it is
+    missing, older than max_age or refresh is requested.
+
+    Parameters
+    ----------
+    dataset_root : str
+        S3 path (or local directory) containing the version directories
+    refresh : bool
+        Rebuild the catalog even if a cached copy exists
+    max_age : float, optional
+        Maximum age of the cached catalog in seconds. If None, never expires.
+
+    Returns
+    -------
+    dict
+        Dataset catalog
+    """
+    catalog_file = os.path.join(_catalog_dir(dataset_root), "catalog.json")
+    if not refresh and os.path.exists(catalog_file):
+        with open(catalog_file) as f:
+            catalog = json.load(f)
+        if max_age is None or time.time() - catalog["created"] <= max_age:
+            return catalog
+    return build_catalog(dataset_root)
+
+
+def list_versions(catalog=None):
+    """
+    List the available dataset versions, oldest first.
+    """
+    if catalog is None:
+        catalog = load_catalog()
+    return sorted(catalog["versions"], key=_version_key)
+
+
+def list_setups(version=None, catalog=None):
+    """
+    List the setup numbers available for a version (latest if None).
+    """
+    if catalog is None:
+        catalog = load_catalog()
+    if version is None:
+        version = list_versions(catalog)[-1]
+    return sorted(int(s) for s in catalog["versions"][version]["setups"])
+
+
+def dataset_path(version=None, catalog=None):
+    """
+    Path of a dataset version (latest if None), usable as s3_bucket_path by the loaders.
+    """
+    if catalog is None:
+        catalog = load_catalog()
+    if version is None:
+        version = list_versions(catalog)[-1]
+    return catalog["versions"][version]["path"]
+
+
+def find_version(s3_bucket_path, catalog):
+    """
+    Version whose path is s3_bucket_path, or None if it is not in the catalog.
+    """
+    for version, entry in catalog["versions"].items():
+        if entry["path"].rstrip("/") == s3_bucket_path.rstrip("/"):
+            return version
+    return None
+
+
+def get_store_metadata(setup_num, version=None, catalog=None):
+    """
+    Store metadata (dims, variables, shapes, chunking, GID and time ranges) of a setup.
+
+    Parameters
+    ----------
+    setup_num : int
+        Setup number (1-10)
+    version : str, optional
+        Dataset version, latest if None
+    catalog : dict, optional
+        Dataset catalog. If None, loaded from the local cache.
+
+    Returns
+    -------
+    dict
+        Store metadata recorded in the catalog
+    """
+    if catalog is None:
+        catalog = load_catalog()
+    if version is None:
+        version = list_versions(catalog)[-1]
+    setups = catalog["versions"][version]["setups"]
+    if str(setup_num) not in setups:
+        raise ValueError(f"Setup {setup_num} not available in version {version}")
+    return setups[str(setup_num)]
+
+
+def plan_gid_query(setup_num, gids, version=None, catalog=None):
+    """
+    Resolve requested GIDs against the catalog without opening the store.
+
+    Parameters
+    ----------
+    setup_num : int
+        Setup number (1-10)
+    gids : list of int
+        List of GIDs to load
+    version : str, optional
+        Dataset version, latest if None
+    catalog : dict, optional
+        Dataset catalog. If None, loaded from the local cache.
+
+    Returns
+    -------
+    dict
+        ``gid_indices`` (positions along the gid dimension), ``matching_gids``
+        and ``gid_chunks`` (indices of the gid chunks the query touches)
+    """
+    metadata = get_store_metadata(setup_num, version, catalog)
+
+    # Skip the GID array entirely when the request is outside the store's range
+    gids = np.asarray(gids)
+    if (
+        metadata["n_gid"] == 0
+        or len(gids) == 0
+        or gids.max() < metadata["gid_min"]
+        or gids.min() > metadata["gid_max"]
+    ):
+        return {"gid_indices": np.array([], dtype=int), "matching_gids": [], "gid_chunks": []}
+
+    dataset_gids = np.load(metadata["gid_file"], mmap_mode="r")
+    gid_indices = np.where(np.isin(dataset_gids, gids))[0]
+
+    chunk_size = metadata["n_gid"]
+    for variable in metadata["variables"].values():
+        if "gid" in variable["dims"] and variable["dims"] != ["gid"]:
+            chunk_size = variable["chunks"][variable["dims"].index("gid")]
+            break
+
+    return {
+        "gid_indices": gid_indices,
+        "matching_gids": dataset_gids[gid_indices].tolist(),
+        "gid_chunks": np.unique(gid_indices // chunk_size).tolist(),
+    }
@@ -0,0 +1,298 @@
+import os
+import time
+import argparse
+import dask
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from inspire_oedi_access.main import (
+    S3_BUCKET_PATH,
+    LOOKUP_TABLE_FILENAME,
+    RESAMPLE_AGGREGATIONS,
+    _store_url,
+    load_data_by_gid_multiple_setups,
+    load_lookup_table,
+    resample_time,
+)
+from inspire_oedi_access.batch import AGGREGATIONS, run_batch
+from inspire_oedi_access.cache import cached_load_data_by_gid_multiple_setups
+from inspire_oedi_access.interpolate import (
+    INTERPOLATION_METHODS,
+    load_data_by_lat_lon_interpolated_multiple_setups,
+)
+from inspire_oedi_access.lookup_index import (
+    find_gids_in_box,
+    find_nearest_gid_indexed,
+    open_lookup_index,
+)
+from inspire_oedi_access.profiling import profile_queries
+from inspire_oedi_access.rechunk import LAYOUTS
+
+
+OUTPUT_FORMATS = ("parquet", "csv", "zarr")
+# Number of GIDs (or points) loaded and written at a time when streaming tables
+OUTPUT_BLOCK_SIZE = 256
+
+
+def _output_format(output_file):
+    extension = os.path.splitext(output_file.rstrip("/"))[1].lstrip(".").lower()
+    output_format = {"pq": "parquet"}.get(extension, extension)
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Output must end in one of {OUTPUT_FORMATS}, not {output_file!r}")
+    return output_format
+
+
+def write_dataset(data, output_file, block_size=OUTPUT_BLOCK_SIZE):
+    """
+    Write a (lazy) dataset to Parquet, CSV or zarr, chosen from the extension.
+
+    zarr stores are written chunk by chunk by dask. Tables are streamed in
+    blocks of block_size GIDs (or points), so only one block is in memory at a time.
+
+    Returns
+    -------
+    int
+        Number of rows written (GIDs for zarr)
+    """
+    output_format = _output_format(output_file)
+    site_dim = "gid" if "gid" in data.dims else "point"
+
+    if output_format == "zarr":
+        for var in data.variables.values():
+            var.encoding = {}
+        # A time window cut inside a chunk leaves a short first chunk, which
+        # zarr cannot store; regroup into chunks of the largest size
+        data = data.chunk({dim: max(sizes) for dim, sizes in data.chunksizes.items()})
+        data.to_zarr(output_file, mode="w", consolidated=True, zarr_format=2)
+        return data.sizes[site_dim]
+
+    tmp_file = output_file + ".tmp"
+    writer = None
+    rows = 0
+    try:
+        for start in range(0, data.sizes[site_dim], block_size):
+            block = data.isel({site_dim: slice(start, start + block_size)}).load()
+            table = pa.Table.from_pandas(block.to_dataframe().reset_index(), preserve_index=False)
+            if writer is None:
+                if output_format == "parquet":
+                    writer = pq.ParquetWriter(tmp_file, table.schema)
+                else:
+                    writer = pa_csv.CSVWriter(tmp_file, table.schema)
+            writer.write_table(table)
+            rows += table.num_rows
+    except BaseException:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+    if writer is not None:
+        writer.close()
+        os.replace(tmp_file, output_file)
+    return rows
+
+
+def _time_range(args):
+    if args.start is None and args.end is None:
+        return None
+    return (args.start, args.end)
+
+
+def _load_gids(args, gids):
+    """
+    Load GIDs across setups with the variable, time and resampling options of args.
+    """
+    if args.cache:
+        data, _ = cached_load_data_by_gid_multiple_setups(
+            args.setups, gids, args.source, variables=args.variables, time_range=_time_range(args),
+            layout=args.layout,
+        )
+    else:
+        data, _ = load_data_by_gid_multiple_setups(args.setups, gids, args.source,
+                                                   layout=args.layout, time_range=_time_range(args))
+        if data is not None and args.variables is not None:
+            data = data[args.variables]
+    if data is not None and args.resample is not None:
+        data = resample_time(data, args.resample, args.resample_how)
+    return data
+
+
+def _lookup_table_path(args):
+    return _store_url(args.source, LOOKUP_TABLE_FILENAME)
+
+
+def _write(data, args):
+    if data is None:
+        print("No matching GIDs found")
+        return
+    rows = write_dataset(data, args.output, args.block_size)
+    unit = "GIDs" if _output_format(args.output) == "zarr" else "rows"
+    print(f"Wrote {rows} {unit} to {args.output}")
+
+
+def _run_gid(args):
+    _write(_load_gids(args, args.gids), args)
+
+
+def _neighbors_file(output_file):
+    stem, extension = os.path.splitext(output_file)
+    return f"{stem}_neighbors{extension}"
+
+
+def _run_point(args):
+    if args.interpolate is not None:
+        data = load_data_by_lat_lon_interpolated_multiple_setups(
+            [args.latitude], [args.longitude], args.setups, method=args.interpolate,
+            variables=args.variables, s3_bucket_path=args.source,
+            lookup_df=load_lookup_table(_lookup_table_path(args)),
+        )
+        if _output_format(args.output) != "zarr":
+            # Neighbours have their own (point, neighbor) rows; in the data table
+            # they would repeat every (setup, point, time) row once per neighbour
+            neighbors = data[["neighbor_gid", "neighbor_weight"]]
+            data = data.drop_vars(list(neighbors.data_vars))
+            neighbors_file = _neighbors_file(args.output)
+            write_dataset(neighbors, neighbors_file)
+            print(f"Wrote interpolation neighbours to {neighbors_file}")
+        if _time_range(args) is not None:
+            data = data.sel(time=slice(*_time_range(args)))
+        if args.resample is not None:
+            data = resample_time(data, args.resample, args.resample_how)
+    else:
+        index = open_lookup_index(lookup_table_path=_lookup_table_path(args))
+        gid, distance, _, _ = find_nearest_gid_indexed(args.latitude, args.longitude, index)
+        print(f"Nearest GID {gid} at {distance:.4f} degrees")
+        data = _load_gids(args, [gid])
+    _write(data, args)
+
+
+def _run_bbox(args):
+    index = open_lookup_index(lookup_table_path=_lookup_table_path(args))
+    gids = find_gids_in_box(args.lat_min, args.lat_max, args.lon_min, args.lon_max, index)
+    gids = gids['gid'].tolist()
+    print(f"{len(gids)} GIDs in the bounding box")
+    _write(_load_gids(args, gids) if gids else None, args)
+
+
+def _run_export(args):
+    run_batch(
+        args.sites_file, args.output_dir, args.setups, args.variables, aggregate=args.aggregate,
+        s3_bucket_path=args.source, partition_size=args.partition_size, max_workers=args.workers,
+    )
+
+
+def _run_bench(args):
+    gids = args.gids
+    if gids is None:
+        index = open_lookup_index(lookup_table_path=_lookup_table_path(args))
+        gids = np.asarray(index["gid"][:args.n_gids]).tolist()
+
+    timings = []
+    for run in range(1, args.repeat + 1):
+        start = time.perf_counter()
+        data = _load_gids(args, gids)
+        if data is None:
+            print("No matching GIDs found")
+            return
+        opened = time.perf_counter()
+        data = data.load()
+        loaded = time.perf_counter()
+        timings.append(loaded - start)
+        print(f"Run {run}: open {opened - start:.3f} s, load {loaded - opened:.3f} s, "
+              f"{data.nbytes / 2**20 / (loaded - start):.1f} MiB/s")
+    print(f"{len(gids)} GIDs x {len(args.setups)} setups: "
+          f"min {min(timings):.3f} s, median {np.median(timings):.3f} s")
+
+
+def _add_common_arguments(parser, output=True):
+    parser.add_argument("--setups", type=int, nargs="+", default=list(range(1, 11)),
+                        help="Setup numbers (default: 1-10)")
+    parser.add_argument("--variables", nargs="+", default=None,
+                        help="Data variables to extract (default: all)")
+    parser.add_argument("--start", default=None, help="First timestamp to extract")
+    parser.add_argument("--end", default=None, help="Last timestamp to extract")
+    parser.add_argument("--resample", default=None,
+                        help="Resampling frequency (e.g. 'D', 'MS') or climatology grouping")
+    parser.add_argument("--resample-how", choices=RESAMPLE_AGGREGATIONS, default="mean")
+    parser.add_argument("--cache", action="store_true",
+                        help="Read and fill the local result cache")
+    parser.add_argument("--source", default=S3_BUCKET_PATH,
+                        help="Path of the zarr files directory")
+    parser.add_argument("--layout", choices=("auto",) + tuple(LAYOUTS), default=None,
+                        help="Read a rechunked copy of the stores (see inspire_oedi_access.rechunk)")
+    if output:
+        parser.add_argument("-o", "--output", required=True,
+                            help="Output file (.parquet, .csv or .zarr)")
+        parser.add_argument("--block-size", type=int, default=OUTPUT_BLOCK_SIZE,
+                            help="GIDs loaded and written at a time for table outputs")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="inspire-oedi",
+        description="Extract agrivoltaics irradiance data from the OEDI data lake.",
+    )
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of threads (processes for export) used to load data")
+    parser.add_argument("--profile", default=None, metavar="TRACE_FILE",
+                        help="Profile the command and write a trace report to this file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    gid_parser = subparsers.add_parser("gid", help="Extract data by GID")
+    gid_parser.add_argument("gids", type=int, nargs="+")
+    _add_common_arguments(gid_parser)
+    gid_parser.set_defaults(run=_run_gid)
+
+    point_parser = subparsers.add_parser("point", help="Extract data at a latitude/longitude")
+    point_parser.add_argument("latitude", type=float)
+    point_parser.add_argument("longitude", type=float)
+    point_parser.add_argument("--interpolate", choices=INTERPOLATION_METHODS, default=None,
+                              help="Interpolate from the 4 nearest GIDs instead of the nearest one")
+    _add_common_arguments(point_parser)
+    point_parser.set_defaults(run=_run_point)
+
+    bbox_parser = subparsers.add_parser("bbox", help="Extract all GIDs in a bounding box")
+    for name in ("lat_min", "lat_max", "lon_min", "lon_max"):
+        bbox_parser.add_argument(name, type=float)
+    _add_common_arguments(bbox_parser)
+    bbox_parser.set_defaults(run=_run_bbox)
+
+    export_parser = subparsers.add_parser(
+        "export", help="Extract data for a file of sites with a process pool"
+    )
+    export_parser.add_argument("sites_file", help="CSV or Parquet file with latitude/longitude columns")
+    export_parser.add_argument("output_dir", help="Directory for the per-partition Parquet outputs")
+    export_parser.add_argument("--setups", type=int, nargs="+", default=list(range(1, 11)),
+                               help="Setup numbers (default: 1-10)")
+    export_parser.add_argument("--variables", nargs="+", required=True,
+                               help="Data variables to extract")
+    export_parser.add_argument("--aggregate", choices=AGGREGATIONS, default=None,
+                               help="Aggregate each time series instead of writing it in full")
+    export_parser.add_argument("--partition-size", type=int, default=1000)
+    export_parser.add_argument("--source", default=S3_BUCKET_PATH,
+                               help="Path of the zarr files directory")
+    export_parser.set_defaults(run=_run_export)
+
+    bench_parser = subparsers.add_parser("bench", help="Time repeated loads of a GID query")
+    bench_parser.add_argument("--gids", type=int, nargs="+", default=None,
+                              help="GIDs to load (default: the first --n-gids of the lookup table)")
+    bench_parser.add_argument("--n-gids", type=int, default=10)
+    bench_parser.add_argument("--repeat", type=int, default=3)
+    _add_common_arguments(bench_parser, output=False)
+    bench_parser.set_defaults(run=_run_bench)
+
+    args = parser.parse_args(argv)
+
+    scheduler = {} if args.workers is None else {"scheduler": "threads", "num_workers": args.workers}
+    with dask.config.set(scheduler):
+        if args.profile is not None:
+            with profile_queries(args.profile, label=args.command):
+                args.run(args)
+        else:
+            args.run(args)
+
+
+if __name__ == "__main__":
+    main()
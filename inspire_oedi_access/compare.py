@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from inspire_oedi_access.main import S3_BUCKET_PATH, open_zarr_dataset
+
+
+COMPARISONS = ("difference", "ratio", "rank", "best")
+TIME_AGGREGATIONS = ("mean", "sum", "min", "max")
+
+
+def _difference(stacked, reference, setup_nums):
+    return stacked - stacked[..., [reference]]
+
+
+def _ratio(stacked, reference, setup_nums):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return stacked / stacked[..., [reference]]
+
+
+def _rank(stacked, reference, setup_nums):
+    # Rank 1 is the setup with the highest value; NaNs rank last
+    order = np.argsort(-np.nan_to_num(stacked, nan=-np.inf), axis=-1, kind="stable")
+    return np.argsort(order, axis=-1, kind="stable") + 1
+
+
+def _best(stacked, reference, setup_nums):
+    return setup_nums[np.argmax(np.nan_to_num(stacked, nan=-np.inf), axis=-1)]
+
+
+_KERNELS = {"difference": _difference, "ratio": _ratio, "rank": _rank, "best": _best}
+
+
+def load_aligned_setups(setup_nums, gids, variable, s3_bucket_path=S3_BUCKET_PATH):
+    """
+    Lazily select one variable from several setups at the same GIDs.
+
+    Only GIDs present in every setup are kept, in the same order for all setups,
+    so the arrays line up chunk for chunk.
+
+    Returns
+    -------
+    list of xr.DataArray
+        One lazy array per setup
+    list
+        GIDs common to all setups
+    """
+    datasets = [open_zarr_dataset(setup_num, s3_bucket_path) for setup_num in setup_nums]
+
+    common_gids = np.asarray(gids)
+    for ds in datasets:
+        common_gids = common_gids[np.isin(common_gids, ds['gid'].values)]
+    common_gids = np.unique(common_gids)
+
+    arrays = []
+    for ds in datasets:
+        positions = pd.Index(ds['gid'].values).get_indexer(common_gids)
+        arrays.append(ds[variable].isel(gid=positions))
+    return arrays, common_gids.tolist()
+
+
+def compare_setups(setup_nums, gids, variable, comparison, reference_setup=None, aggregate=None,
+                   s3_bucket_path=S3_BUCKET_PATH):
+    """
+    Compare setups at the same GIDs in a single streaming pass.
+
+    The kernel is applied to the aligned chunks of all setups at once (via
+    dask), so the full multi-setup cube is never concatenated in memory.
+
+    Parameters
+    ----------
+    setup_nums : list of int
+        List of setup numbers (1-10)
+    gids : list of int
+        List of GIDs to compare
+    variable : str
+        Variable to compare, e.g. 'ground_irradiance'
+    comparison : str
+        'difference' or 'ratio' against reference_setup, 'rank' (1 = highest
+        value) or 'best' (setup with the highest value)
+    reference_setup : int, optional
+        Reference setup for 'difference' and 'ratio'. Defaults to the first setup.
+    aggregate : str, optional
+        Reduce over time with 'mean', 'sum', 'min' or 'max' before comparing,
+        e.g. to rank setups by their annual mean. If None, compares every timestep.
+    s3_bucket_path : str
+        S3 path to the zarr files directory
+
+    Returns
+    -------
+    xr.DataArray
+        Lazy result; with a 'setup' dimension for 'difference', 'ratio' and
+        'rank', and holding setup numbers for 'best'
+    """
+    if comparison not in COMPARISONS:
+        raise ValueError(f"comparison must be one of {COMPARISONS}, not {comparison!r}")
+    if aggregate is not None and aggregate not in TIME_AGGREGATIONS:
+        raise ValueError(f"aggregate must be one of {TIME_AGGREGATIONS}, not {aggregate!r}")
+    setup_nums = list(setup_nums)
+    if reference_setup is None:
+        reference_setup = setup_nums[0]
+    if reference_setup not in setup_nums:
+        raise ValueError(f"Reference setup {reference_setup} is not among {setup_nums}")
+
+    arrays, common_gids = load_aligned_setups(setup_nums, gids, variable, s3_bucket_path)
+    if len(common_gids) == 0:
+        return None
+    if aggregate is not None:
+        arrays = [getattr(array, aggregate)(dim='time') for array in arrays]
+
+    kernel = _KERNELS[comparison]
+    reference = setup_nums.index(reference_setup)
+    labels = np.asarray(setup_nums)
+
+    def apply(*blocks):
+        return kernel(np.stack(blocks, axis=-1), reference, labels)
+
+    if comparison == "best":
+        result = xr.apply_ufunc(apply, *arrays, dask="parallelized", output_dtypes=[labels.dtype])
+    else:
+        result = xr.apply_ufunc(
+            apply, *arrays,
+            dask="parallelized",
+            output_core_dims=[["setup"]],
+            output_dtypes=[np.int64 if comparison == "rank" else np.float64],
+            dask_gufunc_kwargs={"output_sizes": {"setup": len(setup_nums)}},
+        )
+        result = result.assign_coords(setup=setup_nums)
+
+    result.name = f"{variable}_{comparison}"
+    result.attrs = {"comparison": comparison, "reference_setup": reference_setup}
+    return result
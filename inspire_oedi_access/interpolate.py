@@ -0,0 +1,204 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+from scipy.spatial import cKDTree
+
+from inspire_oedi_access.main import S3_BUCKET_PATH, load_lookup_table, open_zarr_dataset
+
+
+INTERPOLATION_METHODS = ("idw", "bilinear")
+
+
+def find_nearest_gids(latitudes, longitudes, k=4, lookup_df=None):
+    """
+    Find the k nearest GIDs for each of a batch of lat/lon points.
+
+    Distances are Euclidean in lat/lon space, as in find_nearest_gid.
+
+    Parameters
+    ----------
+    latitudes : array-like of float
+        Target latitudes
+    longitudes : array-like of float
+        Target longitudes
+    k : int
+        Number of neighbours per point
+    lookup_df : pd.DataFrame, optional
+        Lookup table DataFrame. If None, will load from S3.
+
+    Returns
+    -------
+    np.ndarray
+        GIDs of the neighbours, shape (n_points, k), nearest first
+    np.ndarray
+        Distances to the neighbours (in degrees), shape (n_points, k)
+    np.ndarray
+        Latitudes of the neighbours, shape (n_points, k)
+    np.ndarray
+        Longitudes of the neighbours, shape (n_points, k)
+    """
+    if lookup_df is None:
+        lookup_df = load_lookup_table()
+    coords = lookup_df[['latitude', 'longitude']].values
+    targets = np.column_stack([np.atleast_1d(latitudes), np.atleast_1d(longitudes)])
+
+    distances, indices = cKDTree(coords).query(targets, k=k)
+    distances = distances.reshape(len(targets), k)
+    indices = indices.reshape(len(targets), k)
+
+    gids = lookup_df['gid'].values[indices]
+    return gids, distances, coords[indices, 0], coords[indices, 1]
+
+
+def _idw_weights(distances, power):
+    with np.errstate(divide="ignore"):
+        weights = 1.0 / distances ** power
+    # A point that coincides with a grid point takes that point's value
+    exact = distances == 0
+    exact_rows = exact.any(axis=1)
+    weights[exact_rows] = exact[exact_rows].astype(float)
+    return weights / weights.sum(axis=1, keepdims=True)
+
+
+def interpolation_weights(latitudes, longitudes, distances, neighbor_lats, neighbor_lons,
+                          method="idw", power=2):
+    """
+    Interpolation weights of each point's neighbours; every row sums to 1.
+
+    'idw' weights neighbours by inverse distance to the given power. 'bilinear'
+    fits f = a + b*lon + c*lat + d*lon*lat through 4 neighbours, which is exact
+    bilinear interpolation on a rectangular grid cell; points whose neighbours
+    are degenerate (e.g. collinear) fall back to inverse distance weights.
+    """
+    if method not in INTERPOLATION_METHODS:
+        raise ValueError(f"method must be one of {INTERPOLATION_METHODS}, not {method!r}")
+
+    weights = _idw_weights(distances, power)
+    if method == "idw":
+        return weights
+
+    if distances.shape[1] != 4:
+        raise ValueError("Bilinear interpolation needs k=4 neighbours")
+
+    # Coordinates relative to the target point, so the target is at the origin
+    x = neighbor_lons - np.atleast_1d(longitudes)[:, None]
+    y = neighbor_lats - np.atleast_1d(latitudes)[:, None]
+    design = np.stack([np.ones_like(x), x, y, x * y], axis=2)
+
+    # Bilinear weights w solve design^T w = [1, 0, 0, 0] (the basis at the origin)
+    scale = np.abs(design).max(axis=1, keepdims=True)
+    scale[scale == 0] = 1.0
+    regular = np.abs(np.linalg.det(design / scale)) > 1e-6
+    target = np.zeros((regular.sum(), 4, 1))
+    target[:, 0, 0] = 1.0
+    weights[regular] = np.linalg.solve(design[regular].transpose(0, 2, 1), target)[..., 0]
+    return weights
+
+
+def load_data_by_lat_lon_interpolated(latitudes, longitudes, setup_num, k=4, method="idw",
+                                      power=2, variables=None, s3_bucket_path=S3_BUCKET_PATH,
+                                      lookup_df=None):
+    """
+    Interpolate data to a batch of lat/lon points from their k nearest GIDs.
+
+    The neighbours of all points are read in one selection over the sorted,
+    deduplicated GID positions, so each zarr chunk is fetched once, and the
+    weighted sums are computed as a single (point x gid) contraction.
+
+    Parameters
+    ----------
+    latitudes : array-like of float
+        Target latitudes
+    longitudes : array-like of float
+        Target longitudes
+    setup_num : int
+        Setup number (1-10)
+    k : int
+        Number of neighbours per point (must be 4 for 'bilinear')
+    method : str
+        'idw' (inverse distance weighting) or 'bilinear'
+    power : float
+        Power of the inverse distance weights
+    variables : list of str, optional
+        Variables to interpolate. If None, all variables with a gid dimension.
+    s3_bucket_path : str
+        S3 path to the zarr files directory
+    lookup_df : pd.DataFrame, optional
+        Lookup table DataFrame. If None, will load from S3.
+
+    Returns
+    -------
+    xr.Dataset
+        Interpolated data with a 'point' dimension instead of 'gid', plus the
+        neighbour GIDs and weights of every point
+    """
+    latitudes = np.atleast_1d(np.asarray(latitudes, dtype=float))
+    longitudes = np.atleast_1d(np.asarray(longitudes, dtype=float))
+
+    gids, distances, neighbor_lats, neighbor_lons = find_nearest_gids(
+        latitudes, longitudes, k=k, lookup_df=lookup_df
+    )
+    weights = interpolation_weights(
+        latitudes, longitudes, distances, neighbor_lats, neighbor_lons, method, power
+    )
+
+    ds = open_zarr_dataset(setup_num, s3_bucket_path)
+    if variables is None:
+        variables = [name for name in ds.data_vars if 'gid' in ds[name].dims]
+
+    gid_positions = pd.Index(ds['gid'].values).get_indexer(gids.ravel()).reshape(gids.shape)
+    if (gid_positions < 0).any():
+        # Neighbours missing from this setup get no weight
+        weights = np.where(gid_positions < 0, 0.0, weights)
+        weights = weights / weights.sum(axis=1, keepdims=True)
+
+    # One coalesced read of all neighbours of all points
+    unique_positions, inverse = np.unique(gid_positions[gid_positions >= 0], return_inverse=True)
+    data = ds[list(variables)].isel(gid=unique_positions)
+
+    # Sparse (point x neighbour) weights scattered into a dense (point x gid) matrix
+    weight_matrix = np.zeros((len(latitudes), len(unique_positions)))
+    rows = np.broadcast_to(np.arange(len(latitudes))[:, None], gids.shape)[gid_positions >= 0]
+    np.add.at(weight_matrix, (rows, inverse), weights[gid_positions >= 0])
+    weight_matrix = xr.DataArray(weight_matrix, dims=('point', 'gid'))
+
+    result = xr.Dataset({
+        name: xr.dot(weight_matrix, data[name].drop_vars('gid'), dim='gid')
+        for name in variables
+    })
+    result = result.assign_coords(
+        latitude=('point', latitudes),
+        longitude=('point', longitudes),
+    )
+    result['neighbor_gid'] = (('point', 'neighbor'), gids)
+    result['neighbor_weight'] = (('point', 'neighbor'), weights)
+
+    return result
+
+
+def load_data_by_lat_lon_interpolated_multiple_setups(latitudes, longitudes, setup_nums, k=4,
+                                                      method="idw", power=2, variables=None,
+                                                      s3_bucket_path=S3_BUCKET_PATH,
+                                                      lookup_df=None):
+    """
+    Interpolate data to a batch of lat/lon points from multiple setups.
+
+    Returns
+    -------
+    xr.Dataset
+        Combined interpolated dataset with 'setup' and 'point' dimensions
+    """
+    if lookup_df is None:
+        lookup_df = load_lookup_table()
+
+    datasets = []
+    for setup_num in setup_nums:
+        data = load_data_by_lat_lon_interpolated(
+            latitudes, longitudes, setup_num, k=k, method=method, power=power,
+            variables=variables, s3_bucket_path=s3_bucket_path, lookup_df=lookup_df,
+        )
+        data = data.expand_dims('setup')
+        data = data.assign_coords(setup=[setup_num])
+        datasets.append(data)
+
+    return xr.concat(datasets, dim='setup')
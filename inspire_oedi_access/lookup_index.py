@@ -0,0 +1,435 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+
+from inspire_oedi_access.main import CACHE_DIR, LOOKUP_TABLE_PATH, _url_to_fs, load_lookup_table
+from inspire_oedi_access.sync import _fingerprint
+
+
+LOOKUP_INDEX_DIR = os.path.join(CACHE_DIR, "lookup_index")
+# Side length (in degrees) of the grid buckets of the spatial index
+LOOKUP_INDEX_CELL_SIZE = 0.25
+# Seconds between checks of the lookup table for changes, shared by all processes on a host
+LOOKUP_INDEX_CHECK_INTERVAL = 3600
+
+_INDEX_ARRAYS = ("gid", "latitude", "longitude", "order", "cell_starts")
+
+# Indexes already mapped by this process, keyed by directory
+_OPENED = {}
+
+
+def _index_dir(lookup_table_path):
+    path_hash = hashlib.sha1(lookup_table_path.encode()).hexdigest()[:12]
+    return os.path.join(LOOKUP_INDEX_DIR, path_hash)
+
+
+def _index_versions(index_dir):
+    """
+    Complete builds in an index directory, newest first.
+    """
+    try:
+        names = os.listdir(index_dir)
+    except FileNotFoundError:
+        return []
+    return sorted((name for name in names if name.startswith("v") and name[1:].isdigit()),
+                  reverse=True)
+
+
+def _source_fingerprint(lookup_table_path):
+    """
+    Change marker (ETag or mtime, plus size) of the lookup table.
+    """
+    fs, path = _url_to_fs(lookup_table_path)
+    return _fingerprint(fs.info(path))
+
+
+def build_lookup_index(lookup_df=None, index_dir=None, lookup_table_path=LOOKUP_TABLE_PATH,
+                       cell_size=LOOKUP_INDEX_CELL_SIZE):
+    """
+    Persist the lookup table and a grid-bucket spatial index as .npy files.
+
+    Rows are bucketed into square lat/lon cells of cell_size degrees; ``order``
+    lists row positions sorted by cell and ``cell_starts`` holds the offset of
+    every cell in ``order``, so the rows of a cell are a contiguous slice.
+
+    When the table is loaded from lookup_table_path, its ETag (or mtime) and
+    size are recorded, so open_lookup_index rebuilds the index if it changes.
+
+    Parameters
+    ----------
+    lookup_df : pd.DataFrame, optional
+        Lookup table DataFrame. If None, loaded from lookup_table_path.
+    index_dir : str, optional
+        Directory of the index. If None, derived from lookup_table_path under the cache.
+    lookup_table_path : str
+        URL or local path of gid-lat-lon.csv
+    cell_size : float
+        Side length of the grid buckets in degrees
+
+    Returns
+    -------
+    str
+        Directory of the index
+    """
+    source = None
+    if lookup_df is None:
+        # Fingerprinted before reading, so a change made meanwhile is caught on the next open
+        source = {"path": lookup_table_path, "fingerprint": _source_fingerprint(lookup_table_path)}
+        lookup_df = load_lookup_table(lookup_table_path)
+    if index_dir is None:
+        index_dir = _index_dir(lookup_table_path)
+
+    latitude = lookup_df['latitude'].to_numpy(dtype=np.float64)
+    longitude = lookup_df['longitude'].to_numpy(dtype=np.float64)
+    lat_min, lon_min = float(latitude.min()), float(longitude.min())
+    n_lat = int((latitude.max() - lat_min) // cell_size) + 1
+    n_lon = int((longitude.max() - lon_min) // cell_size) + 1
+
+    cells = (
+        ((latitude - lat_min) // cell_size).astype(np.int64) * n_lon
+        + ((longitude - lon_min) // cell_size).astype(np.int64)
+    )
+    order = np.argsort(cells, kind="stable")
+    cell_starts = np.searchsorted(cells[order], np.arange(n_lat * n_lon + 1))
+
+    arrays = {
+        "gid": lookup_df['gid'].to_numpy(dtype=np.int64),
+        "latitude": latitude,
+        "longitude": longitude,
+        "order": order.astype(np.int64),
+        "cell_starts": cell_starts.astype(np.int64),
+    }
+    meta = {
+        "lat_min": lat_min, "lon_min": lon_min, "cell_size": cell_size,
+        "n_lat": n_lat, "n_lon": n_lon, "n_rows": len(latitude),
+        "source": source,
+    }
+
+    # Every build is renamed into its own version directory and readers map the
+    # newest one, so a concurrent build never replaces files a reader is opening
+    tmp_dir = os.path.join(index_dir, f"build.{os.getpid()}.{time.time_ns()}.tmp")
+    os.makedirs(tmp_dir)
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, name + ".npy"), array)
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        version = f"v{time.time_ns():020d}"
+        os.rename(tmp_dir, os.path.join(index_dir, version))
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    _touch(os.path.join(index_dir, "checked"))
+
+    # Older builds are removed; processes that mapped them keep their pages
+    for name in os.listdir(index_dir):
+        path = os.path.join(index_dir, name)
+        if os.path.isdir(path) and name.startswith("v") and name < version:
+            shutil.rmtree(path, ignore_errors=True)
+        elif name.endswith(".npy") or name == "meta.json":
+            # Unversioned layout of earlier releases
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    _OPENED.pop(index_dir, None)
+
+    return index_dir
+
+
+def _touch(path):
+    with open(path, "a"):
+        pass
+    os.utime(path)
+
+
+def _check_due(index_dir, check_interval):
+    if check_interval is None:
+        return False
+    try:
+        return time.time() - os.path.getmtime(os.path.join(index_dir, "checked")) >= check_interval
+    except FileNotFoundError:
+        return True
+
+
+def _map_index(index_dir):
+    """
+    Map the newest build of an index, or return None if there is none.
+    """
+    for _ in range(3):
+        versions = _index_versions(index_dir)
+        if not versions:
+            return None
+        version_dir = os.path.join(index_dir, versions[0])
+        try:
+            index = {
+                name: np.load(os.path.join(version_dir, name + ".npy"), mmap_mode="r")
+                for name in _INDEX_ARRAYS
+            }
+            with open(os.path.join(version_dir, "meta.json")) as f:
+                index["meta"] = json.load(f)
+            return index
+        except FileNotFoundError:
+            # Removed by a newer build meanwhile
+            continue
+    raise FileNotFoundError(f"Lookup index in {index_dir} keeps changing while it is opened")
+
+
+def open_lookup_index(index_dir=None, lookup_table_path=LOOKUP_TABLE_PATH, build=True,
+                      check_interval=LOOKUP_INDEX_CHECK_INTERVAL):
+    """
+    Map a persisted lookup index read-only, building it first if it is missing.
+
+    All processes on a host that open the same index share its pages through
+    the OS page cache, so memory use does not grow with the number of workers.
+
+    The lookup table's ETag (or mtime) and size are compared with those the
+    index was built from, and the index is rebuilt if the table changed. The
+    check sends a metadata request for the table (to S3 by default), so it is
+    made at most once per check_interval seconds by all processes on the
+    host; opening the index is otherwise local. Indexes built from a
+    DataFrame into an explicit index_dir are not checked.
+
+    Parameters
+    ----------
+    index_dir : str, optional
+        Directory of the index. If None, derived from lookup_table_path under the cache.
+    lookup_table_path : str
+        URL or local path of gid-lat-lon.csv
+    build : bool
+        Build the index if it is missing or stale; otherwise a missing index raises
+    check_interval : float, optional
+        Minimum seconds between checks of the lookup table; 0 checks on every
+        first open in a process, None never checks
+
+    Returns
+    -------
+    dict
+        Memory-mapped arrays (gid, latitude, longitude, order, cell_starts) and
+        the grid parameters under ``meta``
+    """
+    derived = index_dir is None
+    if derived:
+        index_dir = _index_dir(lookup_table_path)
+    if index_dir in _OPENED:
+        return _OPENED[index_dir]
+
+    index = _map_index(index_dir)
+    if index is None:
+        if not build:
+            raise FileNotFoundError(f"No lookup index in {index_dir}")
+        build_lookup_index(index_dir=index_dir, lookup_table_path=lookup_table_path)
+        index = _map_index(index_dir)
+    elif build and _check_due(index_dir, check_interval):
+        source = index["meta"].get("source")
+        if source is not None:
+            stale = source["fingerprint"] != _source_fingerprint(source["path"])
+        else:
+            # Indexes of the default location predating fingerprints cannot be checked
+            stale = derived
+        if stale:
+            print("Lookup table changed, rebuilding the lookup index")
+            build_lookup_index(index_dir=index_dir,
+                               lookup_table_path=source["path"] if source else lookup_table_path)
+            index = _map_index(index_dir)
+        else:
+            _touch(os.path.join(index_dir, "checked"))
+
+    _OPENED[index_dir] = index
+    return index
+
+
+def lookup_index_dataframe(index):
+    """
+    Lookup table DataFrame (gid, latitude, longitude) backed by the index arrays.
+    """
+    return pd.DataFrame(
+        {name: index[name] for name in ("gid", "latitude", "longitude")}, copy=False
+    )
+
+
+def _block_rows(index, lat_first, lat_last, lon_first, lon_last):
+    """
+    Row positions of all points in a block of cells (inclusive cell ranges).
+
+    Cells are numbered row-major, so each latitude row of the block is one
+    contiguous slice of ``order``.
+    """
+    n_lon = index["meta"]["n_lon"]
+    starts = index["cell_starts"]
+    slices = [
+        index["order"][starts[i * n_lon + lon_first]:starts[i * n_lon + lon_last + 1]]
+        for i in range(lat_first, lat_last + 1)
+    ]
+    return np.concatenate(slices) if slices else np.array([], dtype=np.int64)
+
+
+def _box_rows(index, lat_min, lat_max, lon_min, lon_max):
+    """
+    Sorted row positions of the points within a bounding box (edges included).
+    """
+    meta = index["meta"]
+    if lat_max < lat_min or lon_max < lon_min or meta["n_rows"] == 0:
+        return np.array([], dtype=np.int64)
+    cell_size = meta["cell_size"]
+
+    # Same cell arithmetic as build_lookup_index, so edge points fall into the covered cells
+    def cell(value, origin, n):
+        return min(max(int((value - origin) // cell_size), 0), n - 1)
+
+    rows = _block_rows(
+        index,
+        cell(lat_min, meta["lat_min"], meta["n_lat"]), cell(lat_max, meta["lat_min"], meta["n_lat"]),
+        cell(lon_min, meta["lon_min"], meta["n_lon"]), cell(lon_max, meta["lon_min"], meta["n_lon"]),
+    )
+    latitude, longitude = index["latitude"][rows], index["longitude"][rows]
+    inside = (
+        (latitude >= lat_min) & (latitude <= lat_max) &
+        (longitude >= lon_min) & (longitude <= lon_max)
+    )
+    return np.sort(rows[inside])
+
+
+def find_gids_in_box(lat_min, lat_max, lon_min, lon_max, index=None):
+    """
+    Lookup table rows within a lat/lon bounding box, using the lookup index.
+
+    Only the grid cells overlapping the box are scanned, so the cost grows
+    with the size of the result rather than the size of the lookup table.
+
+    Parameters
+    ----------
+    lat_min : float
+        Minimum latitude
+    lat_max : float
+        Maximum latitude
+    lon_min : float
+        Minimum longitude
+    lon_max : float
+        Maximum longitude
+    index : dict, optional
+        Index from open_lookup_index. If None, the default index is opened.
+
+    Returns
+    -------
+    pd.DataFrame
+        GIDs and their coordinates within the box, in lookup table order
+    """
+    if index is None:
+        index = open_lookup_index()
+    return lookup_index_dataframe(index).iloc[_box_rows(index, lat_min, lat_max, lon_min, lon_max)]
+
+
+def find_gids_in_boxes(boxes, index=None):
+    """
+    Lookup table rows within each of many bounding boxes (e.g. all counties).
+
+    Parameters
+    ----------
+    boxes : pd.DataFrame
+        One box per row, with lat_min, lat_max, lon_min and lon_max columns.
+        The index labels the boxes.
+    index : dict, optional
+        Index from open_lookup_index. If None, the default index is opened.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per (box, GID) pair: the box label in a 'box' column followed
+        by gid, latitude and longitude. A GID in several boxes appears once per box.
+    """
+    if index is None:
+        index = open_lookup_index()
+    columns = ["lat_min", "lat_max", "lon_min", "lon_max"]
+    rows = [
+        _box_rows(index, *box)
+        for box in boxes[columns].itertuples(index=False, name=None)
+    ]
+    counts = [len(r) for r in rows]
+    rows = np.concatenate(rows) if rows else np.array([], dtype=np.int64)
+
+    result = lookup_index_dataframe(index).iloc[rows].reset_index(drop=True)
+    result.insert(0, "box", np.repeat(boxes.index.to_numpy(), counts))
+    return result
+
+
+def find_nearest_gid_indexed(latitude, longitude, index=None):
+    """
+    Find the nearest GID for a given latitude/longitude using the lookup index.
+
+    Returns the same values as find_nearest_gid, but only searches the grid
+    cells around the target instead of computing distances to every point.
+
+    Parameters
+    ----------
+    latitude : float
+        Target latitude
+    longitude : float
+        Target longitude
+    index : dict, optional
+        Index from open_lookup_index. If None, the default index is opened.
+
+    Returns
+    -------
+    int
+        Nearest GID
+    float
+        Distance to nearest point (in degrees)
+    float
+        Nearest latitude
+    float
+        Nearest longitude
+    """
+    if index is None:
+        index = open_lookup_index()
+    meta = index["meta"]
+    cell_size, n_lat, n_lon = meta["cell_size"], meta["n_lat"], meta["n_lon"]
+
+    lat_min, lon_min = meta["lat_min"], meta["lon_min"]
+
+    # Targets outside the grid start from the nearest border cell
+    i = min(max(int((latitude - lat_min) // cell_size), 0), n_lat - 1)
+    j = min(max(int((longitude - lon_min) // cell_size), 0), n_lon - 1)
+
+    radius = 1
+    while True:
+        # Search the block of cells within `radius` of the target cell
+        lat_first, lat_last = max(i - radius, 0), min(i + radius, n_lat - 1)
+        lon_first, lon_last = max(j - radius, 0), min(j + radius, n_lon - 1)
+        rows = _block_rows(index, lat_first, lat_last, lon_first, lon_last)
+
+        # Lower bound on the distance to any point outside the block: the gap
+        # to each block edge that is not also an edge of the grid
+        gaps = []
+        if lat_first > 0:
+            gaps.append(latitude - (lat_min + lat_first * cell_size))
+        if lat_last < n_lat - 1:
+            gaps.append(lat_min + (lat_last + 1) * cell_size - latitude)
+        if lon_first > 0:
+            gaps.append(longitude - (lon_min + lon_first * cell_size))
+        if lon_last < n_lon - 1:
+            gaps.append(lon_min + (lon_last + 1) * cell_size - longitude)
+        outside_bound = min(gaps) if gaps else np.inf
+
+        if len(rows):
+            distances = np.sqrt((index["latitude"][rows] - latitude) ** 2
+                                + (index["longitude"][rows] - longitude) ** 2)
+            # Ties resolve to the first row of the lookup table, as in find_nearest_gid
+            candidate = np.lexsort((rows, distances))[0]
+            best_row, best_distance = int(rows[candidate]), float(distances[candidate])
+            if best_distance <= outside_bound:
+                break
+        elif not gaps:
+            raise ValueError("Lookup index is empty")
+        radius *= 2
+
+    return (
+        int(index["gid"][best_row]),
+        best_distance,
+        float(index["latitude"][best_row]),
+        float(index["longitude"][best_row]),
+    )
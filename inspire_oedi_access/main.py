@@ -1,9 +1,18 @@
 import os
-import boto3
+import json
+import time
+import shutil
 import botocore
 import argparse
-from botocore.handlers import disable_signing
+import fsspec
+import numpy as np
 import pandas as pd
+import xarray as xr
+from scipy.spatial.distance import cdist
+
+from inspire_oedi_access.merge import merge_files
+from inspire_oedi_access.profiling import profiled
+from inspire_oedi_access.s3 import get_s3_client, get_s3_filesystem
 
 def downloadAgriPVData(state, path, file_type='csv'):
     '''
@@ -21,31 +30,31 @@ def downloadAgriPVData(state, path, file_type='csv'):
     void
     
     '''
-    s3 = boto3.resource("s3")
-    s3.meta.client.meta.events.register("choose-signer.s3.*", disable_signing)
-    bucket = s3.Bucket("oedi-data-lake")
+    s3 = get_s3_client()
     
-    http://oedi-data-lake/inspire/agrivoltaics_irradiance/
+    # http://oedi-data-lake/inspire/agrivoltaics_irradiance/
     #Find each target file in buckets
-    objects = bucket.objects.filter(
-        Prefix="inspire/agrivoltaics_irradiance/" + state + file_type)
+    pages = s3.get_paginator("list_objects_v2").paginate(
+        Bucket="oedi-data-lake", Prefix="inspire/agrivoltaics_irradiance/" + state + file_type)
         # prefix =  "pvdaq/2023-solar-data-prize/" +  target_dir + "_OEDI/data/"
+    keys = (obj["Key"] for page in pages for obj in page.get("Contents", []))
 
 
-    for obj in objects:
+    for key in keys:
         try:
-            bucket.download_file(obj.key, os.path.join(path, os.path.basename(obj.key)))
+            s3.download_file("oedi-data-lake", key, os.path.join(path, os.path.basename(key)))
         except botocore.exceptions.ClientError as e:
             print ('ERROR: Boto3 exception ' + str(e))
         else:
-            print ('File ' + os.path.join(path, os.path.basename(obj.key)) + " downloaded successfully.")
+            print ('File ' + os.path.join(path, os.path.basename(key)) + " downloaded successfully.")
             
     return
 
 
 def concatenateData(state_id, path):
     '''
-    DEPRECATED Method to merge the multiple files coming in from OEDI
+    DEPRECATED Method to merge the multiple files coming in from OEDI.
+    Use merge_files for other output formats, glob filtering or deduplication.
     Parameters:
     -----------------------
     state_id : str - state id value found from query of OEDI PVDAQ queue 
@@ -57,41 +66,108 @@ def concatenateData(state_id, path):
     void
     
     '''
-    dfs = []
-    #get list of files in directory
-    file_list=os.listdir(path)
-    # column_name = 'sensor_name'
-    #Build a dataframe from current file
+    #Stream all files into the output; the output itself is excluded from the inputs
     print ("Starting data extraction")
-    for file in file_list:
-        print("Extracting file " + file)
-        df_file= pd.read_csv(path + '/' + file)
-        dfs.append(df_file)
-         
-    #Build the master data frame from the assembled individual frames.
-    print ("Concatenating all files")
-    df = pd.concat(dfs, ignore_index=True)
     target_outputfile = path + "/state_" + state_id + "_data.csv"
+    merge_files(path, target_outputfile, pattern="*", output_format="csv")
     print ("File is " + target_outputfile)
-    df.to_csv(target_outputfile, sep=",", index=False)
     return
 
 
-# S3 bucket configuration
-S3_BUCKET_PATH = "oedi-data-lake/inspire/agrivoltaics_irradiance/v1.1"
-LOOKUP_TABLE_PATH = f"s3://{S3_BUCKET_PATH}/gid-lat-lon.csv"
+# S3 bucket configuration. Setting INSPIRE_OEDI_DATA_PATH points every loader
+# at another location, e.g. a local mirror created with sync_zarr_stores.
+DATASET_ROOT = os.environ.get(
+    "INSPIRE_OEDI_DATASET_ROOT", "oedi-data-lake/inspire/agrivoltaics_irradiance"
+)
+DEFAULT_VERSION = "v1.1"
+S3_BUCKET_PATH = os.environ.get("INSPIRE_OEDI_DATA_PATH", f"{DATASET_ROOT}/{DEFAULT_VERSION}")
+ZARR_FILENAME_TEMPLATE = "preliminary_{setup_num:02d}.zarr"
+LOOKUP_TABLE_FILENAME = "gid-lat-lon.csv"
+
+# Local directory for cached catalogs, indexes and results
+CACHE_DIR = os.environ.get(
+    "INSPIRE_OEDI_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "inspire_oedi_access")
+)
+
+
+def _store_url(s3_bucket_path, filename):
+    """
+    Build the URL of a file below s3_bucket_path.
+
+    Paths with an explicit protocol (``s3://``, ``file://``, ...) and existing
+    local directories are used as-is; anything else is treated as an S3 path.
+    """
+    if "://" in s3_bucket_path or os.path.isdir(s3_bucket_path):
+        return f"{s3_bucket_path.rstrip('/')}/{filename}"
+    return f"s3://{s3_bucket_path}/{filename}"
+
+
+def _url_to_fs(url):
+    """
+    Filesystem and path for a URL built by _store_url. S3 URLs use the shared
+    process-wide filesystem so connections are reused across calls.
+    """
+    if url.startswith("s3://"):
+        fs = get_s3_filesystem()
+        return fs, fs._strip_protocol(url)
+    return fsspec.core.url_to_fs(url)
+
+
+def _get_mapper(url):
+    """
+    Key-value mapper over a zarr store URL, on the shared filesystem for S3.
+    """
+    fs, path = _url_to_fs(url)
+    return fs.get_mapper(path)
+
+
+def _get_store(url, read_ahead=None):
+    """
+    Store for opening a zarr dataset: the mapper of _get_mapper, wrapped with
+    background read-ahead of chunks for remote stores (zarr>=3).
+    """
+    mapper = _get_mapper(url)
+    if read_ahead == 0 or "file" in np.atleast_1d(mapper.fs.protocol):
+        return mapper
+    try:
+        from zarr.storage import FsspecStore
+        from inspire_oedi_access.prefetch import READ_AHEAD_CHUNKS, ReadAheadStore
+    except ImportError:
+        return mapper
+    if read_ahead is None:
+        read_ahead = READ_AHEAD_CHUNKS
+    if read_ahead == 0:
+        return mapper
+    return ReadAheadStore(FsspecStore.from_mapper(mapper, read_only=True), depth=read_ahead)
+
+
+LOOKUP_TABLE_PATH = _store_url(S3_BUCKET_PATH, LOOKUP_TABLE_FILENAME)
 
+# Retries of a setup after a transient (network or S3) error, and the delay
+# before the first retry in seconds, doubled for each further attempt
+LOAD_RETRIES = int(os.environ.get("INSPIRE_OEDI_LOAD_RETRIES", 3))
+LOAD_RETRY_BACKOFF = float(os.environ.get("INSPIRE_OEDI_LOAD_RETRY_BACKOFF", 1.0))
+CHECKPOINT_FILENAME = "checkpoint.json"
 
-def load_lookup_table():
+
+@profiled
+def load_lookup_table(lookup_table_path=LOOKUP_TABLE_PATH):
     """
     Load the GID to lat/lon lookup table from S3.
     
+    Parameters
+    ----------
+    lookup_table_path : str
+        URL or local path of gid-lat-lon.csv
+    
     Returns
     -------
     pd.DataFrame
         DataFrame with columns: gid, latitude, longitude
     """
-    df = pd.read_csv(LOOKUP_TABLE_PATH, index_col=0)
+    fs, path = _url_to_fs(lookup_table_path)
+    with fs.open(path) as f:
+        df = pd.read_csv(f, index_col=0)
     
     # Reset index to make GID a column
     df = df.reset_index(names='gid')
@@ -99,7 +175,9 @@ def load_lookup_table():
     return df
 
 
-def open_zarr_dataset(setup_num, s3_bucket_path=S3_BUCKET_PATH):
+@profiled
+def open_zarr_dataset(setup_num, s3_bucket_path=S3_BUCKET_PATH, read_ahead=None, layout=None,
+                      drop_variables=None):
     """
     Open a zarr dataset for a specific setup from S3.
     
@@ -108,26 +186,111 @@ def open_zarr_dataset(setup_num, s3_bucket_path=S3_BUCKET_PATH):
     setup_num : int
         Setup number (1-10)
     s3_bucket_path : str
-        S3 path to the zarr files directory
+        S3 path to the zarr files directory, or a local directory such as a
+        mirror created with sync_zarr_stores
+    read_ahead : int, optional
+        Number of chunks fetched in the background ahead of each chunk read
+        from a remote store (INSPIRE_OEDI_READ_AHEAD, 4 by default); 0 disables it.
+        Local stores are read without read-ahead.
+    layout : str, optional
+        Open a rechunked copy ('timeseries' or 'map', see rechunk_setup)
+        instead of the original store
+    drop_variables : list of str, optional
+        Variables not to open, e.g. ['gid'] to skip reading the GID index
+    
+    Local mirrors synced for a gid_range or time_range (see sync_zarr_store)
+    are restricted to the GIDs and timesteps of those ranges.
     
     Returns
     -------
     xr.Dataset
         Opened xarray dataset
     """
-    zarr_filename = f"preliminary_{setup_num:02d}.zarr"
-    zarr_path = f"s3://{s3_bucket_path}/{zarr_filename}"
+    if layout is None:
+        zarr_filename = ZARR_FILENAME_TEMPLATE.format(setup_num=setup_num)
+    else:
+        from inspire_oedi_access.rechunk import layout_filename
+        zarr_filename = layout_filename(setup_num, layout)
+    zarr_path = _store_url(s3_bucket_path, zarr_filename)
     
-    # Create fsspec mapper for S3 (anonymous access)
-    mapper = fsspec.get_mapper(zarr_path, anon=True)
+    # Create fsspec store (shared anonymous S3 filesystem, or local mirror)
+    store = _get_store(zarr_path, read_ahead)
     
     # Open zarr dataset
-    ds = xr.open_zarr(mapper)
+    ds = xr.open_zarr(store, drop_variables=drop_variables)
+    
+    # Mirrors synced for a GID or time range only hold the chunks of that range
+    from inspire_oedi_access.sync import _synced_positions
+    positions = _synced_positions(zarr_path)
+    if positions:
+        ds = ds.isel(positions)
     
     return ds
 
 
-def load_data_by_gid(setup_num, gids, s3_bucket_path=S3_BUCKET_PATH):
+RESAMPLE_AGGREGATIONS = ("mean", "sum", "min", "max", "std", "median")
+# Climatology groupings accepted by resample_time in place of a frequency
+CLIMATOLOGY_GROUPS = ("hour", "dayofyear", "month", "season")
+
+
+def _align_time_chunks(ds, freq):
+    """
+    Rechunk along time so that no resampling bin spans two chunks.
+
+    Consecutive bins are merged into chunks of about the original chunk size,
+    so every bin is reduced inside a single chunk while data is streamed.
+    """
+    time_chunks = ds.chunksizes.get('time')
+    if time_chunks is None:
+        return ds
+    target = max(time_chunks)
+    bin_sizes = pd.Series(1, index=ds.indexes['time']).resample(freq).count()
+    chunks = []
+    current = 0
+    for size in bin_sizes[bin_sizes > 0]:
+        if current and current + size > target:
+            chunks.append(current)
+            current = 0
+        current += int(size)
+    if current:
+        chunks.append(current)
+    return ds.chunk(time=tuple(chunks))
+
+
+@profiled
+def resample_time(ds, resample, how="mean"):
+    """
+    Aggregate a (lazy) dataset along time, chunk by chunk.
+
+    Parameters
+    ----------
+    ds : xr.Dataset
+        Dataset with a 'time' dimension
+    resample : str
+        pandas frequency (e.g. '1D', 'MS') for xarray's resample, or one of
+        'hour', 'dayofyear', 'month', 'season' for a climatology grouped by
+        that component of time
+    how : str
+        Aggregation: 'mean', 'sum', 'min', 'max', 'std' or 'median'
+    
+    Returns
+    -------
+    xr.Dataset
+        Aggregated dataset, still lazy. Frequency resampling matches resampling
+        the full-resolution data exactly; climatologies reduce across chunks
+        and match up to floating-point rounding.
+    """
+    if how not in RESAMPLE_AGGREGATIONS:
+        raise ValueError(f"how must be one of {RESAMPLE_AGGREGATIONS}, not {how!r}")
+    if resample in CLIMATOLOGY_GROUPS:
+        return getattr(ds.groupby(f'time.{resample}'), how)()
+    ds = _align_time_chunks(ds, resample)
+    return getattr(ds.resample(time=resample), how)()
+
+
+@profiled
+def load_data_by_gid(setup_num, gids, s3_bucket_path=S3_BUCKET_PATH, catalog=None,
+                     resample=None, resample_how="mean", layout=None, time_range=None):
     """
     Load data for specific GIDs from a setup.
     
@@ -139,6 +302,21 @@ def load_data_by_gid(setup_num, gids, s3_bucket_path=S3_BUCKET_PATH):
         List of GIDs to load
     s3_bucket_path : str
         S3 path to the zarr files directory
+    catalog : dict, optional
+        Dataset catalog from load_catalog. If given, GIDs are resolved from the
+        catalog instead of the store's gid coordinate, which is then never
+        read, and the store is not opened at all when none of the GIDs are in it.
+    resample : str, optional
+        Aggregate along time while reading, see resample_time
+    resample_how : str
+        Aggregation used with resample (default 'mean')
+    layout : str, optional
+        Chunk layout to read: 'timeseries' or 'map' for a rechunked copy (see
+        rechunk_setup), or 'auto' for whichever available layout reads the
+        least data for these GIDs and time_range. If None, the original store is read.
+    time_range : tuple, optional
+        Inclusive (start, end) time window; either bound may be None.
+        Applied before resampling.
     
     Returns
     -------
@@ -147,32 +325,164 @@ def load_data_by_gid(setup_num, gids, s3_bucket_path=S3_BUCKET_PATH):
     list
         List of matching GIDs found in the dataset
     """
-    # Open the zarr dataset
-    ds = open_zarr_dataset(setup_num, s3_bucket_path)
-    
-    # Get all GIDs in the dataset
-    dataset_gids = ds['gid'].values
-    
-    # Find which requested GIDs are in this dataset
-    gid_mask = np.isin(dataset_gids, gids)
-    matching_gids = dataset_gids[gid_mask].tolist()
-    
-    if len(matching_gids) == 0:
-        return None, []
+    # GIDs resolved before opening the store: from the catalog, or from the
+    # layout index with layout='auto'. Its gid coordinate is then never read.
+    gid_index = None
+    if catalog is not None:
+        from inspire_oedi_access.catalog import find_version, get_store_metadata, plan_gid_query
+        version = find_version(s3_bucket_path, catalog)
+        if version is not None:
+            plan = plan_gid_query(setup_num, gids, version=version, catalog=catalog)
+            if len(plan['matching_gids']) == 0:
+                return None, []
+            store_metadata = get_store_metadata(setup_num, version, catalog)
+            gid_index = {
+                'matching_gids': plan['matching_gids'],
+                'gid_indices': plan['gid_indices'],
+                'n_gid': store_metadata['n_gid'],
+                'dtype': store_metadata['variables'].get('gid', {}).get('dtype', 'int64'),
+                'source': 'catalog',
+            }
+    
+    if layout == "auto":
+        from inspire_oedi_access.rechunk import _layout_index, choose_layout
+        index = _layout_index(setup_num, s3_bucket_path)
+        if gid_index is None:
+            gid_mask = np.isin(index['gid'], gids)
+            if not gid_mask.any():
+                return None, []
+            gid_index = {
+                'matching_gids': index['gid'][gid_mask].tolist(),
+                'gid_indices': np.where(gid_mask)[0],
+                'n_gid': len(index['gid']),
+                'dtype': index['gid'].dtype,
+                'source': 'layout index',
+            }
+        time_indices = None
+        if time_range is not None:
+            time_indices = np.arange(len(index['time']))[index['time'].slice_indexer(*time_range)]
+        # Rechunked copies keep the GID order, so the indices carry over
+        layout = choose_layout(setup_num, gid_index['gid_indices'], s3_bucket_path, time_indices)
     
-    # Get indices of matching GIDs
-    gid_indices = np.where(gid_mask)[0]
+    # Open the zarr dataset
+    ds = open_zarr_dataset(setup_num, s3_bucket_path, layout=layout,
+                           drop_variables=None if gid_index is None else ['gid'])
+    
+    if gid_index is not None:
+        if ds.sizes['gid'] != gid_index['n_gid']:
+            raise ValueError(
+                f"The {gid_index['source']} lists {gid_index['n_gid']} GIDs for setup {setup_num} "
+                f"but the store has {ds.sizes['gid']}; "
+                + ("rebuild it with load_catalog(refresh=True)" if gid_index['source'] == 'catalog'
+                   else "the store changed while in use")
+            )
+        matching_gids = gid_index['matching_gids']
+        gid_indices = gid_index['gid_indices']
+    else:
+        # Get all GIDs in the dataset
+        dataset_gids = ds['gid'].values
+        
+        # Find which requested GIDs are in this dataset
+        gid_mask = np.isin(dataset_gids, gids)
+        matching_gids = dataset_gids[gid_mask].tolist()
+        
+        if len(matching_gids) == 0:
+            return None, []
+        
+        # Get indices of matching GIDs
+        gid_indices = np.where(gid_mask)[0]
     
     # Select data for matching GIDs
     selected_data = ds.isel(gid=gid_indices)
+    if gid_index is not None:
+        selected_data = selected_data.assign_coords(
+            gid=np.asarray(matching_gids, dtype=gid_index['dtype'])
+        )
+    
+    if time_range is not None:
+        selected_data = selected_data.sel(time=slice(*time_range))
+    
+    if resample is not None:
+        selected_data = resample_time(selected_data, resample, resample_how)
     
     return selected_data, matching_gids
 
 
-def load_data_by_gid_multiple_setups(setup_nums, gids, s3_bucket_path=S3_BUCKET_PATH):
+def _is_transient(error):
+    """
+    Whether an error is worth retrying: network and S3 service failures, not
+    missing files, permissions or bad arguments.
+    """
+    if isinstance(error, (FileNotFoundError, PermissionError, IsADirectoryError,
+                          NotADirectoryError)):
+        return False
+    return isinstance(error, (OSError, botocore.exceptions.BotoCoreError))
+
+
+def _retry(func, retries, backoff, description):
+    """
+    Call func, retrying transient errors with exponential backoff.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except Exception as e:
+            if attempt == retries or not _is_transient(e):
+                raise
+            delay = backoff * 2 ** attempt
+            print(f"{description} failed ({e}), retrying in {delay:.1f} s")
+            time.sleep(delay)
+
+
+def _open_checkpoint(checkpoint_dir, query):
+    """
+    Load the checkpoint of an interrupted run of the same query, or start a new one.
+    """
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    checkpoint_file = os.path.join(checkpoint_dir, CHECKPOINT_FILENAME)
+    if not os.path.exists(checkpoint_file):
+        return {"query": query, "completed": {}}
+    with open(checkpoint_file) as f:
+        checkpoint = json.load(f)
+    if checkpoint["query"] != query:
+        raise ValueError(f"{checkpoint_dir} holds a checkpoint of a different query")
+    return checkpoint
+
+
+def _save_checkpoint(checkpoint_dir, checkpoint):
+    checkpoint_file = os.path.join(checkpoint_dir, CHECKPOINT_FILENAME)
+    with open(checkpoint_file + ".tmp", "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(checkpoint_file + ".tmp", checkpoint_file)
+
+
+def _write_setup_checkpoint(data, path):
+    """
+    Materialize a setup's data into a local zarr store, atomically.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    for var in data.variables.values():
+        var.encoding = {}
+    data.to_zarr(tmp_path, mode="w", consolidated=True, zarr_format=2)
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(tmp_path, path)
+    return xr.open_zarr(path)
+
+
+@profiled
+def load_data_by_gid_multiple_setups(setup_nums, gids, s3_bucket_path=S3_BUCKET_PATH, catalog=None,
+                                     resample=None, resample_how="mean", retries=LOAD_RETRIES,
+                                     retry_backoff=LOAD_RETRY_BACKOFF, errors=None,
+                                     checkpoint_dir=None, layout=None, time_range=None):
     """
     Load data for specific GIDs from multiple setups and combine them.
     
+    Each setup is retried on transient network or S3 errors. Data is loaded
+    lazily, so only opening the setups is retried unless checkpoint_dir is
+    given: then each setup is read eagerly (with retries) into a local zarr
+    store, and a re-run of the same query skips the setups already completed.
+    
     Parameters
     ----------
     setup_nums : list of int
@@ -181,6 +491,27 @@ def load_data_by_gid_multiple_setups(setup_nums, gids, s3_bucket_path=S3_BUCKET_
         List of GIDs to load
     s3_bucket_path : str
         S3 path to the zarr files directory
+    catalog : dict, optional
+        Dataset catalog from load_catalog. If given, GIDs are resolved from the
+        catalog instead of the store's gid coordinate.
+    resample : str, optional
+        Aggregate along time while reading, see resample_time
+    resample_how : str
+        Aggregation used with resample (default 'mean')
+    retries : int
+        Retries per setup after a transient error
+    retry_backoff : float
+        Delay before the first retry in seconds, doubled for each further retry
+    errors : dict, optional
+        If given, setups that still fail after their retries are left out of
+        the result instead of raising, and their errors are added to this dict
+        (setup number to error message).
+    checkpoint_dir : str, optional
+        Directory for the per-setup checkpoints of this query
+    layout : str, optional
+        Chunk layout to read, see load_data_by_gid
+    time_range : tuple, optional
+        Inclusive (start, end) time window; either bound may be None.
     
     Returns
     -------
@@ -189,11 +520,51 @@ def load_data_by_gid_multiple_setups(setup_nums, gids, s3_bucket_path=S3_BUCKET_
     dict
         Dictionary mapping setup numbers to lists of matching GIDs found in each dataset
     """
+    checkpoint = None
+    if checkpoint_dir is not None:
+        query = {
+            "setups": [int(s) for s in setup_nums],
+            "gids": np.unique(np.asarray(gids, dtype=np.int64)).tolist(),
+            "dataset": s3_bucket_path,
+            "resample": resample,
+            "resample_how": resample_how,
+        }
+        if time_range is not None:
+            query["time_range"] = [None if t is None else pd.Timestamp(t).isoformat() for t in time_range]
+        checkpoint = _open_checkpoint(checkpoint_dir, query)
+
+    def load_setup(setup_num):
+        data, matching_gids = load_data_by_gid(setup_num, gids, s3_bucket_path, catalog=catalog,
+                                               resample=resample, resample_how=resample_how,
+                                               layout=layout, time_range=time_range)
+        if checkpoint is not None:
+            path = os.path.join(checkpoint_dir, f"setup_{setup_num:02d}.zarr")
+            if data is not None:
+                data = _write_setup_checkpoint(data, path)
+            checkpoint["completed"][str(setup_num)] = [int(g) for g in matching_gids]
+            _save_checkpoint(checkpoint_dir, checkpoint)
+        return data, matching_gids
+
     datasets = []
     matching_gids_dict = {}
     
     for setup_num in setup_nums:
-        data, matching_gids = load_data_by_gid(setup_num, gids, s3_bucket_path)
+        if checkpoint is not None and str(setup_num) in checkpoint["completed"]:
+            matching_gids = checkpoint["completed"][str(setup_num)]
+            data = None
+            if matching_gids:
+                data = xr.open_zarr(os.path.join(checkpoint_dir, f"setup_{setup_num:02d}.zarr"))
+        else:
+            try:
+                data, matching_gids = _retry(
+                    lambda: load_setup(setup_num), retries, retry_backoff, f"Setup {setup_num}"
+                )
+            except Exception as e:
+                if errors is None:
+                    raise
+                errors[setup_num] = f"{type(e).__name__}: {e}"
+                print(f"Setup {setup_num} failed, leaving it out: {e}")
+                continue
         if data is not None:
             # Add setup dimension
             data = data.expand_dims('setup')
@@ -210,6 +581,7 @@ def load_data_by_gid_multiple_setups(setup_nums, gids, s3_bucket_path=S3_BUCKET_
     return combined_data, matching_gids_dict
 
 
+@profiled
 def find_nearest_gid(latitude, longitude, lookup_df=None):
     """
     Find the nearest GID for a given latitude/longitude using nearest neighbor search.
@@ -260,8 +632,9 @@ def find_nearest_gid(latitude, longitude, lookup_df=None):
     return nearest_gid, nearest_distance, nearest_lat, nearest_lon
 
 
+@profiled
 def load_data_by_lat_lon(latitude, longitude, setup_num, s3_bucket_path=S3_BUCKET_PATH, 
-                         lookup_df=None):
+                         lookup_df=None, catalog=None, resample=None, resample_how="mean"):
     """
     Load data for a specific lat/lon by finding the nearest GID.
     
@@ -277,6 +650,13 @@ def load_data_by_lat_lon(latitude, longitude, setup_num, s3_bucket_path=S3_BUCKE
         S3 path to the zarr files directory
     lookup_df : pd.DataFrame, optional
         Lookup table DataFrame. If None, will load from S3.
+    catalog : dict, optional
+        Dataset catalog from load_catalog. If given, GIDs are resolved from the
+        catalog instead of the store's gid coordinate.
+    resample : str, optional
+        Aggregate along time while reading, see resample_time
+    resample_how : str
+        Aggregation used with resample (default 'mean')
     
     Returns
     -------
@@ -297,13 +677,17 @@ def load_data_by_lat_lon(latitude, longitude, setup_num, s3_bucket_path=S3_BUCKE
     )
     
     # Load data for that GID
-    data, matching_gids = load_data_by_gid(setup_num, [nearest_gid], s3_bucket_path)
+    data, matching_gids = load_data_by_gid(setup_num, [nearest_gid], s3_bucket_path,
+                                           catalog=catalog, resample=resample,
+                                           resample_how=resample_how)
     
     return data, nearest_gid, distance, nearest_lat, nearest_lon
 
 
+@profiled
 def load_data_by_lat_lon_multiple_setups(latitude, longitude, setup_nums, 
-                                         s3_bucket_path=S3_BUCKET_PATH, lookup_df=None):
+                                         s3_bucket_path=S3_BUCKET_PATH, lookup_df=None,
+                                         catalog=None, resample=None, resample_how="mean"):
     """
     Load data for a specific lat/lon by finding the nearest GID, from multiple setups.
     
@@ -319,6 +703,13 @@ def load_data_by_lat_lon_multiple_setups(latitude, longitude, setup_nums,
         S3 path to the zarr files directory
     lookup_df : pd.DataFrame, optional
         Lookup table DataFrame. If None, will load from S3.
+    catalog : dict, optional
+        Dataset catalog from load_catalog. If given, GIDs are resolved from the
+        catalog instead of the store's gid coordinate.
+    resample : str, optional
+        Aggregate along time while reading, see resample_time
+    resample_how : str
+        Aggregation used with resample (default 'mean')
     
     Returns
     -------
@@ -340,14 +731,36 @@ def load_data_by_lat_lon_multiple_setups(latitude, longitude, setup_nums,
     
     # Load data for that GID from multiple setups
     data, matching_gids_dict = load_data_by_gid_multiple_setups(
-        setup_nums, [nearest_gid], s3_bucket_path
+        setup_nums, [nearest_gid], s3_bucket_path, catalog=catalog, resample=resample,
+        resample_how=resample_how
     )
     
     return data, nearest_gid, distance, nearest_lat, nearest_lon
 
 
+def _gids_in_box(lookup_df, lat_min, lat_max, lon_min, lon_max):
+    """
+    Rows of the lookup table within a bounding box (edges included). Without a
+    lookup_df the persisted lookup index is queried, which only scans the grid
+    cells overlapping the box instead of the whole table.
+    """
+    if lookup_df is None:
+        from inspire_oedi_access.lookup_index import find_gids_in_box
+        return find_gids_in_box(lat_min, lat_max, lon_min, lon_max)
+
+    mask = (
+        (lookup_df['latitude'] >= lat_min) & 
+        (lookup_df['latitude'] <= lat_max) &
+        (lookup_df['longitude'] >= lon_min) & 
+        (lookup_df['longitude'] <= lon_max)
+    )
+    return lookup_df[mask]
+
+
+@profiled
 def load_data_by_lat_lon_range(lat_min, lat_max, lon_min, lon_max, setup_num, 
-                                s3_bucket_path=S3_BUCKET_PATH, lookup_df=None):
+                                s3_bucket_path=S3_BUCKET_PATH, lookup_df=None, catalog=None,
+                                resample=None, resample_how="mean"):
     """
     Load data for all GIDs within a lat/lon bounding box.
     
@@ -366,7 +779,15 @@ def load_data_by_lat_lon_range(lat_min, lat_max, lon_min, lon_max, setup_num,
     s3_bucket_path : str
         S3 path to the zarr files directory
     lookup_df : pd.DataFrame, optional
-        Lookup table DataFrame. If None, will load from S3.
+        Lookup table DataFrame. If None, the box is looked up in the persisted
+        lookup index (see open_lookup_index).
+    catalog : dict, optional
+        Dataset catalog from load_catalog. If given, GIDs are resolved from the
+        catalog instead of the store's gid coordinate.
+    resample : str, optional
+        Aggregate along time while reading, see resample_time
+    resample_how : str
+        Aggregation used with resample (default 'mean')
     
     Returns
     -------
@@ -377,19 +798,8 @@ def load_data_by_lat_lon_range(lat_min, lat_max, lon_min, lon_max, setup_num,
     list
         List of matching GIDs found in the dataset
     """
-    # Load lookup table if not provided
-    if lookup_df is None:
-        lookup_df = load_lookup_table()
-    
     # Find GIDs within the bounding box
-    mask = (
-        (lookup_df['latitude'] >= lat_min) & 
-        (lookup_df['latitude'] <= lat_max) &
-        (lookup_df['longitude'] >= lon_min) & 
-        (lookup_df['longitude'] <= lon_max)
-    )
-    
-    gids_in_range = lookup_df[mask]
+    gids_in_range = _gids_in_box(lookup_df, lat_min, lat_max, lon_min, lon_max)
     
     if len(gids_in_range) == 0:
         return None, None, []
@@ -398,13 +808,16 @@ def load_data_by_lat_lon_range(lat_min, lat_max, lon_min, lon_max, setup_num,
     gid_list = gids_in_range['gid'].tolist()
     
     # Load data for these GIDs
-    data, matching_gids = load_data_by_gid(setup_num, gid_list, s3_bucket_path)
+    data, matching_gids = load_data_by_gid(setup_num, gid_list, s3_bucket_path, catalog=catalog,
+                                           resample=resample, resample_how=resample_how)
     
     return data, gids_in_range, matching_gids
 
 
+@profiled
 def load_data_by_lat_lon_range_multiple_setups(lat_min, lat_max, lon_min, lon_max, setup_nums,
-                                               s3_bucket_path=S3_BUCKET_PATH, lookup_df=None):
+                                               s3_bucket_path=S3_BUCKET_PATH, lookup_df=None,
+                                               catalog=None, resample=None, resample_how="mean"):
     """
     Load data for all GIDs within a lat/lon bounding box from multiple setups.
     
@@ -423,7 +836,15 @@ def load_data_by_lat_lon_range_multiple_setups(lat_min, lat_max, lon_min, lon_ma
     s3_bucket_path : str
         S3 path to the zarr files directory
     lookup_df : pd.DataFrame, optional
-        Lookup table DataFrame. If None, will load from S3.
+        Lookup table DataFrame. If None, the box is looked up in the persisted
+        lookup index (see open_lookup_index).
+    catalog : dict, optional
+        Dataset catalog from load_catalog. If given, GIDs are resolved from the
+        catalog instead of the store's gid coordinate.
+    resample : str, optional
+        Aggregate along time while reading, see resample_time
+    resample_how : str
+        Aggregation used with resample (default 'mean')
     
     Returns
     -------
@@ -434,19 +855,8 @@ def load_data_by_lat_lon_range_multiple_setups(lat_min, lat_max, lon_min, lon_ma
     dict
         Dictionary mapping setup numbers to lists of matching GIDs found in each dataset
     """
-    # Load lookup table if not provided
-    if lookup_df is None:
-        lookup_df = load_lookup_table()
-    
     # Find GIDs within the bounding box
-    mask = (
-        (lookup_df['latitude'] >= lat_min) & 
-        (lookup_df['latitude'] <= lat_max) &
-        (lookup_df['longitude'] >= lon_min) & 
-        (lookup_df['longitude'] <= lon_max)
-    )
-    
-    gids_in_range = lookup_df[mask]
+    gids_in_range = _gids_in_box(lookup_df, lat_min, lat_max, lon_min, lon_max)
     
     if len(gids_in_range) == 0:
         return None, None, {}
@@ -456,7 +866,8 @@ def load_data_by_lat_lon_range_multiple_setups(lat_min, lat_max, lon_min, lon_ma
     
     # Load data for these GIDs from multiple setups
     data, matching_gids_dict = load_data_by_gid_multiple_setups(
-        setup_nums, gid_list, s3_bucket_path
+        setup_nums, gid_list, s3_bucket_path, catalog=catalog, resample=resample,
+        resample_how=resample_how
     )
     
     return data, gids_in_range, matching_gids_dict
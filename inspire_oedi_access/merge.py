@@ -0,0 +1,247 @@
+import io
+import os
+import csv
+import glob
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+
+MERGE_FORMATS = ("csv", "parquet", "feather")
+# Keys of the two 64-bit row hashes combined for dedupe (16 bytes each)
+_HASH_KEYS = ("0123456789123456", "inspire-oedi-row")
+
+
+def _output_format(output_file, output_format):
+    if output_format is None:
+        extension = os.path.splitext(output_file)[1].lstrip(".").lower()
+        output_format = {"pq": "parquet", "arrow": "feather"}.get(extension, extension)
+    if output_format not in MERGE_FORMATS:
+        raise ValueError(f"output_format must be one of {MERGE_FORMATS}, not {output_format!r}")
+    return output_format
+
+
+def _iter_batches(file, schema=None, use_threads=True, block_size=None):
+    """
+    Stream record batches from a CSV, Parquet or Feather file.
+
+    CSV files are parsed with pyarrow's (multi-threaded) streaming reader; if a
+    schema is given, columns are parsed directly to its types.
+    """
+    if file.endswith((".parquet", ".pq")):
+        yield from pq.ParquetFile(file).iter_batches()
+    elif file.endswith((".feather", ".arrow")):
+        with pa.memory_map(file) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i)
+    else:
+        read_options = pa_csv.ReadOptions(use_threads=use_threads)
+        if block_size is not None:
+            read_options.block_size = block_size
+        convert_options = pa_csv.ConvertOptions(
+            column_types=None if schema is None else dict(zip(schema.names, schema.types)),
+            strings_can_be_null=True,
+        )
+        yield from pa_csv.open_csv(file, read_options=read_options, convert_options=convert_options)
+
+
+# Next type tried for a CSV column whose values do not all parse to its current type
+_CSV_PROMOTIONS = {pa.null(): pa.int64(), pa.int64(): pa.float64()}
+
+
+def _csv_schema(file, use_threads=True, block_size=None):
+    """
+    Schema of a CSV file, inferred from all of its rows.
+
+    pyarrow's streaming reader fixes column types from the first block, so
+    the file is scanned as text, and each column keeps the narrowest of
+    int64, float64 and string (or the type inferred from the first block)
+    that every value parses to.
+    """
+    with pa_csv.open_csv(file, read_options=pa_csv.ReadOptions(use_threads=use_threads)) as reader:
+        types = dict(zip(reader.schema.names, reader.schema.types))
+    text_schema = pa.schema([(name, pa.string()) for name in types])
+
+    for batch in _iter_batches(file, text_schema, use_threads, block_size):
+        for name, column in zip(batch.schema.names, batch.columns):
+            while types[name] != pa.string() and column.null_count < len(column):
+                try:
+                    column.cast(types[name])
+                    break
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                    types[name] = _CSV_PROMOTIONS.get(types[name], pa.string())
+    return pa.schema(list(types.items()))
+
+
+def _peek_schema(file, use_threads=True, block_size=None):
+    """
+    Schema of a file, inferred from all of its rows for CSV files.
+    """
+    if file.endswith((".parquet", ".pq")):
+        return pq.read_schema(file)
+    if file.endswith((".feather", ".arrow")):
+        with pa.memory_map(file) as source:
+            return pa.ipc.open_file(source).schema
+    return _csv_schema(file, use_threads, block_size)
+
+
+def _unify_schemas(schemas):
+    """
+    Union of the columns of several schemas, in order of first appearance.
+
+    Column types are promoted like pd.concat does: ints and floats to floats,
+    nulls to any type, and incompatible types to strings.
+    """
+    types = {}
+    for schema in schemas:
+        for field in schema:
+            types.setdefault(field.name, []).append(field.type)
+    fields = []
+    for name, column_types in types.items():
+        try:
+            fields.append(pa.unify_schemas(
+                [pa.schema([(name, t)]) for t in column_types], promote_options="permissive"
+            ).field(name))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            fields.append(pa.field(name, pa.string()))
+    return pa.schema(fields)
+
+
+def _conform(batch, schema):
+    """
+    Cast a batch to the output schema, with null columns for the ones it lacks.
+    """
+    if batch.schema.equals(schema):
+        return pa.Table.from_batches([batch])
+    columns = [
+        batch.column(name).cast(field.type) if name in batch.schema.names
+        else pa.nulls(batch.num_rows, field.type)
+        for name, field in zip(schema.names, schema)
+    ]
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+class _CSVFileWriter:
+    """
+    pyarrow CSV writer with a header quoted like pandas' to_csv (only where needed).
+    """
+
+    def __init__(self, output_file, schema):
+        header = io.StringIO()
+        csv.writer(header, lineterminator="\n").writerow(schema.names)
+        self._sink = open(output_file, "wb")
+        self._sink.write(header.getvalue().encode())
+        self._writer = pa_csv.CSVWriter(
+            self._sink, schema, write_options=pa_csv.WriteOptions(include_header=False)
+        )
+
+    def write_table(self, table):
+        self._writer.write_table(table)
+
+    def close(self):
+        self._writer.close()
+        self._sink.close()
+
+
+def _open_writer(output_file, output_format, schema):
+    if output_format == "parquet":
+        return pq.ParquetWriter(output_file, schema)
+    if output_format == "feather":
+        return pa.ipc.new_file(output_file, schema)
+    return _CSVFileWriter(output_file, schema)
+
+
+def _row_hashes(df):
+    """
+    128-bit hash of every row, from two independently keyed 64-bit hashes.
+    """
+    high, low = (
+        pd.util.hash_pandas_object(df, index=False, hash_key=key).to_numpy().tolist()
+        for key in _HASH_KEYS
+    )
+    return np.array([h << 64 | l for h, l in zip(high, low)], dtype=object)
+
+
+def merge_files(path, output_file, pattern="*.csv", output_format=None, dedupe=False,
+                dedupe_subset=None, use_threads=True, block_size=None):
+    """
+    Merge many data files into a single output file in (near) constant memory.
+
+    Files are streamed batch by batch into the output, so memory use does not
+    grow with the number or size of the inputs. The output file itself is never
+    read back as an input, so merging can be re-run in place.
+
+    Parameters
+    ----------
+    path : str
+        Directory containing the files to merge
+    output_file : str
+        Path of the merged output file
+    pattern : str
+        Glob pattern selecting the files within path. Files ending in .parquet
+        or .feather are read in their format, everything else as CSV.
+    output_format : str, optional
+        'csv', 'parquet' or 'feather'. If None, inferred from output_file's extension.
+    dedupe : bool
+        Drop duplicate rows. A 128-bit hash of every unique row is kept in a
+        set, so memory grows with the number of unique rows (about 80 bytes
+        each). Rows are compared by hash only: two distinct rows with the same
+        hash would be taken as duplicates, which is possible but vanishingly
+        unlikely (below 1e-18 for ten billion rows).
+    dedupe_subset : list of str, optional
+        Columns identifying duplicates. If None, all columns are used.
+    use_threads : bool
+        Parse CSV files with multiple threads
+    block_size : int, optional
+        Bytes per CSV parsing block (pyarrow default if None)
+
+    Returns
+    -------
+    int
+        Number of rows written
+    """
+    output_format = _output_format(output_file, output_format)
+    output_abspath = os.path.abspath(output_file)
+    files = sorted(
+        f for f in glob.glob(os.path.join(path, pattern))
+        if os.path.isfile(f) and os.path.abspath(f) != output_abspath
+    )
+    if len(files) == 0:
+        raise FileNotFoundError(f"No files matching {pattern!r} in {path}")
+
+    # Each file is read with its own column types, then cast to the common output schema
+    file_schemas = [_peek_schema(f, use_threads, block_size) for f in files]
+    schema = _unify_schemas(file_schemas)
+
+    tmp_file = output_file + ".tmp"
+    writer = _open_writer(tmp_file, output_format, schema)
+    seen = set()
+    rows = 0
+    try:
+        for file, file_schema in zip(files, file_schemas):
+            print("Extracting file " + file)
+            for batch in _iter_batches(file, file_schema, use_threads, block_size):
+                table = _conform(batch, schema)
+                if dedupe:
+                    df = table.select(dedupe_subset or schema.names).to_pandas()
+                    hashes = _row_hashes(df)
+                    # Drop repeats within the batch and rows seen in earlier batches
+                    keep = np.zeros(len(hashes), dtype=bool)
+                    keep[np.unique(hashes, return_index=True)[1]] = True
+                    keep &= np.fromiter((h not in seen for h in hashes), bool, len(hashes))
+                    seen.update(hashes[keep].tolist())
+                    table = table.filter(pa.array(keep))
+                writer.write_table(table)
+                rows += table.num_rows
+    except BaseException:
+        writer.close()
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+    writer.close()
+
+    os.replace(tmp_file, output_file)
+    return rows
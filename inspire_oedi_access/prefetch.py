@@ -0,0 +1,157 @@
+import os
+import json
+import asyncio
+from collections import OrderedDict
+
+from zarr.storage import WrapperStore
+
+
+# Number of chunks fetched ahead of each chunk read from a remote store; 0 disables read-ahead
+READ_AHEAD_CHUNKS = int(os.environ.get("INSPIRE_OEDI_READ_AHEAD", 4))
+
+_METADATA_SUFFIXES = (".zarray", ".zattrs", ".zgroup", ".zmetadata")
+
+
+def _array_info(zarray):
+    shape, chunks = zarray["shape"], zarray["chunks"]
+    return {
+        "grid": tuple(-(-size // chunk) for size, chunk in zip(shape, chunks)),
+        "separator": zarray.get("dimension_separator") or ".",
+    }
+
+
+def _log_failure(task):
+    # Read-ahead failures are not fatal; the chunk is fetched again when it is requested
+    if not task.cancelled():
+        task.exception()
+
+
+class ReadAheadStore(WrapperStore):
+    """
+    Zarr store that fetches the chunks following each requested chunk in the background.
+
+    Once two consecutive reads of an array are neighbouring chunks (a unit
+    step along one axis, forwards or backwards, as dask may schedule either
+    way), each further read requests the next ``depth`` chunks in that
+    direction concurrently, so network latency overlaps with decompression
+    and compute of the current chunk. Reads that do not follow a sequential
+    scan fetch nothing extra. Array layouts are taken from the (consolidated)
+    metadata as it is read through the store.
+
+    Parameters
+    ----------
+    store : zarr.abc.store.Store
+        Store to wrap, e.g. an FsspecStore over S3
+    depth : int
+        Number of chunks to fetch ahead
+    max_buffered : int, optional
+        Maximum number of chunks fetched ahead and not yet read; the oldest
+        are dropped first. Defaults to 8 * depth.
+    """
+
+    def __init__(self, store, depth=READ_AHEAD_CHUNKS, max_buffered=None):
+        super().__init__(store)
+        self.depth = depth
+        self.max_buffered = max_buffered or 8 * depth
+        self._prefetched = OrderedDict()
+        # Recently read chunks, which are not fetched ahead again
+        self._recent = OrderedDict()
+        self._arrays = {}
+        self._last_read = {}
+
+    def _with_store(self, store):
+        return type(self)(store, self.depth, self.max_buffered)
+
+    def __repr__(self):
+        return f"ReadAheadStore({self._store!r}, depth={self.depth})"
+
+    def _register_metadata(self, key, buffer):
+        if buffer is None:
+            return
+        document = json.loads(buffer.to_bytes())
+        if key.endswith(".zmetadata"):
+            prefix = key[:-len(".zmetadata")]
+            metadata = document.get("metadata", {})
+            for name, zarray in metadata.items():
+                if name.endswith("/.zarray"):
+                    self._arrays[prefix + name[:-len("/.zarray")]] = _array_info(zarray)
+        elif key.endswith("/.zarray"):
+            self._arrays.setdefault(key[:-len("/.zarray")], _array_info(document))
+
+    def _parse_chunk_key(self, key):
+        array, _, chunk = key.rpartition("/")
+        while array:
+            info = self._arrays.get(array)
+            if info is not None:
+                try:
+                    index = tuple(int(i) for i in chunk.split(info["separator"]))
+                except ValueError:
+                    return None
+                return (array, index) if len(index) == len(info["grid"]) else None
+            # Nested ('/'-separated) chunk keys: move one level up
+            array, _, head = array.rpartition("/")
+            chunk = f"{head}/{chunk}"
+        return None
+
+    def _scan_direction(self, array, index):
+        """
+        Axis and sign (+1/-1) of the scan, if the previous read of the array
+        was its neighbouring chunk; None otherwise.
+        """
+        last = self._last_read.get(array)
+        self._last_read[array] = index
+        if last is None:
+            return None
+        steps = [axis for axis, (i, j) in enumerate(zip(last, index)) if i != j]
+        if len(steps) == 1 and abs(index[steps[0]] - last[steps[0]]) == 1:
+            return steps[0], index[steps[0]] - last[steps[0]]
+        return None
+
+    def _read_ahead(self, key, prototype):
+        parsed = self._parse_chunk_key(key)
+        if parsed is None:
+            return
+        array, index = parsed
+        info = self._arrays[array]
+        direction = self._scan_direction(array, index)
+        if direction is None:
+            return
+        axis, sign = direction
+
+        for step in range(1, self.depth + 1):
+            position = index[axis] + sign * step
+            if not 0 <= position < info["grid"][axis]:
+                break
+            next_index = index[:axis] + (position,) + index[axis + 1:]
+            next_key = f"{array}/" + info["separator"].join(str(i) for i in next_index)
+            if next_key in self._prefetched or next_key in self._recent:
+                continue
+            task = asyncio.ensure_future(self._store.get(next_key, prototype))
+            task.add_done_callback(_log_failure)
+            self._prefetched[next_key] = task
+
+        while len(self._prefetched) > self.max_buffered:
+            _, task = self._prefetched.popitem(last=False)
+            task.cancel()
+
+    async def get(self, key, prototype, byte_range=None):
+        if key.endswith(_METADATA_SUFFIXES):
+            result = await self._store.get(key, prototype, byte_range)
+            self._register_metadata(key, result)
+            return result
+
+        task = None
+        if byte_range is None:
+            task = self._prefetched.pop(key, None)
+            if self.depth > 0:
+                # Start the read-ahead before waiting for this chunk, so both are in flight
+                self._recent[key] = None
+                if len(self._recent) > self.max_buffered:
+                    self._recent.popitem(last=False)
+                self._read_ahead(key, prototype)
+        if task is not None:
+            try:
+                return await task
+            except Exception:
+                pass
+        return await self._store.get(key, prototype, byte_range)
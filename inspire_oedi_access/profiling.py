@@ -0,0 +1,260 @@
+import os
+import json
+import time
+import pstats
+import cProfile
+import threading
+import functools
+import itertools
+import contextvars
+import tracemalloc
+from contextlib import contextmanager
+
+
+# Set to a directory to profile every top-level loader call and write its trace
+# there. Loaders return lazy datasets, so these traces cover opening and planning
+# a query, not the chunk reads of a later .load() or .compute().
+PROFILE_ENV_VAR = "INSPIRE_OEDI_PROFILE"
+PROFILE_TOP_FUNCTIONS = 40
+PROFILE_TOP_ALLOCATIONS = 25
+
+# Trace of the profiling session in progress in this thread (or task), if any,
+# and the nesting depth of the profiled call being run
+_ACTIVE = contextvars.ContextVar("inspire_oedi_trace", default=None)
+_DEPTH = contextvars.ContextVar("inspire_oedi_trace_depth", default=0)
+# Process-wide hooks shared by concurrent sessions: the s3fs request method
+# replaced while any session is active, and whether tracemalloc was started here
+_lock = threading.Lock()
+_sessions = 0
+_call_s3 = None
+_started_tracemalloc = False
+_session_numbers = itertools.count(1)
+
+
+def _summarize(value, limit=120):
+    # Datasets and frames are described by their size, not their (costly) repr
+    if hasattr(value, "sizes") or hasattr(value, "shape"):
+        return f"<{type(value).__name__} {dict(getattr(value, 'sizes', {})) or value.shape}>"
+    text = repr(value)
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+
+def _log_s3_requests():
+    """
+    Record every request sent by s3fs filesystems in the trace of the session
+    that sent it, including the async copies that zarr stores create from the
+    shared filesystem. The session is found from the context of the request,
+    which s3fs's event loop inherits from the calling thread.
+    Returns the original request method, to be restored afterwards.
+    """
+    from s3fs import S3FileSystem
+
+    call_s3 = S3FileSystem._call_s3
+
+    async def logged_call_s3(self, method, *args, **kwargs):
+        trace = _ACTIVE.get()
+        # Background requests (e.g. read-ahead) may outlive their session
+        t0 = None if trace is None else trace.get("_t0")
+        if t0 is None:
+            return await call_s3(self, method, *args, **kwargs)
+        entry = {
+            "operation": method,
+            "bucket": kwargs.get("Bucket"),
+            "key": kwargs.get("Key") or kwargs.get("Prefix"),
+            "range": kwargs.get("Range"),
+            "start": time.perf_counter() - t0,
+        }
+        try:
+            return await call_s3(self, method, *args, **kwargs)
+        except Exception as e:
+            entry["error"] = _summarize(e)
+            raise
+        finally:
+            entry["elapsed"] = time.perf_counter() - t0 - entry["start"]
+            trace["s3_requests"].append(entry)
+
+    S3FileSystem._call_s3 = logged_call_s3
+    return call_s3
+
+
+def _restore_s3_requests(call_s3):
+    from s3fs import S3FileSystem
+
+    S3FileSystem._call_s3 = call_s3
+
+
+def _start_session():
+    """
+    Install the process-wide hooks for the first active session.
+    """
+    global _sessions, _call_s3, _started_tracemalloc
+    with _lock:
+        if _sessions == 0:
+            _call_s3 = _log_s3_requests()
+            _started_tracemalloc = not tracemalloc.is_tracing()
+            if _started_tracemalloc:
+                tracemalloc.start()
+            else:
+                tracemalloc.reset_peak()
+        _sessions += 1
+
+
+def _end_session(trace, top_allocations):
+    """
+    Record the memory figures of a session, and remove the hooks after the last one.
+    """
+    global _sessions, _call_s3, _started_tracemalloc
+    with _lock:
+        trace["current_memory"], trace["peak_memory"] = tracemalloc.get_traced_memory()
+        trace["concurrent_sessions"] = _sessions - 1
+        trace["top_allocations"] = _allocation_summary(tracemalloc.take_snapshot(), top_allocations)
+        _sessions -= 1
+        if _sessions == 0:
+            _restore_s3_requests(_call_s3)
+            _call_s3 = None
+            if _started_tracemalloc:
+                tracemalloc.stop()
+
+
+def _profile_summary(profiler, top_n):
+    stats = pstats.Stats(profiler).stats
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:top_n]
+    return [
+        {
+            "function": f"{filename}:{line}({name})",
+            "calls": calls,
+            "total_time": total_time,
+            "cumulative_time": cumulative_time,
+        }
+        for (filename, line, name), (_, calls, total_time, cumulative_time, _) in rows
+    ]
+
+
+def _allocation_summary(snapshot, top_n):
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ])
+    return [
+        {"location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+         "size": stat.size, "count": stat.count}
+        for stat in snapshot.statistics("lineno")[:top_n]
+    ]
+
+
+@contextmanager
+def profile_queries(output_file=None, top_functions=PROFILE_TOP_FUNCTIONS,
+                    top_allocations=PROFILE_TOP_ALLOCATIONS, label="session"):
+    """
+    Profile everything run inside the block and write a trace report.
+
+    The trace (JSON) holds the timings of every loader stage called in the
+    block, the peak traced memory and top allocation sites (tracemalloc), the
+    functions with the highest cumulative time (cProfile) and a log of the S3
+    requests sent through s3fs. The raw cProfile data is written
+    next to it with a ``.prof`` suffix, for flame graph viewers such as snakeviz.
+
+    Loaders return lazy datasets whose chunks are only read when they are
+    loaded or computed, so the block must include the ``.load()`` (or the
+    write of the result) for chunk reads to appear in the trace.
+
+    Sessions are per thread (and asyncio task): queries profiled concurrently
+    from several threads each get their own trace. cProfile and the S3 request
+    log only see the calling thread; run dask computations with
+    ``dask.config.set(scheduler="synchronous")`` inside the block to include
+    them. Memory is traced process-wide, so while sessions overlap
+    (``concurrent_sessions`` in the trace) their memory figures include each other's.
+
+    Parameters
+    ----------
+    output_file : str, optional
+        Path of the JSON trace. If None, a timestamped file is written to the
+        directory in INSPIRE_OEDI_PROFILE, or the current directory.
+    top_functions : int
+        Number of functions listed in the profile summary
+    top_allocations : int
+        Number of allocation sites listed
+    label : str
+        Name of the profiled query, recorded in the trace
+
+    Yields
+    ------
+    dict
+        The trace, filled in when the block exits
+    """
+    if _ACTIVE.get() is not None:
+        raise RuntimeError("A profiling session is already active in this thread")
+    if output_file is None:
+        output_dir = os.environ.get(PROFILE_ENV_VAR) or os.getcwd()
+        stamp = time.strftime("%Y%m%dT%H%M%S")
+        output_file = os.path.join(
+            output_dir, f"{label}-{stamp}-{os.getpid()}-{next(_session_numbers)}.json"
+        )
+
+    trace = {
+        "query": label,
+        "started": time.time(),
+        "stages": [],
+        "s3_requests": [],
+        "_t0": time.perf_counter(),
+    }
+    token = _ACTIVE.set(trace)
+    _start_session()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield trace
+    finally:
+        profiler.disable()
+        trace["elapsed"] = time.perf_counter() - trace.pop("_t0")
+        _end_session(trace, top_allocations)
+        trace["profile"] = _profile_summary(profiler, top_functions)
+        _ACTIVE.reset(token)
+
+        os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+        profiler.dump_stats(os.path.splitext(output_file)[0] + ".prof")
+        with open(output_file, "w") as f:
+            json.dump(trace, f, indent=1, default=str)
+        print(f"Profile trace written to {output_file}")
+
+
+def profiled(func):
+    """
+    Record a loader call as a stage of the active profiling session.
+
+    Without an active session the call is profiled on its own if
+    INSPIRE_OEDI_PROFILE is set, and runs unchanged otherwise. That trace ends
+    when the call returns: for loaders it covers opening the stores and
+    selecting the data, but not reading the chunks of the lazy result, which
+    only happens when it is loaded. Wrap the query and its ``.load()`` in
+    profile_queries to trace the reads.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        trace = _ACTIVE.get()
+        if trace is None:
+            if not os.environ.get(PROFILE_ENV_VAR):
+                return func(*args, **kwargs)
+            with profile_queries(label=func.__name__):
+                return wrapper(*args, **kwargs)
+
+        depth = _DEPTH.get()
+        stage = {
+            "name": func.__name__,
+            "depth": depth,
+            "args": [_summarize(arg) for arg in args],
+            "kwargs": {key: _summarize(value) for key, value in kwargs.items()},
+            "start": time.perf_counter() - trace["_t0"],
+        }
+        trace["stages"].append(stage)
+        token = _DEPTH.set(depth + 1)
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            stage["error"] = _summarize(e)
+            raise
+        finally:
+            _DEPTH.reset(token)
+            stage["elapsed"] = time.perf_counter() - trace["_t0"] - stage["start"]
+
+    return wrapper
@@ -0,0 +1,425 @@
+import os
+import json
+import math
+import shutil
+import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from inspire_oedi_access.main import (
+    S3_BUCKET_PATH,
+    ZARR_FILENAME_TEMPLATE,
+    _store_url,
+    _url_to_fs,
+)
+from inspire_oedi_access.sync import MANIFEST_FILENAME, _read_manifest, _write_manifest
+
+
+# Alternate chunk layouts: the dimension split into chunks; every other dimension is kept whole
+LAYOUTS = {"timeseries": "gid", "map": "time"}
+LAYOUT_FILENAME_TEMPLATE = "preliminary_{setup_num:02d}_{layout}.zarr"
+# Uncompressed size targeted for the chunks of the rechunked arrays
+RECHUNK_CHUNK_BYTES = 8 * 2**20
+# Upper bound on the data held in memory by all workers together
+RECHUNK_MAX_MEMORY = 2 * 2**30
+# Cost of one chunk request, in elements read, when comparing layouts for a query
+LAYOUT_REQUEST_COST = 2**16
+
+
+def layout_filename(setup_num, layout=None):
+    """
+    File name of a setup's store in the given chunk layout (None for the original).
+    """
+    if layout is None:
+        return ZARR_FILENAME_TEMPLATE.format(setup_num=setup_num)
+    if layout not in LAYOUTS:
+        raise ValueError(f"layout must be one of {tuple(LAYOUTS)}, not {layout!r}")
+    return LAYOUT_FILENAME_TEMPLATE.format(setup_num=setup_num, layout=layout)
+
+
+def _make_compressor(compressor, clevel):
+    """
+    Blosc codec for a compressor name ('zstd', 'lz4', ...); codec objects pass through.
+    """
+    if compressor is None or not isinstance(compressor, str):
+        return compressor
+    from numcodecs import Blosc
+    return Blosc(cname=compressor, clevel=clevel, shuffle=Blosc.SHUFFLE)
+
+
+def _target_chunks(array, dims, split_dim, chunk_bytes):
+    shape = array.shape
+    if split_dim not in dims:
+        return shape
+    axis = dims.index(split_dim)
+    row_bytes = array.dtype.itemsize * math.prod(shape[:axis] + shape[axis + 1:])
+    split = min(shape[axis], max(1, chunk_bytes // max(row_bytes, 1)))
+    return shape[:axis] + (split,) + shape[axis + 1:]
+
+
+def _slices(length, step):
+    return [slice(start, min(start + step, length)) for start in range(0, length, step)]
+
+
+def _copy_plan(shape, source_chunks, target_chunks, axis, itemsize, budget):
+    """
+    Selections that copy an array into target_chunks, which split only the
+    given axis, in blocks of about budget bytes, reading every source chunk
+    and writing every target chunk once.
+
+    Blocks along the split axis that are whole multiples of both chunkings
+    are copied directly. Otherwise every block along the split axis would
+    overlap source chunks shared with its neighbours (e.g. a time-series
+    chunked store copied to the map layout), so the copy goes through an
+    intermediate store: whole source chunks are read into intermediate chunks
+    split like the target along axis, which are then gathered into whole
+    target chunks. A stage-one block holds at least one source chunk along
+    the other dimensions.
+
+    Returns
+    -------
+    list of tuple
+        Selections of the direct copy, or of the copy into the intermediate store
+    tuple or None
+        Chunks of the intermediate store, None for a direct copy
+    list of tuple
+        Selections of the copy from the intermediate store
+    """
+    length, split = shape[axis], target_chunks[axis]
+    row_bytes = itemsize * math.prod(shape[:axis] + shape[axis + 1:])
+    block = max(split, budget // max(row_bytes, 1) // split * split)
+    aligned = min(split * source_chunks[axis] // math.gcd(split, source_chunks[axis]), length)
+
+    def selections(slices, along=axis):
+        return [(slice(None),) * along + (s,) for s in slices]
+
+    if aligned <= block or len(shape) == 1:
+        if aligned <= block:
+            block = block // aligned * aligned
+        return selections(_slices(length, block)), None, []
+
+    # Stage one spans whole source and target chunks along axis, and as many
+    # source chunks as fit along the other dimension with the most chunks
+    other = max((a for a in range(len(shape)) if a != axis),
+                key=lambda a: math.ceil(shape[a] / source_chunks[a]))
+    other_chunk = source_chunks[other]
+    other_bytes = row_bytes // shape[other] * aligned
+    other_block = max(other_chunk, budget // max(other_bytes, 1) // other_chunk * other_chunk)
+
+    intermediate_chunks = list(shape)
+    intermediate_chunks[axis] = split
+    intermediate_chunks[other] = min(other_block, shape[other])
+
+    first = []
+    for along_axis in _slices(length, aligned):
+        for along_other in _slices(shape[other], other_block):
+            selection = [slice(None)] * len(shape)
+            selection[axis], selection[other] = along_axis, along_other
+            first.append(tuple(selection))
+    return first, tuple(intermediate_chunks), selections(_slices(length, block))
+
+
+def rechunk_setup(setup_num, local_path, layout, output_path=None, chunk_bytes=RECHUNK_CHUNK_BYTES,
+                  max_memory=RECHUNK_MAX_MEMORY, compressor="zstd", clevel=5, max_workers=None):
+    """
+    Write a copy of a setup's store in another chunk layout.
+
+    The 'timeseries' layout holds the full time series of a few GIDs per chunk,
+    for point queries; the 'map' layout holds all GIDs at a few timesteps per
+    chunk, for spatial queries. Encoded values and attributes are copied as
+    they are, so the copy opens to the same dataset.
+
+    Arrays are copied in blocks of whole chunks by a thread pool; the blocks
+    are sized so that all workers together hold about max_memory. When the
+    source chunks run across the target chunks, the copy goes through an
+    intermediate store next to the target, so that no source chunk is read
+    more than once.
+
+    Parameters
+    ----------
+    setup_num : int
+        Setup number (1-10)
+    local_path : str
+        Local mirror directory holding the setup's store (see sync_zarr_stores)
+    layout : str
+        'timeseries' or 'map'
+    output_path : str, optional
+        Directory of the rechunked store. Defaults to local_path, where the
+        loaders find it with layout='auto'.
+    chunk_bytes : int
+        Target uncompressed chunk size in bytes
+    max_memory : int
+        Approximate bound on the memory used by all workers, in bytes
+    compressor : str or numcodecs codec, optional
+        Blosc compressor name ('zstd', 'lz4', 'lz4hc', 'zlib', 'blosclz'), any
+        numcodecs codec, or None to keep the source compressor of each array
+    clevel : int
+        Compression level for compressor names
+    max_workers : int, optional
+        Number of worker threads (number of CPUs if None)
+
+    Returns
+    -------
+    str
+        Path of the rechunked store
+    """
+    import zarr
+
+    split_dim = LAYOUTS.get(layout)
+    if split_dim is None:
+        raise ValueError(f"layout must be one of {tuple(LAYOUTS)}, not {layout!r}")
+    if output_path is None:
+        output_path = local_path
+    max_workers = max_workers or os.cpu_count() or 1
+
+    source_path = os.path.join(local_path, layout_filename(setup_num))
+    source = zarr.open_group(source_path, mode="r")
+    target_path = os.path.join(output_path, layout_filename(setup_num, layout))
+    tmp_path = f"{target_path}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    target = zarr.open_group(tmp_path, mode="w", zarr_format=2)
+    target.attrs.update(source.attrs.asdict())
+    codec = _make_compressor(compressor, clevel)
+
+    stage_path = f"{target_path}.{os.getpid()}.stage.tmp"
+    shutil.rmtree(stage_path, ignore_errors=True)
+    stage = None
+
+    tasks = []
+    stage_tasks = []
+    for name, array in source.arrays():
+        dims = tuple(array.attrs.get("_ARRAY_DIMENSIONS", ()))
+        chunks = _target_chunks(array, dims, split_dim, chunk_bytes)
+        target_array = target.create_array(
+            name, shape=array.shape, chunks=chunks, dtype=array.dtype,
+            fill_value=array.fill_value, attributes=array.attrs.asdict(),
+            compressors=array.compressors if codec is None else codec,
+            filters=array.filters,
+        )
+        if split_dim not in dims:
+            tasks.append((array, target_array, (slice(None),) * array.ndim))
+            continue
+
+        first, intermediate_chunks, second = _copy_plan(
+            array.shape, array.chunks, chunks, dims.index(split_dim), array.dtype.itemsize,
+            max_memory // max_workers,
+        )
+        if intermediate_chunks is None:
+            tasks.extend((array, target_array, selection) for selection in first)
+            continue
+        if stage is None:
+            stage = zarr.open_group(stage_path, mode="w", zarr_format=2)
+        # The intermediate copy is read back once, so a fast codec is used
+        stage_array = stage.create_array(
+            name, shape=array.shape, chunks=intermediate_chunks, dtype=array.dtype,
+            fill_value=array.fill_value, compressors=_make_compressor("lz4", 1),
+            filters=array.filters,
+        )
+        tasks.extend((array, stage_array, selection) for selection in first)
+        stage_tasks.extend((stage_array, target_array, selection) for selection in second)
+
+    print(f"Rechunking setup {setup_num} to the {layout} layout "
+          f"({len(tasks) + len(stage_tasks)} blocks)")
+
+    def copy_block(task):
+        array, target_array, selection = task
+        target_array[selection] = array[selection]
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for stage_blocks in (tasks, stage_tasks):
+                for _ in executor.map(copy_block, stage_blocks):
+                    pass
+    finally:
+        shutil.rmtree(stage_path, ignore_errors=True)
+
+    zarr.consolidate_metadata(tmp_path, zarr_format=2)
+    # A mirror synced for a GID or time range lacks the other chunks; the copy
+    # is restricted to the same positions when opened
+    positions = _read_manifest(os.path.join(source_path, MANIFEST_FILENAME)).get("positions")
+    if positions:
+        _write_manifest(os.path.join(tmp_path, MANIFEST_FILENAME), {"positions": positions})
+    shutil.rmtree(target_path, ignore_errors=True)
+    os.rename(tmp_path, target_path)
+    return target_path
+
+
+def rechunk_setups(local_path, setup_nums=range(1, 11), layouts=tuple(LAYOUTS), **kwargs):
+    """
+    Write the alternate chunk layouts of several setups of a local mirror.
+
+    Keyword arguments are passed to rechunk_setup.
+
+    Returns
+    -------
+    list of str
+        Paths of the rechunked stores
+    """
+    return [
+        rechunk_setup(setup_num, local_path, layout, **kwargs)
+        for setup_num in setup_nums
+        for layout in layouts
+    ]
+
+
+def _layout_cost(metadata, gid_indices, time_indices=None):
+    """
+    Elements read (plus a per-request cost) to load the GIDs at gid_indices,
+    at the timesteps at time_indices (all if None), from a store with the
+    given metadata, judged by its first (gid, time) data variable.
+    """
+    for key, zarray in metadata.items():
+        if not key.endswith("/.zarray"):
+            continue
+        dims = metadata.get(key[:-len(".zarray")] + ".zattrs", {}).get("_ARRAY_DIMENSIONS", [])
+        if "gid" in dims and "time" in dims:
+            break
+    else:
+        return None
+    gid_chunk = zarray["chunks"][dims.index("gid")]
+    time_chunk = zarray["chunks"][dims.index("time")]
+    if time_indices is None:
+        time_indices = np.arange(zarray["shape"][dims.index("time")])
+    gid_chunks = len(np.unique(np.asarray(gid_indices) // gid_chunk))
+    time_chunks = len(np.unique(np.asarray(time_indices) // time_chunk))
+    return gid_chunks * time_chunks * (gid_chunk * time_chunk + LAYOUT_REQUEST_COST)
+
+
+# Layout metadata and coordinates of the setups, with the modification
+# times of local stores they were read at (None for remote stores)
+_LAYOUT_INDEXES = {}
+
+
+def _metadata_marker(fs, path):
+    if "file" not in np.atleast_1d(fs.protocol):
+        return None
+    try:
+        return os.path.getmtime(f"{path}/.zmetadata")
+    except FileNotFoundError:
+        return "missing"
+
+
+def _layout_index(setup_num, s3_bucket_path=S3_BUCKET_PATH):
+    """
+    Consolidated metadata of each available layout of a setup, and the gid
+    and time coordinates of the original store as the loaders open it.
+
+    The index is kept for the life of the process, so choosing a layout does
+    not read any store again; local stores are re-read when they change.
+
+    Returns
+    -------
+    dict
+        ``metadata`` (layout name, or None for the original, to consolidated
+        metadata), ``gid`` and ``time`` (coordinate values), and
+        ``gid_positions`` and ``time_positions`` (positions of the
+        coordinates in the stored arrays, which differ for range mirrors)
+    """
+    from inspire_oedi_access.main import open_zarr_dataset
+    from inspire_oedi_access.sync import _synced_positions
+
+    locations = {
+        layout: _url_to_fs(_store_url(s3_bucket_path, layout_filename(setup_num, layout)))
+        for layout in (None,) + tuple(LAYOUTS)
+    }
+    markers = {layout: _metadata_marker(fs, path) for layout, (fs, path) in locations.items()}
+    key = (s3_bucket_path.rstrip("/"), setup_num)
+    index = _LAYOUT_INDEXES.get(key)
+    if index is not None and index["markers"] == markers:
+        return index
+
+    metadata = {}
+    for layout, (fs, path) in locations.items():
+        if markers[layout] == "missing":
+            continue
+        try:
+            metadata[layout] = json.loads(fs.cat_file(f"{path}/.zmetadata"))["metadata"]
+        except FileNotFoundError:
+            continue
+    store_url = _store_url(s3_bucket_path, layout_filename(setup_num))
+    ds = open_zarr_dataset(setup_num, s3_bucket_path, read_ahead=0)
+    positions = _synced_positions(store_url)
+    index = {
+        "markers": markers,
+        "metadata": metadata,
+        "gid": ds["gid"].values,
+        "time": ds.indexes["time"],
+        "gid_positions": positions.get("gid", np.arange(ds.sizes["gid"])),
+        "time_positions": positions.get("time", np.arange(ds.sizes["time"])),
+    }
+    _LAYOUT_INDEXES[key] = index
+    return index
+
+
+def choose_layout(setup_num, gid_indices, s3_bucket_path=S3_BUCKET_PATH, time_indices=None):
+    """
+    Chunk layout of a setup that reads the least data for a query.
+
+    Candidates are the original store and each rechunked layout found next to
+    it; the cost of each is estimated from its chunk sizes and the chunks
+    the selected GIDs and timesteps fall into. A GID's full time series is
+    cheapest in the 'timeseries' layout, a short time window over many GIDs
+    in the 'map' layout. No store is opened: the metadata of the layouts
+    is read once per process (again when a local store changes).
+
+    Parameters
+    ----------
+    setup_num : int
+        Setup number (1-10)
+    gid_indices : array-like of int
+        Positions of the selected GIDs along the gid dimension (as opened)
+    s3_bucket_path : str
+        Path of the zarr files directory
+    time_indices : array-like of int, optional
+        Positions of the selected timesteps along time; all if None
+
+    Returns
+    -------
+    str or None
+        Name of the cheapest layout, or None for the original store
+    """
+    index = _layout_index(setup_num, s3_bucket_path)
+    gid_positions = index["gid_positions"][np.asarray(gid_indices, dtype=int)]
+    time_positions = index["time_positions"]
+    if time_indices is not None:
+        time_positions = time_positions[np.asarray(time_indices, dtype=int)]
+
+    best_layout, best_cost = None, None
+    for layout, metadata in index["metadata"].items():
+        cost = _layout_cost(metadata, gid_positions, time_positions)
+        if cost is not None and (best_cost is None or cost < best_cost):
+            best_layout, best_cost = layout, cost
+    return best_layout
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Write time-series- and map-optimized copies of locally mirrored zarr stores."
+    )
+    parser.add_argument("local_path", help="Local mirror directory (see inspire_oedi_access.sync)")
+    parser.add_argument("--setups", type=int, nargs="+", default=list(range(1, 11)),
+                        help="Setup numbers to rechunk (default: 1-10)")
+    parser.add_argument("--layouts", nargs="+", choices=tuple(LAYOUTS), default=list(LAYOUTS))
+    parser.add_argument("--output-path", default=None,
+                        help="Directory of the rechunked stores (default: the mirror itself)")
+    parser.add_argument("--chunk-mib", type=float, default=RECHUNK_CHUNK_BYTES / 2**20,
+                        help="Target uncompressed chunk size in MiB")
+    parser.add_argument("--max-memory-mib", type=float, default=RECHUNK_MAX_MEMORY / 2**20,
+                        help="Approximate memory bound of all workers in MiB")
+    parser.add_argument("--compressor", default="zstd",
+                        help="Blosc compressor name, or 'source' to keep each array's compressor")
+    parser.add_argument("--clevel", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    rechunk_setups(
+        args.local_path, setup_nums=args.setups, layouts=args.layouts,
+        output_path=args.output_path, chunk_bytes=int(args.chunk_mib * 2**20),
+        max_memory=int(args.max_memory_mib * 2**20),
+        compressor=None if args.compressor == "source" else args.compressor,
+        clevel=args.clevel, max_workers=args.workers,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import os
+import threading
+import boto3
+import botocore
+from botocore.config import Config
+
+
+# Process-wide S3 client configuration. Defaults can be set through environment
+# variables; configure_s3 changes them at runtime.
+S3_CONFIG = {
+    "max_connections": int(os.environ.get("INSPIRE_OEDI_S3_MAX_CONNECTIONS", 64)),
+    "block_size": int(os.environ.get("INSPIRE_OEDI_S3_BLOCK_SIZE", 8 * 2**20)),
+    "max_attempts": int(os.environ.get("INSPIRE_OEDI_S3_MAX_ATTEMPTS", 5)),
+    "retry_mode": os.environ.get("INSPIRE_OEDI_S3_RETRY_MODE", "adaptive"),
+    "connect_timeout": float(os.environ.get("INSPIRE_OEDI_S3_CONNECT_TIMEOUT", 10)),
+    "read_timeout": float(os.environ.get("INSPIRE_OEDI_S3_READ_TIMEOUT", 60)),
+}
+
+_lock = threading.Lock()
+_filesystem = None
+_client = None
+# boto3 resources are not thread-safe, so every thread gets its own
+_resources = threading.local()
+
+
+def _reset():
+    """
+    Drop the shared clients so they are recreated on next use.
+    """
+    global _filesystem, _client, _resources
+    _filesystem = None
+    _client = None
+    _resources = threading.local()
+
+
+# Sessions and connection pools must not be shared with forked worker processes
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset)
+
+
+def configure_s3(**kwargs):
+    """
+    Change the shared S3 client configuration.
+
+    Clients created afterwards use the new settings. The shared filesystem,
+    boto3 client and resources, and the async filesystems of event loops
+    that already sent requests, are recreated on next use.
+
+    Parameters
+    ----------
+    max_connections : int
+        Maximum number of pooled connections per client
+    block_size : int
+        Read block size in bytes for files opened through the filesystem
+    max_attempts : int
+        Maximum number of attempts per request, including the first one
+    retry_mode : str
+        botocore retry mode: 'legacy', 'standard' or 'adaptive'
+    connect_timeout : float
+        Connection timeout in seconds
+    read_timeout : float
+        Read timeout in seconds
+    """
+    unknown = set(kwargs) - set(S3_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown S3 configuration options: {sorted(unknown)}")
+    with _lock:
+        S3_CONFIG.update(kwargs)
+        _reset()
+    from inspire_oedi_access.aio import _ASYNC_FILESYSTEMS
+    _ASYNC_FILESYSTEMS.clear()
+
+
+def _botocore_config_kwargs():
+    return {
+        "max_pool_connections": S3_CONFIG["max_connections"],
+        "retries": {"max_attempts": S3_CONFIG["max_attempts"], "mode": S3_CONFIG["retry_mode"]},
+        "connect_timeout": S3_CONFIG["connect_timeout"],
+        "read_timeout": S3_CONFIG["read_timeout"],
+    }
+
+
+def s3_storage_options():
+    """
+    s3fs storage options (anonymous access) reflecting the shared configuration.
+    """
+    return {
+        "anon": True,
+        "default_block_size": S3_CONFIG["block_size"],
+        "config_kwargs": _botocore_config_kwargs(),
+    }
+
+
+def get_s3_filesystem():
+    """
+    Process-wide anonymous s3fs filesystem shared by all loaders.
+    """
+    global _filesystem
+    with _lock:
+        if _filesystem is None:
+            import s3fs
+            _filesystem = s3fs.S3FileSystem(skip_instance_cache=True, **s3_storage_options())
+        return _filesystem
+
+
+def _boto3_config():
+    return Config(signature_version=botocore.UNSIGNED, **_botocore_config_kwargs())
+
+
+def get_s3_client():
+    """
+    Process-wide unsigned boto3 S3 client shared by the downloader.
+
+    boto3 clients are thread-safe, so the client and its connection pool are
+    shared by all threads.
+    """
+    global _client
+    with _lock:
+        if _client is None:
+            _client = boto3.session.Session().client("s3", config=_boto3_config())
+        return _client
+
+
+def get_s3_resource():
+    """
+    Unsigned boto3 S3 resource of the calling thread.
+
+    boto3 resources are not thread-safe, so each thread gets its own resource
+    (created from its own session), reused for all its calls. Prefer
+    get_s3_client, which is shared by all threads.
+    """
+    resources = _resources
+    resource = getattr(resources, "resource", None)
+    if resource is None:
+        resource = boto3.session.Session().resource("s3", config=_boto3_config())
+        resources.resource = resource
+    return resource
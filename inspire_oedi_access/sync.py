@@ -0,0 +1,372 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+from inspire_oedi_access.main import (
+    S3_BUCKET_PATH,
+    ZARR_FILENAME_TEMPLATE,
+    LOOKUP_TABLE_FILENAME,
+    _store_url,
+    _url_to_fs,
+    open_zarr_dataset,
+)
+
+
+MANIFEST_FILENAME = ".sync_manifest.json"
+# Number of objects requested concurrently per batch while transferring
+SYNC_BATCH_SIZE = 256
+
+
+def _fingerprint(info):
+    """
+    Change marker of a listed object: ETag on S3, mtime locally, plus size.
+    """
+    marker = info.get("ETag") or info.get("etag") or info.get("mtime") or info.get("LastModified")
+    return f"{marker}:{info.get('size')}"
+
+
+def _read_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_manifest(path, manifest):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+
+def _read_zarr_metadata(fs, root, keys):
+    """
+    Collect the zarr (v2) metadata documents of a store, keyed like .zmetadata.
+    """
+    if ".zmetadata" in keys:
+        return json.loads(fs.cat_file(f"{root}/.zmetadata"))["metadata"]
+    metadata_keys = [k for k in keys if os.path.basename(k) in (".zgroup", ".zattrs", ".zarray")]
+    contents = fs.cat([f"{root}/{k}" for k in metadata_keys])
+    return {k: json.loads(contents[f"{root}/{k}"]) for k in metadata_keys}
+
+
+def _range_mask(values, value_range):
+    """
+    Mask of the values within value_range (inclusive; either bound may be None).
+    """
+    lo, hi = value_range
+    mask = np.ones(len(values), dtype=bool)
+    if lo is not None:
+        mask &= values >= lo
+    if hi is not None:
+        mask &= values <= hi
+    return mask
+
+
+def _runs(positions):
+    """
+    Sorted positions as a list of [start, stop) runs.
+    """
+    if len(positions) == 0:
+        return []
+    breaks = np.where(np.diff(positions) != 1)[0] + 1
+    starts = np.concatenate([[0], breaks])
+    stops = np.concatenate([breaks, [len(positions)]])
+    return [[int(positions[a]), int(positions[b - 1]) + 1] for a, b in zip(starts, stops)]
+
+
+def _synced_positions(zarr_url):
+    """
+    Positions along gid and time that a local mirror was synced for.
+
+    A mirror synced with gid_range or time_range keeps the source's shapes,
+    with the chunks outside the ranges missing. Opened datasets are
+    restricted to these positions, so out-of-range GIDs and timesteps are
+    not reported as present (with fill values). Empty for full mirrors and
+    remote stores.
+    """
+    fs, path = _url_to_fs(zarr_url)
+    if "file" not in np.atleast_1d(fs.protocol):
+        return {}
+    manifest = _read_manifest(os.path.join(path, MANIFEST_FILENAME))
+    return {
+        dim: np.concatenate([np.arange(start, stop) for start, stop in runs]).astype(int)
+        if runs else np.array([], dtype=int)
+        for dim, runs in manifest.get("positions", {}).items()
+    }
+
+
+def _dim_chunk_size(metadata, dim):
+    """
+    Chunk size along dim used by the data variables (not the coordinate itself).
+    """
+    for key, meta in metadata.items():
+        if not key.endswith("/.zarray") or key == f"{dim}/.zarray":
+            continue
+        dims = metadata.get(key[: -len(".zarray")] + ".zattrs", {}).get("_ARRAY_DIMENSIONS", [])
+        if dim in dims:
+            return meta["chunks"][dims.index(dim)]
+    return None
+
+
+def _select_keys(keys, metadata, variables, allowed_chunks):
+    """
+    Select the store keys to mirror.
+
+    Dimension coordinates are always mirrored in full. Data variables are
+    restricted to ``variables`` (all if None) and, along dimensions present in
+    allowed_chunks, to the allowed chunk indices.
+    """
+    arrays = {
+        k[: -len("/.zarray")]: v for k, v in metadata.items() if k.endswith("/.zarray")
+    }
+    array_dims = {
+        name: metadata.get(f"{name}/.zattrs", {}).get("_ARRAY_DIMENSIONS", [])
+        for name in arrays
+    }
+    all_dims = {dim for dims in array_dims.values() for dim in dims}
+    coords = {name for name in arrays if name in all_dims}
+
+    if variables is None:
+        selected = set(arrays)
+    else:
+        unknown = set(variables) - set(arrays)
+        if unknown:
+            raise ValueError(f"Variables not found in store: {sorted(unknown)}")
+        selected = coords | set(variables)
+
+    selected_keys = []
+    for key in keys:
+        name, _, rest = key.partition("/")
+        if not rest:
+            # Group-level metadata
+            if name in (".zgroup", ".zattrs", ".zmetadata"):
+                selected_keys.append(key)
+            continue
+        if name not in selected:
+            continue
+        if rest.startswith(".") or name in coords:
+            selected_keys.append(key)
+            continue
+        separator = arrays[name].get("dimension_separator") or "."
+        chunk_idx = rest.split(separator)
+        if all(
+            int(idx) in allowed_chunks[dim]
+            for dim, idx in zip(array_dims[name], chunk_idx)
+            if dim in allowed_chunks
+        ):
+            selected_keys.append(key)
+
+    return selected_keys, selected
+
+
+def _filter_consolidated(content, selected):
+    """
+    Drop unselected variables from a consolidated .zmetadata document.
+    """
+    consolidated = json.loads(content)
+    consolidated["metadata"] = {
+        k: v for k, v in consolidated["metadata"].items()
+        if "/" not in k or k.partition("/")[0] in selected
+    }
+    return json.dumps(consolidated, indent=4).encode()
+
+
+def sync_zarr_store(setup_num, local_path, variables=None, gid_range=None, time_range=None,
+                    s3_bucket_path=S3_BUCKET_PATH):
+    """
+    Mirror one setup's zarr store to a local directory, transferring only changed objects.
+
+    Parameters
+    ----------
+    setup_num : int
+        Setup number (1-10)
+    local_path : str
+        Local mirror directory; the store is written to
+        ``local_path/preliminary_XX.zarr``
+    variables : list of str, optional
+        Data variables to mirror. Dimension coordinates are always included.
+        If None, all variables are mirrored.
+    gid_range : tuple, optional
+        Inclusive (min, max) GID range to mirror; either bound may be None.
+    time_range : tuple, optional
+        Inclusive (start, end) time range to mirror; either bound may be None.
+        Only the chunks holding the ranges are transferred; datasets opened
+        from the mirror are restricted to the GIDs and timesteps in the ranges.
+    s3_bucket_path : str
+        S3 path to the zarr files directory
+
+    Returns
+    -------
+    dict
+        Summary with the number of transferred, unchanged and removed objects
+    """
+    zarr_filename = ZARR_FILENAME_TEMPLATE.format(setup_num=setup_num)
+    source_url = _store_url(s3_bucket_path, zarr_filename)
+    fs, root = _url_to_fs(source_url)
+    root = root.rstrip("/")
+    target = os.path.join(local_path, zarr_filename)
+    manifest_path = os.path.join(target, MANIFEST_FILENAME)
+
+    listing = fs.find(root, detail=True)
+    source = {
+        path[len(root) + 1:]: _fingerprint(info)
+        for path, info in listing.items()
+        if info.get("type", "file") != "directory"
+    }
+    metadata = _read_zarr_metadata(fs, root, source)
+
+    # Translate value ranges into positions, and chunk indices, along their dimension
+    allowed_chunks = {}
+    positions = {}
+    if gid_range is not None or time_range is not None:
+        ds = open_zarr_dataset(setup_num, s3_bucket_path)
+        for dim, value_range in (("gid", gid_range), ("time", time_range)):
+            if value_range is None:
+                continue
+            values = ds[dim].values
+            if dim == "time":
+                value_range = tuple(
+                    None if v is None else np.datetime64(pd.Timestamp(v)) for v in value_range
+                )
+            in_range = np.where(_range_mask(values, value_range))[0]
+            chunk_size = _dim_chunk_size(metadata, dim) or len(values)
+            allowed_chunks[dim] = set((in_range // chunk_size).tolist())
+            positions[dim] = _runs(in_range)
+
+    wanted, selected = _select_keys(sorted(source), metadata, variables, allowed_chunks)
+
+    manifest = _read_manifest(manifest_path)
+    previous = manifest.get("keys", {})
+    # The consolidated metadata depends on the variable selection, not only on the source
+    variables_changed = manifest.get("variables") != (None if variables is None else list(variables))
+    to_transfer = [
+        k for k in wanted
+        if previous.get(k) != source[k]
+        or not os.path.exists(os.path.join(target, k))
+        or (k == ".zmetadata" and variables_changed)
+    ]
+    wanted_set = set(wanted)
+    to_remove = [k for k in previous if k not in wanted_set]
+
+    print(f"Setup {setup_num}: {len(to_transfer)} objects to transfer, "
+          f"{len(wanted) - len(to_transfer)} unchanged, {len(to_remove)} to remove")
+
+    for key in to_remove:
+        path = os.path.join(target, key)
+        if os.path.exists(path):
+            os.remove(path)
+        previous.pop(key, None)
+
+    os.makedirs(target, exist_ok=True)
+    for start in range(0, len(to_transfer), SYNC_BATCH_SIZE):
+        batch = to_transfer[start:start + SYNC_BATCH_SIZE]
+        contents = fs.cat([f"{root}/{k}" for k in batch])
+        for key in batch:
+            content = contents[f"{root}/{key}"]
+            if key == ".zmetadata" and variables is not None:
+                content = _filter_consolidated(content, selected)
+            path = os.path.join(target, key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(content)
+            previous[key] = source[key]
+        # Record progress after every batch so an interrupted sync resumes
+        _write_manifest(manifest_path, {"keys": previous, "positions": positions})
+
+    _write_manifest(manifest_path, {
+        "keys": previous,
+        "variables": None if variables is None else list(variables),
+        "gid_range": gid_range,
+        "time_range": None if time_range is None else [None if t is None else str(t) for t in time_range],
+        "positions": positions,
+    })
+
+    return {
+        "transferred": len(to_transfer),
+        "unchanged": len(wanted) - len(to_transfer),
+        "removed": len(to_remove),
+    }
+
+
+def sync_zarr_stores(local_path, setup_nums=range(1, 11), variables=None, gid_range=None,
+                     time_range=None, s3_bucket_path=S3_BUCKET_PATH, include_lookup_table=True):
+    """
+    Incrementally mirror zarr stores of multiple setups to a local directory.
+
+    After syncing, loaders can read from the mirror by passing
+    ``s3_bucket_path=local_path`` or by setting the INSPIRE_OEDI_DATA_PATH
+    environment variable to local_path.
+
+    Parameters
+    ----------
+    local_path : str
+        Local mirror directory
+    setup_nums : list of int
+        List of setup numbers (1-10)
+    variables : list of str, optional
+        Data variables to mirror. If None, all variables are mirrored.
+    gid_range : tuple, optional
+        Inclusive (min, max) GID range to mirror
+    time_range : tuple, optional
+        Inclusive (start, end) time range to mirror
+    s3_bucket_path : str
+        S3 path to the zarr files directory
+    include_lookup_table : bool
+        Also mirror the gid-lat-lon.csv lookup table
+
+    Returns
+    -------
+    dict
+        Dictionary mapping setup numbers to their sync summaries
+    """
+    os.makedirs(local_path, exist_ok=True)
+
+    if include_lookup_table:
+        source_url = _store_url(s3_bucket_path, LOOKUP_TABLE_FILENAME)
+        fs, path = _url_to_fs(source_url)
+        manifest_path = os.path.join(local_path, MANIFEST_FILENAME)
+        manifest = _read_manifest(manifest_path)
+        fingerprint = _fingerprint(fs.info(path))
+        target = os.path.join(local_path, LOOKUP_TABLE_FILENAME)
+        if manifest.get(LOOKUP_TABLE_FILENAME) != fingerprint or not os.path.exists(target):
+            print("Transferring " + LOOKUP_TABLE_FILENAME)
+            fs.get_file(path, target)
+            manifest[LOOKUP_TABLE_FILENAME] = fingerprint
+            _write_manifest(manifest_path, manifest)
+
+    summaries = {}
+    for setup_num in setup_nums:
+        summaries[setup_num] = sync_zarr_store(
+            setup_num, local_path, variables=variables, gid_range=gid_range,
+            time_range=time_range, s3_bucket_path=s3_bucket_path,
+        )
+
+    return summaries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Incrementally mirror agrivoltaics irradiance zarr stores to a local directory."
+    )
+    parser.add_argument("local_path", help="Local mirror directory")
+    parser.add_argument("--setups", type=int, nargs="+", default=list(range(1, 11)),
+                        help="Setup numbers to mirror (default: 1-10)")
+    parser.add_argument("--variables", nargs="+", default=None,
+                        help="Data variables to mirror (default: all)")
+    parser.add_argument("--gid-range", type=int, nargs=2, default=None, metavar=("MIN", "MAX"))
+    parser.add_argument("--time-range", nargs=2, default=None, metavar=("START", "END"))
+    parser.add_argument("--source", default=S3_BUCKET_PATH,
+                        help="Source path of the zarr files directory")
+    args = parser.parse_args(argv)
+
+    sync_zarr_stores(
+        args.local_path, setup_nums=args.setups, variables=args.variables,
+        gid_range=args.gid_range, time_range=args.time_range, s3_bucket_path=args.source,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -51,9 +51,8 @@ setup(
         # Specify the Python versions you support here. In particular, ensure
         # that you indicate whether you support Python 2, Python 3 or both.
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.8',
-        'Programming Language :: Python :: 3.9',
-        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
             ],
 
     # What does your project relate to?
@@ -63,6 +62,8 @@ setup(
     # simple. Or you can use find_packages().
     #packages=find_packages(exclude=['contrib', 'docs', 'tests']) + ['data'],
     packages = ['inspire_oedi_access'],
+    # zarr>=3 (async loaders, read-ahead, rechunking) requires Python 3.11
+    python_requires='>=3.11',
     # Alternatively, if you want to distribute just a my_module.py, uncomment
     # this:
     #py_modules=["inspire_oedi_access"],
@@ -74,15 +75,22 @@ setup(
     install_requires=[
         'boto3',
         'botocore',
+        'dask',
+        'fsspec>=2024.12.0',
         'jmespath',
         'numpy',
         'pandas',
+        'pyarrow>=14',
         'python-dateutil',
         'pytz',
+        's3fs>=2024.12.0',
         's3transfer',
+        'scipy',
         'six',
         'urllib3',
         'requests',
+        'xarray',
+        'zarr>=3',
         ],
 
     # List additional groups of dependencies here (e.g. development
@@ -120,9 +128,9 @@ setup(
     # To provide executable scripts, use entry points in preference to the
     # "scripts" keyword. Entry points provide cross-platform support and allow
     # pip to create the appropriate form of executable for the target platform.
-    #entry_points={
-    #    'console_scripts': [
-    #        'sample=sample:main',
-    #    ],
-    #},
+    entry_points={
+        'console_scripts': [
+            'inspire-oedi=inspire_oedi_access.cli:main',
+        ],
+    },
 )
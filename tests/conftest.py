@@ -0,0 +1,86 @@
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+# Keep catalogs, indexes and cached results out of the user's cache directory;
+# set before the package is imported, as its cache paths are read at import time
+os.environ["INSPIRE_OEDI_CACHE_DIR"] = tempfile.mkdtemp(prefix="inspire_oedi_cache_")
+
+GIDS = np.arange(100, 160)
+TIMES = pd.date_range("2020-01-01", periods=24 * 40, freq="h")
+SETUPS = (1, 2)
+
+
+def make_setup(setup_num):
+    """
+    Synthetic setup dataset shaped like the OEDI stores: (gid, time[, distance]).
+    """
+    rng = np.random.default_rng(setup_num)
+    return xr.Dataset(
+        {
+            "ghi": (("gid", "time"), rng.random((len(GIDS), len(TIMES)))),
+            "ground_irradiance": (
+                ("gid", "time", "distance"), rng.random((len(GIDS), len(TIMES), 3))
+            ),
+            "tilt": (("gid",), rng.random(len(GIDS))),
+        },
+        coords={"gid": GIDS, "time": TIMES, "distance": np.arange(3)},
+    )
+
+
+@pytest.fixture(scope="session")
+def data_dir(tmp_path_factory):
+    """
+    Directory laid out like the S3 dataset: zarr v2 stores of two setups and the lookup table.
+    """
+    path = tmp_path_factory.mktemp("data")
+    for setup_num in SETUPS:
+        ds = make_setup(setup_num).chunk({"gid": 16, "time": 240, "distance": 3})
+        ds.to_zarr(path / f"preliminary_{setup_num:02d}.zarr", consolidated=True, zarr_format=2)
+    rng = np.random.default_rng(0)
+    pd.DataFrame(
+        {"latitude": rng.uniform(30, 40, len(GIDS)), "longitude": rng.uniform(-110, -100, len(GIDS))},
+        index=GIDS,
+    ).to_csv(path / "gid-lat-lon.csv")
+    return str(path)
+
+
+def make_grid_lookup(spacing=0.5):
+    """
+    Lookup table placing GIDS on a regular 6 x 10 lat/lon grid, row by row.
+    """
+    rows, cols = np.divmod(np.arange(len(GIDS)), 10)
+    return pd.DataFrame({
+        "gid": GIDS,
+        "latitude": 30 + spacing * rows,
+        "longitude": -105 + spacing * cols,
+    })
+
+
+def bilinear_field(latitude, longitude):
+    return 2.0 + 0.3 * longitude - 0.7 * latitude + 0.05 * latitude * longitude
+
+
+@pytest.fixture(scope="session")
+def grid_dir(tmp_path_factory):
+    """
+    Directory with the grid lookup table and a setup whose values are bilinear in lat/lon.
+    """
+    path = tmp_path_factory.mktemp("grid")
+    lookup_df = make_grid_lookup()
+    field = bilinear_field(lookup_df["latitude"].to_numpy(), lookup_df["longitude"].to_numpy())
+    scale = np.linspace(0.5, 1.5, 48)
+    xr.Dataset(
+        {
+            "ghi": (("gid", "time"), field[:, None] * scale),
+            "tilt": (("gid",), field),
+        },
+        coords={"gid": GIDS, "time": TIMES[:48]},
+    ).chunk({"gid": 16, "time": 24}).to_zarr(
+        path / "preliminary_01.zarr", consolidated=True, zarr_format=2
+    )
+    lookup_df.set_index("gid").to_csv(path / "gid-lat-lon.csv")
+    return str(path)
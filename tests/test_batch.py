@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from inspire_oedi_access import load_lookup_table, open_zarr_dataset, run_batch
+
+
+@pytest.fixture
+def sites(data_dir):
+    # Sites next to the grid points, without a site_id column
+    lookup_df = load_lookup_table(os.path.join(data_dir, "gid-lat-lon.csv"))
+    sample = lookup_df.sample(12, random_state=0)
+    return pd.DataFrame({
+        "latitude": sample["latitude"].to_numpy() + 0.001,
+        "longitude": sample["longitude"].to_numpy() - 0.001,
+    }, index=np.arange(100, 112))
+
+
+def _read(output_files):
+    return pd.concat([pd.read_parquet(f) for f in output_files], ignore_index=True)
+
+
+def test_batch_outputs_for_a_dataframe_of_sites(sites, data_dir, tmp_path):
+    output_files = run_batch(sites, str(tmp_path / "out"), [1, 2], ["ground_irradiance"],
+                             aggregate="mean", s3_bucket_path=data_dir, partition_size=4,
+                             max_workers=1)
+    result = _read(output_files)
+
+    assert sorted(result.columns) == sorted([
+        "site_id", "latitude", "longitude", "gid", "gid_distance", "setup", "distance",
+        "ground_irradiance",
+    ])
+    assert sorted(result["site_id"].unique()) == list(range(12))
+    # One row per site, setup and distance
+    assert len(result) == 12 * 2 * 3
+
+    row = result.iloc[0]
+    expected = open_zarr_dataset(int(row["setup"]), data_dir)["ground_irradiance"].sel(
+        gid=row["gid"], distance=row["distance"]
+    ).mean("time")
+    assert row["ground_irradiance"] == pytest.approx(float(expected))
+
+
+def test_batch_resumes_only_the_same_query(sites, data_dir, tmp_path, capsys):
+    output_dir = str(tmp_path / "out")
+    kwargs = dict(s3_bucket_path=data_dir, partition_size=4, max_workers=1)
+    output_files = run_batch(sites, output_dir, [1, 2], ["ghi", "tilt"], aggregate="mean",
+                             **kwargs)
+    expected = _read(output_files)
+
+    # An interrupted run: one partition is missing
+    os.remove(output_files[-1])
+    capsys.readouterr()
+    output_files = run_batch(sites, output_dir, [1, 2], ["ghi", "tilt"], aggregate="mean",
+                             **kwargs)
+    assert f"{len(output_files) - 1} already done" in capsys.readouterr().out
+    pd.testing.assert_frame_equal(_read(output_files), expected)
+
+    with pytest.raises(ValueError, match="different batch query"):
+        run_batch(sites, output_dir, [1], ["tilt"], aggregate="max", **kwargs)
+    with pytest.raises(ValueError, match="different batch query"):
+        moved = sites.assign(latitude=sites["latitude"] + 0.01)
+        run_batch(moved, output_dir, [1, 2], ["ghi", "tilt"], aggregate="mean", **kwargs)
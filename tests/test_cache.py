@@ -0,0 +1,54 @@
+import os
+import time
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from inspire_oedi_access import cached_load_data_by_gid_multiple_setups, load_data_by_gid_multiple_setups
+
+
+def test_cache_hit_keeps_the_requested_setup_order(data_dir, tmp_path):
+    cache_dir = str(tmp_path / "results")
+    cached_load_data_by_gid_multiple_setups([2, 1], [101, 140], data_dir, cache_dir=cache_dir)
+
+    data, matching_gids = cached_load_data_by_gid_multiple_setups(
+        [1, 2], [140, 101], data_dir, cache_dir=cache_dir
+    )
+
+    expected, _ = load_data_by_gid_multiple_setups([1, 2], [101, 140], data_dir)
+    assert data["setup"].values.tolist() == [1, 2]
+    assert list(matching_gids) == [1, 2]
+    np.testing.assert_array_equal(data["ghi"].values, expected["ghi"].values)
+
+
+def test_failed_write_leaves_no_partial_entry(data_dir, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "results")
+
+    def failing_to_zarr(self, *args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(xr.Dataset, "to_zarr", failing_to_zarr)
+    with pytest.raises(OSError, match="disk full"):
+        cached_load_data_by_gid_multiple_setups([1], [101], data_dir, cache_dir=cache_dir)
+
+    assert os.listdir(cache_dir) == []
+
+
+def test_eviction_spares_recently_used_results(data_dir, tmp_path):
+    cache_dir = str(tmp_path / "results")
+    for gid in (101, 102, 103):
+        cached_load_data_by_gid_multiple_setups([1], [gid], data_dir, cache_dir=cache_dir)
+    entries = sorted(os.listdir(cache_dir))
+    # Two results were last used long ago
+    for entry in entries[:2]:
+        query_file = os.path.join(cache_dir, entry, "query.json")
+        os.utime(query_file, (time.time() - 3600,) * 2)
+
+    # A cache bound of zero bytes evicts all but the recently used result
+    cached_load_data_by_gid_multiple_setups([1], [104], data_dir, cache_dir=cache_dir, max_bytes=0)
+
+    remaining = set(os.listdir(cache_dir))
+    assert len(remaining) == 2
+    assert entries[2] in remaining
+    assert not remaining & set(entries[:2])
@@ -0,0 +1,64 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from inspire_oedi_access import build_catalog, load_data_by_gid, open_zarr_dataset
+from inspire_oedi_access.catalog import dataset_path
+
+from conftest import make_setup
+
+
+@pytest.fixture
+def dataset_root(data_dir, tmp_path):
+    root = tmp_path / "root"
+    shutil.copytree(data_dir, root / "v1.1")
+    return str(root)
+
+
+def test_catalog_query_does_not_read_the_gid_index(dataset_root, data_dir):
+    catalog = build_catalog(dataset_root)
+    path = dataset_path(catalog=catalog)
+    # Without its chunks, the store's gid coordinate can no longer be read
+    for chunk in os.listdir(os.path.join(path, "preliminary_01.zarr", "gid")):
+        if not chunk.startswith("."):
+            os.remove(os.path.join(path, "preliminary_01.zarr", "gid", chunk))
+
+    data, matching_gids = load_data_by_gid(1, [150, 101, 999], path, catalog=catalog)
+
+    expected = open_zarr_dataset(1, data_dir).sel(gid=[101, 150])
+    assert matching_gids == [101, 150]
+    assert data["gid"].values.tolist() == [101, 150]
+    np.testing.assert_array_equal(data["ghi"].values, expected["ghi"].values)
+
+
+def test_stale_catalog_is_detected(dataset_root):
+    catalog = build_catalog(dataset_root)
+    path = dataset_path(catalog=catalog)
+    # The store is replaced upstream with fewer GIDs after the catalog was built
+    make_setup(1).isel(gid=slice(0, 40)).to_zarr(
+        os.path.join(path, "preliminary_01.zarr"), mode="w", consolidated=True, zarr_format=2
+    )
+
+    with pytest.raises(ValueError, match="refresh=True"):
+        load_data_by_gid(1, [101], path, catalog=catalog)
+
+
+def test_consolidated_stores_are_not_listed(dataset_root, monkeypatch):
+    from fsspec.implementations.local import LocalFileSystem
+
+    listed = []
+    find = LocalFileSystem.find
+
+    def recording_find(self, path, *args, **kwargs):
+        listed.append(path)
+        return find(self, path, *args, **kwargs)
+
+    monkeypatch.setattr(LocalFileSystem, "find", recording_find)
+    catalog = build_catalog(dataset_root)
+
+    assert listed == []
+    setup = catalog["versions"]["v1.1"]["setups"]["1"]
+    assert setup["variables"]["ground_irradiance"]["dims"] == ["gid", "time", "distance"]
+    assert setup["variables"]["ghi"]["chunks"] == [16, 240]
@@ -0,0 +1,72 @@
+import os
+
+import pandas as pd
+import pytest
+import xarray as xr
+
+from inspire_oedi_access import cache, load_lookup_table, open_zarr_dataset
+from inspire_oedi_access.cli import main
+
+
+def test_gid_writes_the_selected_window(data_dir, tmp_path):
+    output = str(tmp_path / "gids.parquet")
+    main(["gid", "101", "150", "--setups", "1", "2", "--variables", "ghi", "--start", "2020-01-02",
+          "--end", "2020-01-03 23:00", "--source", data_dir, "--block-size", "1", "-o", output])
+
+    result = pd.read_parquet(output)
+    assert sorted(result.columns) == ["ghi", "gid", "setup", "time"]
+    # 2 setups x 2 GIDs x 48 hours
+    assert len(result) == 2 * 2 * 48
+    row = result.iloc[0]
+    expected = open_zarr_dataset(int(row["setup"]), data_dir)["ghi"].sel(gid=row["gid"], time=row["time"])
+    assert row["ghi"] == float(expected)
+
+
+def test_point_interpolation_writes_data_and_neighbours(data_dir, tmp_path):
+    lookup_df = load_lookup_table(os.path.join(data_dir, "gid-lat-lon.csv"))
+    latitude, longitude = lookup_df["latitude"].mean(), lookup_df["longitude"].mean()
+    output = str(tmp_path / "point.csv")
+    main(["point", str(latitude), str(longitude), "--interpolate", "idw", "--setups", "1",
+          "--variables", "tilt", "--source", data_dir, "-o", output])
+
+    neighbors = pd.read_csv(str(tmp_path / "point_neighbors.csv"))
+    assert len(neighbors) == 4
+    assert neighbors["neighbor_weight"].sum() == pytest.approx(1)
+    result = pd.read_csv(output)
+    expected = open_zarr_dataset(1, data_dir)["tilt"].sel(gid=neighbors["neighbor_gid"].to_numpy())
+    assert result["tilt"].item() == pytest.approx(float((expected * neighbors["neighbor_weight"].to_numpy()).sum()))
+
+
+def test_bbox_cache_passes_the_layout_through(data_dir, tmp_path, monkeypatch):
+    calls = []
+    load = cache.load_data_by_gid_multiple_setups
+
+    def recording_load(*args, **kwargs):
+        calls.append(kwargs)
+        return load(*args, **kwargs)
+
+    monkeypatch.setattr(cache, "load_data_by_gid_multiple_setups", recording_load)
+    box = ["33", "37", "-108", "-102"]
+    cached_output = str(tmp_path / "cached.zarr")
+    main(["bbox", *box, "--setups", "1", "--cache", "--layout", "auto", "--start", "2020-01-05",
+          "--source", data_dir, "-o", cached_output])
+    output = str(tmp_path / "box.zarr")
+    main(["bbox", *box, "--setups", "1", "--start", "2020-01-05", "--source", data_dir, "-o", output])
+
+    assert calls[0]["layout"] == "auto"
+    assert calls[0]["time_range"] == ("2020-01-05", None)
+    xr.testing.assert_identical(xr.open_zarr(cached_output).load(), xr.open_zarr(output).load())
+
+
+def test_bench_reports_each_run(data_dir, capsys):
+    main(["bench", "--n-gids", "3", "--repeat", "2", "--setups", "1", "--source", data_dir])
+
+    out = capsys.readouterr().out
+    assert "Run 1:" in out and "Run 2:" in out
+    assert "3 GIDs x 1 setups" in out
+
+
+def test_unknown_output_format_is_rejected(data_dir, tmp_path):
+    with pytest.raises(ValueError, match="Output must end in"):
+        main(["gid", "101", "--setups", "1", "--source", data_dir, "-o", str(tmp_path / "out.txt")])
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from conftest import make_setup
+from inspire_oedi_access.compare import _best, _rank, compare_setups
+
+
+GIDS = [150, 101, 133, 999]
+
+
+def _expected(setup_nums, variable, aggregate=None):
+    # (gid, time[, distance], setup) values of the GIDs present in every setup, in sorted order
+    arrays = [make_setup(setup_num)[variable].sel(gid=sorted(GIDS[:3])) for setup_num in setup_nums]
+    if aggregate is not None:
+        arrays = [getattr(array, aggregate)("time") for array in arrays]
+    return np.stack([array.values for array in arrays], axis=-1)
+
+
+def test_difference_and_ratio_against_the_reference(data_dir):
+    stacked = _expected([2, 1], "ground_irradiance")
+
+    difference = compare_setups([2, 1], GIDS, "ground_irradiance", "difference",
+                                reference_setup=1, s3_bucket_path=data_dir)
+    ratio = compare_setups([2, 1], GIDS, "ground_irradiance", "ratio", reference_setup=1,
+                           s3_bucket_path=data_dir)
+
+    assert difference["gid"].values.tolist() == [101, 133, 150]
+    assert difference["setup"].values.tolist() == [2, 1]
+    assert difference.name == "ground_irradiance_difference"
+    np.testing.assert_allclose(difference.transpose(..., "setup").values,
+                               stacked - stacked[..., [1]])
+    np.testing.assert_allclose(ratio.transpose(..., "setup").values, stacked / stacked[..., [1]])
+
+
+def test_rank_and_best_pick_the_highest_value(data_dir):
+    stacked = _expected([1, 2], "ghi")
+
+    rank = compare_setups([1, 2], GIDS, "ghi", "rank", s3_bucket_path=data_dir).values
+    best = compare_setups([1, 2], GIDS, "ghi", "best", s3_bucket_path=data_dir).values
+
+    first_higher = stacked[..., 0] > stacked[..., 1]
+    np.testing.assert_array_equal(rank[..., 0], np.where(first_higher, 1, 2))
+    np.testing.assert_array_equal(rank[..., 1], np.where(first_higher, 2, 1))
+    np.testing.assert_array_equal(best, np.where(first_higher, 1, 2))
+
+
+def test_nans_rank_last():
+    stacked = np.array([[1.0, np.nan, 3.0], [np.nan, np.nan, -2.0]])
+
+    np.testing.assert_array_equal(_rank(stacked, 0, None), [[2, 3, 1], [2, 3, 1]])
+    np.testing.assert_array_equal(_best(stacked, 0, np.array([4, 5, 6])), [6, 6])
+
+
+def test_time_aggregates_are_compared(data_dir):
+    stacked = _expected([1, 2], "ghi", aggregate="mean")
+
+    best = compare_setups([1, 2], GIDS, "ghi", "best", aggregate="mean", s3_bucket_path=data_dir)
+
+    assert best.dims == ("gid",)
+    np.testing.assert_array_equal(best.values, np.array([1, 2])[np.argmax(stacked, axis=-1)])
+
+
+def test_invalid_comparisons_are_rejected(data_dir):
+    with pytest.raises(ValueError, match="comparison must be"):
+        compare_setups([1, 2], GIDS, "ghi", "quotient", s3_bucket_path=data_dir)
+    with pytest.raises(ValueError, match="not among"):
+        compare_setups([1, 2], GIDS, "ghi", "ratio", reference_setup=3, s3_bucket_path=data_dir)
+    assert compare_setups([1, 2], [999], "ghi", "best", s3_bucket_path=data_dir) is None
@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import bilinear_field
+from inspire_oedi_access import load_lookup_table
+from inspire_oedi_access.interpolate import (
+    find_nearest_gids,
+    interpolation_weights,
+    load_data_by_lat_lon_interpolated,
+)
+
+
+@pytest.fixture
+def grid(grid_dir):
+    return load_lookup_table(os.path.join(grid_dir, "gid-lat-lon.csv"))
+
+
+def test_bilinear_weights_match_exact_bilinear_interpolation(grid):
+    # Points near the centre of their cells, whose 4 nearest GIDs are the cell corners
+    rng = np.random.default_rng(3)
+    tx, ty = rng.uniform(0.3, 0.7, (2, 20))
+    lat0 = 30 + 0.5 * rng.integers(0, 5, 20)
+    lon0 = -105 + 0.5 * rng.integers(0, 9, 20)
+    latitudes, longitudes = lat0 + 0.5 * ty, lon0 + 0.5 * tx
+
+    gids, distances, lats, lons = find_nearest_gids(latitudes, longitudes, lookup_df=grid)
+    weights = interpolation_weights(latitudes, longitudes, distances, lats, lons, "bilinear")
+
+    # Textbook weights of each corner: (1 - tx)(1 - ty), tx(1 - ty), (1 - tx)ty, tx ty
+    cx = np.where(lons > longitudes[:, None], tx[:, None], 1 - tx[:, None])
+    cy = np.where(lats > latitudes[:, None], ty[:, None], 1 - ty[:, None])
+    np.testing.assert_allclose(weights, cx * cy, atol=1e-12)
+    np.testing.assert_allclose(weights.sum(axis=1), 1)
+
+
+def test_idw_weights_favour_the_nearest_gid(grid):
+    latitudes, longitudes = np.array([31.1, 32.0]), np.array([-103.9, -102.5])
+
+    gids, distances, lats, lons = find_nearest_gids(latitudes, longitudes, lookup_df=grid)
+    weights = interpolation_weights(latitudes, longitudes, distances, lats, lons, "idw")
+
+    np.testing.assert_allclose(weights.sum(axis=1), 1)
+    assert np.all(np.diff(weights[0]) <= 0)
+    # A point on a grid point takes its value only
+    assert weights[1].tolist() == [1.0, 0.0, 0.0, 0.0]
+    assert gids[1, 0] == grid.set_index(["latitude", "longitude"]).loc[(32.0, -102.5), "gid"]
+
+
+def test_bilinear_interpolation_reproduces_a_bilinear_field(grid_dir, grid):
+    # Any 4 neighbours in general position reproduce a bilinear field, also off-centre
+    latitudes = np.array([30.1, 32.25, 32.49])
+    longitudes = np.array([-104.9, -101.4, -100.76])
+
+    data = load_data_by_lat_lon_interpolated(latitudes, longitudes, 1, method="bilinear",
+                                             s3_bucket_path=grid_dir, lookup_df=grid).load()
+
+    expected = bilinear_field(latitudes, longitudes)
+    np.testing.assert_allclose(data["tilt"].values, expected, rtol=1e-10)
+    np.testing.assert_allclose(data["ghi"].values,
+                               expected[:, None] * np.linspace(0.5, 1.5, 48), rtol=1e-10)
+    assert data["neighbor_gid"].shape == (3, 4)
+
+
+def test_collinear_neighbours_fall_back_to_idw(grid):
+    # Three of the 4 nearest GIDs lie on the row at latitude 31.5
+    latitudes, longitudes = np.array([31.37]), np.array([-103.02])
+
+    gids, distances, lats, lons = find_nearest_gids(latitudes, longitudes, lookup_df=grid)
+    assert (lats[0] == 31.5).sum() == 3
+    np.testing.assert_array_equal(
+        interpolation_weights(latitudes, longitudes, distances, lats, lons, "bilinear"),
+        interpolation_weights(latitudes, longitudes, distances, lats, lons, "idw"),
+    )
+
+
+def test_bilinear_needs_four_neighbours(grid):
+    gids, distances, lats, lons = find_nearest_gids([31.1], [-103.9], k=3, lookup_df=grid)
+    with pytest.raises(ValueError, match="k=4"):
+        interpolation_weights([31.1], [-103.9], distances, lats, lons, "bilinear")
@@ -0,0 +1,144 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from inspire_oedi_access import find_nearest_gid
+from inspire_oedi_access import lookup_index
+from inspire_oedi_access.lookup_index import (
+    build_lookup_index,
+    find_gids_in_box,
+    find_gids_in_boxes,
+    find_nearest_gid_indexed,
+    open_lookup_index,
+)
+
+
+def _write_lookup_table(path, n, seed):
+    rng = np.random.default_rng(seed)
+    # Rounded coordinates put many points exactly on box edges and cell borders
+    table = pd.DataFrame(
+        {
+            "latitude": np.round(rng.uniform(30, 40, n), 2),
+            "longitude": np.round(rng.uniform(-110, -100, n), 2),
+        },
+        index=pd.Index(rng.permutation(np.arange(1000, 1000 + n)), name="gid"),
+    )
+    table.to_csv(path)
+    return table.reset_index()
+
+
+@pytest.fixture
+def lookup_table(tmp_path):
+    path = str(tmp_path / "gid-lat-lon.csv")
+    table = _write_lookup_table(path, 3000, seed=1)
+    return path, table
+
+
+def _box_mask(table, lat_min, lat_max, lon_min, lon_max):
+    return table[
+        (table["latitude"] >= lat_min) & (table["latitude"] <= lat_max)
+        & (table["longitude"] >= lon_min) & (table["longitude"] <= lon_max)
+    ]
+
+
+def test_boxes_match_the_full_table_scan(lookup_table):
+    path, table = lookup_table
+    index = open_lookup_index(lookup_table_path=path)
+    rng = np.random.default_rng(2)
+
+    boxes = []
+    for _ in range(300):
+        # Half the boxes have edges on data points, some extend past the grid
+        if rng.random() < 0.5:
+            lats = table["latitude"].sample(2, random_state=rng).to_numpy()
+            lons = table["longitude"].sample(2, random_state=rng).to_numpy()
+        else:
+            lats = rng.uniform(29, 41, 2)
+            lons = rng.uniform(-111, -99, 2)
+        box = (lats.min(), lats.max(), lons.min(), lons.max())
+        boxes.append(box)
+
+        result = find_gids_in_box(*box, index)
+        expected = _box_mask(table, *box)
+        assert result["gid"].tolist() == expected["gid"].tolist()
+
+    boxes = pd.DataFrame(boxes, columns=["lat_min", "lat_max", "lon_min", "lon_max"])
+    result = find_gids_in_boxes(boxes, index)
+    for label, box in zip(boxes.index, boxes.itertuples(index=False)):
+        assert result.loc[result["box"] == label, "gid"].tolist() \
+            == _box_mask(table, *box)["gid"].tolist()
+
+
+def test_nearest_matches_the_full_table_scan(tmp_path):
+    path = str(tmp_path / "gid-lat-lon.csv")
+    table = _write_lookup_table(path, 3000, seed=3)
+    # Unrounded coordinates, so no two points are at the same distance from a target
+    rng = np.random.default_rng(4)
+    table["latitude"] += rng.uniform(-0.004, 0.004, len(table))
+    table["longitude"] += rng.uniform(-0.004, 0.004, len(table))
+    table.set_index("gid").to_csv(path)
+    index = open_lookup_index(lookup_table_path=path)
+
+    # Targets inside the grid and up to a few degrees outside it
+    for latitude, longitude in zip(rng.uniform(27, 43, 300), rng.uniform(-113, -97, 300)):
+        result = find_nearest_gid_indexed(latitude, longitude, index)
+        expected = find_nearest_gid(latitude, longitude, table)
+        assert result[0] == expected[0]
+        assert result[1:] == pytest.approx(expected[1:])
+
+
+def test_index_is_rebuilt_when_the_lookup_table_changes(lookup_table, capsys):
+    path, table = lookup_table
+    index = open_lookup_index(lookup_table_path=path)
+    assert index["gid"].tolist() == table["gid"].tolist()
+
+    # An unchanged table is not rebuilt on the next open in a new process
+    lookup_index._OPENED.clear()
+    open_lookup_index(lookup_table_path=path, check_interval=0)
+    assert "rebuilding" not in capsys.readouterr().out
+
+    changed = _write_lookup_table(path, 2000, seed=5)
+    # The table was checked less than check_interval ago
+    lookup_index._OPENED.clear()
+    index = open_lookup_index(lookup_table_path=path)
+    assert "rebuilding" not in capsys.readouterr().out
+    assert len(index["gid"]) == len(table)
+
+    lookup_index._OPENED.clear()
+    index = open_lookup_index(lookup_table_path=path, check_interval=0)
+
+    assert "rebuilding" in capsys.readouterr().out
+    assert index["gid"].tolist() == changed["gid"].tolist()
+    assert find_gids_in_box(30, 40, -110, -100, index)["gid"].tolist() \
+        == changed["gid"].tolist()
+
+
+def test_rebuild_keeps_indexes_opened_by_other_workers(lookup_table):
+    path, table = lookup_table
+    opened = open_lookup_index(lookup_table_path=path)
+
+    # Another worker rebuilds after the table changed
+    changed = _write_lookup_table(path, 2000, seed=6)
+    index_dir = build_lookup_index(lookup_table_path=path)
+
+    assert len(os.listdir(index_dir)) == 2  # the newest build and the check marker
+    assert opened["gid"].tolist() == table["gid"].tolist()
+    assert open_lookup_index(lookup_table_path=path)["gid"].tolist() == changed["gid"].tolist()
+
+
+def test_open_retries_a_build_removed_meanwhile(lookup_table, monkeypatch):
+    path, table = lookup_table
+    index_dir = build_lookup_index(lookup_table_path=path)
+    lookup_index._OPENED.clear()
+
+    # The newest build seen when listing is gone by the time it is mapped
+    versions = [["v99999999999999999999"]]
+    index_versions = lookup_index._index_versions
+    monkeypatch.setattr(lookup_index, "_index_versions",
+                        lambda d: versions.pop() if versions else index_versions(d))
+
+    index = open_lookup_index(lookup_table_path=path)
+    assert index_dir == lookup_index._index_dir(path)
+    assert index["gid"].tolist() == table["gid"].tolist()
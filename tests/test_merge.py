@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from inspire_oedi_access import merge
+from inspire_oedi_access.main import concatenateData
+from inspire_oedi_access.merge import merge_files
+
+
+def test_late_type_change_in_csv(tmp_path):
+    # Far beyond the first parsing block, an int column turns out to hold floats
+    values = np.arange(200_000).astype(object)
+    values[-1] = 1.5
+    pd.DataFrame({"gid": np.arange(200_000), "val": values}).to_csv(tmp_path / "a.csv", index=False)
+
+    rows = merge_files(str(tmp_path), str(tmp_path / "out.parquet"), block_size=2**16)
+
+    out = pd.read_parquet(tmp_path / "out.parquet")
+    assert rows == 200_000
+    assert out["val"].dtype == np.float64
+    assert out["val"].iloc[-1] == 1.5
+    assert out["val"].iloc[-2] == 199_998
+
+
+def test_files_with_different_columns(tmp_path):
+    pd.DataFrame({"gid": [1, 2], "val": [1, 2]}).to_csv(tmp_path / "a.csv", index=False)
+    pd.DataFrame({"gid": [3], "val": [0.5], "extra": ["x"]}).to_csv(tmp_path / "b.csv", index=False)
+    pd.DataFrame({"gid": [4], "val": ["n/a"]}).to_parquet(tmp_path / "c.parquet")
+
+    merge_files(str(tmp_path), str(tmp_path / "out.parquet"), pattern="*.*")
+
+    out = pd.read_parquet(tmp_path / "out.parquet")
+    assert list(out.columns) == ["gid", "val", "extra"]
+    assert out["gid"].tolist() == [1, 2, 3, 4]
+    # int, float and string values of the same column are promoted to strings
+    assert out["val"].tolist() == ["1", "2", "0.5", "n/a"]
+    assert out["extra"].isna().tolist() == [True, True, False, True]
+
+
+def test_matches_pandas_concat(tmp_path):
+    rng = np.random.default_rng(0)
+    frames = [
+        pd.DataFrame({"gid": rng.integers(0, 100, 50), "ghi": rng.random(50), "site": "s"})
+        for _ in range(3)
+    ]
+    for i, frame in enumerate(frames):
+        frame.to_csv(tmp_path / f"{i}.csv", index=False)
+
+    merge_files(str(tmp_path), str(tmp_path / "out.parquet"), dedupe=True)
+
+    expected = pd.concat(frames, ignore_index=True).drop_duplicates(ignore_index=True)
+    out = pd.read_parquet(tmp_path / "out.parquet")
+    pd.testing.assert_frame_equal(out, expected, check_dtype=False)
+
+
+def test_dedupe_subset_across_files_and_batches(tmp_path):
+    n_rows = 100_000
+    first = pd.DataFrame({"gid": np.arange(n_rows) % 1000, "ghi": np.arange(n_rows) * 0.5})
+    second = pd.DataFrame({"gid": np.arange(500, 1500), "ghi": -1.0})
+    first.to_csv(tmp_path / "a.csv", index=False)
+    second.to_csv(tmp_path / "b.csv", index=False)
+
+    rows = merge_files(str(tmp_path), str(tmp_path / "out.csv"), dedupe=True,
+                       dedupe_subset=["gid"], block_size=2**16)
+
+    # The first row of every gid is kept, wherever its repeats are
+    out = pd.read_csv(tmp_path / "out.csv")
+    assert rows == 1500
+    assert out["gid"].tolist() == list(range(1500))
+    assert out["ghi"].tolist() == [g * 0.5 for g in range(1000)] + [-1.0] * 500
+
+
+def test_memory_does_not_grow_with_input(tmp_path, monkeypatch):
+    n_rows = 400_000
+    pd.DataFrame({"gid": np.arange(n_rows), "ghi": np.random.default_rng(0).random(n_rows)}).to_csv(
+        tmp_path / "a.csv", index=False
+    )
+    allocated = []
+    conform = merge._conform
+
+    def recording_conform(batch, schema):
+        allocated.append(pa.total_allocated_bytes())
+        return conform(batch, schema)
+
+    monkeypatch.setattr(merge, "_conform", recording_conform)
+    merge_files(str(tmp_path), str(tmp_path / "out.parquet"), use_threads=False, block_size=2**16)
+
+    assert len(allocated) > 10
+    # Memory held does not build up as batches are written: far below the 6.4 MB of
+    # parsed data. The last batches are compared, so a passing allocation of another
+    # thread of the process does not count.
+    assert np.median(allocated[-5:]) - allocated[0] < n_rows * 16 / 4
+
+
+def test_concatenate_data_keeps_the_pandas_header(tmp_path):
+    pd.DataFrame({"a b": [1], "c,d": [2.5]}).to_csv(tmp_path / "a.csv", index=False)
+
+    concatenateData("XX", str(tmp_path))
+
+    header = (tmp_path / "state_XX_data.csv").read_text().splitlines()[0]
+    assert header == 'a b,"c,d"'
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from inspire_oedi_access import main
+from inspire_oedi_access import load_data_by_gid_multiple_setups
+
+
+@pytest.fixture
+def flaky_setups(monkeypatch):
+    """
+    Make load_data_by_gid fail for some setups; returns the calls made and the failure plan.
+    """
+    calls = []
+    failures = {}
+    load_data_by_gid = main.load_data_by_gid
+
+    def flaky_load(setup_num, *args, **kwargs):
+        calls.append(setup_num)
+        if failures.get(setup_num):
+            error = failures[setup_num].pop(0)
+            raise error
+        return load_data_by_gid(setup_num, *args, **kwargs)
+
+    monkeypatch.setattr(main, "load_data_by_gid", flaky_load)
+    return calls, failures
+
+
+def test_transient_errors_are_retried(data_dir, flaky_setups):
+    calls, failures = flaky_setups
+    failures[2] = [ConnectionResetError("reset"), TimeoutError("timed out")]
+
+    data, matching_gids = load_data_by_gid_multiple_setups([1, 2], [101, 150], data_dir,
+                                                           retry_backoff=0)
+
+    assert calls == [1, 2, 2, 2]
+    assert data["setup"].values.tolist() == [1, 2]
+    assert matching_gids == {1: [101, 150], 2: [101, 150]}
+
+
+def test_other_errors_are_not_retried(data_dir, flaky_setups):
+    calls, failures = flaky_setups
+    failures[2] = [FileNotFoundError("no such store")]
+
+    with pytest.raises(FileNotFoundError):
+        load_data_by_gid_multiple_setups([1, 2], [101], data_dir, retry_backoff=0)
+    assert calls == [1, 2]
+
+
+def test_failed_setups_are_reported_in_errors(data_dir, flaky_setups):
+    calls, failures = flaky_setups
+    failures[1] = [ConnectionResetError("reset")] * 3
+
+    errors = {}
+    data, matching_gids = load_data_by_gid_multiple_setups([1, 2], [101], data_dir, retries=2,
+                                                           retry_backoff=0, errors=errors)
+
+    assert calls == [1, 1, 1, 2]
+    assert errors == {1: "ConnectionResetError: reset"}
+    assert data["setup"].values.tolist() == [2]
+    assert list(matching_gids) == [2]
+
+
+def test_checkpoint_resumes_the_same_query(data_dir, tmp_path, flaky_setups):
+    calls, failures = flaky_setups
+    checkpoint_dir = str(tmp_path / "checkpoint")
+    gids = [150, 101]
+
+    # The first run stops at setup 2
+    failures[2] = [PermissionError("denied")]
+    with pytest.raises(PermissionError):
+        load_data_by_gid_multiple_setups([1, 2], gids, data_dir, checkpoint_dir=checkpoint_dir)
+    assert calls == [1, 2]
+
+    data, matching_gids = load_data_by_gid_multiple_setups([1, 2], gids, data_dir,
+                                                           checkpoint_dir=checkpoint_dir)
+
+    # Only setup 2 is read again
+    assert calls == [1, 2, 2]
+    expected, expected_gids = load_data_by_gid_multiple_setups([1, 2], gids, data_dir)
+    assert matching_gids == expected_gids
+    np.testing.assert_array_equal(data["ghi"].values, expected["ghi"].values)
+
+    with pytest.raises(ValueError, match="different query"):
+        load_data_by_gid_multiple_setups([1, 2], [101], data_dir, checkpoint_dir=checkpoint_dir)
@@ -0,0 +1,73 @@
+import dask
+import numpy as np
+import pytest
+import xarray as xr
+
+zarr = pytest.importorskip("zarr", minversion="3")
+from zarr.storage import MemoryStore, WrapperStore
+
+from inspire_oedi_access.prefetch import ReadAheadStore
+
+from conftest import make_setup
+
+
+class LoggingStore(WrapperStore):
+    """
+    Store that records the chunk keys of 'ghi' requested through it.
+    """
+
+    def __init__(self, store, log, name):
+        super().__init__(store)
+        self.log = log
+        self.name = name
+
+    def _with_store(self, store):
+        return type(self)(store, self.log, self.name)
+
+    async def get(self, key, prototype, byte_range=None):
+        if key.startswith("ghi/") and not key.endswith(".zarray") and not key.endswith(".zattrs"):
+            self.log.append((self.name, key))
+        return await self._store.get(key, prototype, byte_range)
+
+
+@pytest.fixture(scope="module")
+def memory_store():
+    store = MemoryStore()
+    dataset = make_setup(1).chunk({"gid": 16, "time": 240, "distance": 3})
+    dataset.to_zarr(store, consolidated=True, zarr_format=2)
+    return store
+
+
+def open_logged(memory_store, depth):
+    log = []
+    store = LoggingStore(memory_store, log, "source")
+    if depth:
+        store = LoggingStore(ReadAheadStore(store, depth=depth), log, "reader")
+    return xr.open_zarr(store), log
+
+
+def source_reads(log):
+    return [key for name, key in log if name == "source"]
+
+
+def test_scattered_reads_fetch_nothing_extra(memory_store):
+    counts = {}
+    for depth in (0, 4):
+        ds, log = open_logged(memory_store, depth)
+        with dask.config.set(scheduler="synchronous"):
+            ds["ghi"].isel(gid=[1, 5, 40]).sel(time=slice("2020-01-04", "2020-01-05")).load()
+        counts[depth] = len(source_reads(log))
+    assert counts[4] == counts[0]
+
+
+def test_sequential_scan_is_read_ahead(memory_store):
+    ds, log = open_logged(memory_store, 4)
+    with dask.config.set(scheduler="synchronous"):
+        values = ds["ghi"].isel(gid=3).values
+
+    np.testing.assert_array_equal(values, make_setup(1)["ghi"].isel(gid=3).values)
+    # Every chunk is fetched once, and some before the reader asked for them
+    reads = source_reads(log)
+    assert len(reads) == len(set(reads)) == 4
+    fetched_ahead = [key for key in reads if log.index(("source", key)) < log.index(("reader", key))]
+    assert fetched_ahead
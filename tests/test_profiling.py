@@ -0,0 +1,57 @@
+import glob
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fsspec.asyn import get_loop, sync
+from s3fs import S3FileSystem
+
+from inspire_oedi_access import load_data_by_gid, profile_queries
+
+
+def test_concurrent_queries_get_their_own_traces(data_dir, tmp_path, monkeypatch):
+    monkeypatch.setenv("INSPIRE_OEDI_PROFILE", str(tmp_path))
+    gids = [100, 120, 140, 150]
+
+    with ThreadPoolExecutor(4) as executor:
+        list(executor.map(lambda gid: load_data_by_gid(1, [gid], data_dir), gids))
+
+    traces = [json.load(open(f)) for f in glob.glob(str(tmp_path / "*.json"))]
+    assert len(traces) == 4
+    assert sorted(trace["stages"][0]["args"][1] for trace in traces) == [f"[{g}]" for g in gids]
+    for trace in traces:
+        assert [(stage["name"], stage["depth"]) for stage in trace["stages"]] == [
+            ("load_data_by_gid", 0), ("open_zarr_dataset", 1),
+        ]
+
+
+def test_s3_requests_are_logged_in_the_requesting_session(tmp_path, monkeypatch):
+    async def fake_call_s3(self, method, *args, **kwargs):
+        return {}
+
+    monkeypatch.setattr(S3FileSystem, "_call_s3", fake_call_s3)
+    fs = S3FileSystem(anon=True, skip_instance_cache=True)
+    barrier = threading.Barrier(2)
+
+    def query(key):
+        with profile_queries(str(tmp_path / f"{key}.json"), label=key) as trace:
+            barrier.wait()
+            sync(get_loop(), fs._call_s3, "get_object", Bucket="bucket", Key=key)
+            barrier.wait()
+        return trace
+
+    with ThreadPoolExecutor(2) as executor:
+        traces = list(executor.map(query, ["a", "b"]))
+
+    for key, trace in zip(["a", "b"], traces):
+        assert [request["key"] for request in trace["s3_requests"]] == [key]
+    # The request method is restored once the last session ends
+    assert S3FileSystem._call_s3 is fake_call_s3
+
+
+def test_nested_session_in_the_same_thread_is_refused(tmp_path):
+    with profile_queries(str(tmp_path / "outer.json")):
+        with pytest.raises(RuntimeError):
+            with profile_queries(str(tmp_path / "inner.json")):
+                pass
@@ -0,0 +1,97 @@
+import os
+import shutil
+from collections import Counter
+
+import numpy as np
+import pytest
+
+pytest.importorskip("zarr", minversion="3")
+
+from inspire_oedi_access import main
+from inspire_oedi_access import choose_layout, load_data_by_gid, open_zarr_dataset, rechunk_setup
+
+from conftest import make_setup
+
+
+@pytest.fixture
+def mirror(data_dir, tmp_path):
+    path = str(tmp_path / "mirror")
+    shutil.copytree(data_dir, path)
+    for layout in ("timeseries", "map"):
+        # Small chunks, so the layouts differ within the synthetic store
+        rechunk_setup(1, path, layout, chunk_bytes=8 * 960 * 4, max_workers=2)
+    return path
+
+
+def test_rechunked_copies_open_to_the_same_dataset(mirror):
+    original = open_zarr_dataset(1, mirror)
+    for layout in ("timeseries", "map"):
+        rechunked = open_zarr_dataset(1, mirror, layout=layout)
+        assert rechunked.equals(original)
+
+
+def test_layout_follows_the_query_shape(mirror):
+    all_gids = np.arange(60)
+    assert choose_layout(1, [3], mirror) == "timeseries"
+    assert choose_layout(1, all_gids, mirror, time_indices=[5, 6]) == "map"
+
+
+def test_auto_layout_opens_one_store(mirror, monkeypatch):
+    gids = list(range(100, 160))
+    time_range = ("2020-01-05 00:00", "2020-01-05 02:00")
+    load_data_by_gid(1, gids, mirror, layout="auto", time_range=time_range)
+
+    opened = []
+    open_dataset = main.open_zarr_dataset
+
+    def counting_open(*args, **kwargs):
+        opened.append(kwargs.get("layout"))
+        return open_dataset(*args, **kwargs)
+
+    monkeypatch.setattr(main, "open_zarr_dataset", counting_open)
+    data, matching_gids = load_data_by_gid(1, gids, mirror, layout="auto", time_range=time_range)
+
+    expected = open_zarr_dataset(1, mirror).sel(gid=gids, time=slice(*time_range))
+    assert opened == ["map"]
+    assert matching_gids == gids
+    assert data["gid"].values.tolist() == gids
+    np.testing.assert_array_equal(data["ghi"].values, expected["ghi"].values)
+
+
+@pytest.mark.parametrize("layout, source_chunks", [
+    ("map", {"gid": 4, "time": 960, "distance": 3}),
+    ("timeseries", {"gid": 60, "time": 40, "distance": 3}),
+])
+def test_source_chunks_are_read_once(tmp_path, monkeypatch, layout, source_chunks):
+    from zarr.storage import LocalStore
+
+    # Source chunks run across the target chunks, and a block holds a fraction of the array
+    path = str(tmp_path)
+    make_setup(1).chunk(source_chunks).to_zarr(
+        os.path.join(path, "preliminary_01.zarr"), consolidated=True, zarr_format=2
+    )
+
+    reads = Counter()
+    get = LocalStore.get
+
+    async def counting_get(self, key, *args, **kwargs):
+        name = key.split("/")[-1]
+        if str(self.root).endswith("preliminary_01.zarr") and name[0].isdigit():
+            reads[key] += 1
+        return await get(self, key, *args, **kwargs)
+
+    monkeypatch.setattr(LocalStore, "get", counting_get)
+    row_bytes = (60 if layout == "map" else 960) * 3 * 8
+    target_path = rechunk_setup(1, path, layout, chunk_bytes=row_bytes * 8,
+                                max_memory=row_bytes * 24, max_workers=1)
+    monkeypatch.undo()
+
+    source_path = os.path.join(path, "preliminary_01.zarr")
+    chunk_keys = {
+        os.path.relpath(os.path.join(root, f), source_path)
+        for root, _, files in os.walk(source_path) for f in files if f[0].isdigit()
+    }
+    assert set(reads) == chunk_keys
+    assert set(reads.values()) == {1}
+    assert sorted(os.listdir(path)) == ["preliminary_01.zarr", os.path.basename(target_path)]
+    assert open_zarr_dataset(1, path, layout=layout).equals(open_zarr_dataset(1, path))
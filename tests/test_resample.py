@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from inspire_oedi_access import load_data_by_gid
+from inspire_oedi_access.main import _align_time_chunks, resample_time
+
+
+@pytest.fixture(scope="module")
+def year_dir(tmp_path_factory):
+    """
+    A setup store spanning a year, chunked so that days, months and seasons straddle chunks.
+    """
+    path = tmp_path_factory.mktemp("year")
+    times = pd.date_range("2020-01-01", "2020-12-31 21:00", freq="3h")
+    rng = np.random.default_rng(7)
+    ds = xr.Dataset(
+        {
+            "ghi": (("gid", "time"), rng.random((6, len(times)))),
+            "ground_irradiance": (("gid", "time", "distance"), rng.random((6, len(times), 3))),
+        },
+        coords={"gid": np.arange(100, 106), "time": times, "distance": np.arange(3)},
+    )
+    ds.chunk({"gid": 4, "time": 100, "distance": 3}).to_zarr(
+        path / "preliminary_01.zarr", consolidated=True, zarr_format=2
+    )
+    return str(path), ds
+
+
+@pytest.mark.parametrize("how", ["mean", "sum", "std", "median"])
+@pytest.mark.parametrize("freq", ["1D", "MS"])
+def test_frequency_resampling_matches_full_resolution(year_dir, freq, how):
+    path, ds = year_dir
+    data, _ = load_data_by_gid(1, [101, 104], path, resample=freq, resample_how=how)
+
+    expected = getattr(ds.sel(gid=[101, 104]).resample(time=freq), how)()
+    xr.testing.assert_allclose(data.load(), expected, rtol=1e-12, atol=0)
+
+
+@pytest.mark.parametrize("how", ["mean", "sum", "std", "median"])
+def test_season_climatology_matches_full_resolution(year_dir, how):
+    path, ds = year_dir
+    data, _ = load_data_by_gid(1, [100, 105], path, resample="season", resample_how=how)
+
+    expected = getattr(ds.sel(gid=[100, 105]).groupby("time.season"), how)()
+    xr.testing.assert_allclose(data.load(), expected, rtol=1e-12, atol=0)
+
+
+def test_resampled_bins_never_span_chunks(data_dir):
+    ds = xr.open_zarr(f"{data_dir}/preliminary_01.zarr").chunk(time=100)
+
+    # 100-hour chunks are regrouped along day boundaries before reducing
+    aligned = _align_time_chunks(ds, "1D")
+    assert all(size % 24 == 0 for size in aligned.chunksizes["time"])
+
+    data = resample_time(ds, "1D")
+    assert data.sizes["time"] == 40
+    xr.testing.assert_allclose(data.load(), ds.load().resample(time="1D").mean(), rtol=1e-12, atol=0)
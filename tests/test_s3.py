@@ -0,0 +1,45 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from inspire_oedi_access import configure_s3, get_s3_client, get_s3_resource
+from inspire_oedi_access import s3
+from inspire_oedi_access.aio import get_async_filesystem
+
+
+@pytest.fixture
+def restore_s3_config():
+    config = dict(s3.S3_CONFIG)
+    yield
+    configure_s3(**config)
+
+
+def test_resources_are_per_thread_and_the_client_is_shared():
+    def clients():
+        return get_s3_resource(), get_s3_resource(), get_s3_client()
+
+    with ThreadPoolExecutor(2) as executor:
+        (a1, a2, a_client), (b1, b2, b_client) = executor.map(lambda _: clients(), range(2))
+
+    assert a1 is a2 and b1 is b2
+    assert a1 is not b1
+    assert a_client is b_client
+
+
+def test_configure_s3_recreates_all_clients(restore_s3_config):
+    loop = asyncio.new_event_loop()
+    try:
+        before = loop.run_until_complete(get_async_filesystem("s3://"))
+        client, resource = get_s3_client(), get_s3_resource()
+
+        configure_s3(max_connections=3, read_timeout=5)
+
+        after = loop.run_until_complete(get_async_filesystem("s3://"))
+        assert after is not before
+        assert get_s3_client() is not client
+        assert get_s3_resource() is not resource
+        assert get_s3_client().meta.config.max_pool_connections == 3
+        assert after.config_kwargs["read_timeout"] == 5
+    finally:
+        loop.close()
@@ -0,0 +1,50 @@
+import asyncio
+
+import numpy as np
+
+from inspire_oedi_access import (
+    aload_data_by_gid,
+    load_data_by_gid,
+    open_zarr_dataset,
+    rechunk_setup,
+    sync_zarr_store,
+)
+
+
+def test_range_mirror_only_reports_synced_gids_and_times(data_dir, tmp_path):
+    mirror = str(tmp_path / "mirror")
+    sync_zarr_store(1, mirror, gid_range=(110, 115), time_range=("2020-01-03", None),
+                    s3_bucket_path=data_dir)
+
+    ds = open_zarr_dataset(1, mirror)
+    assert ds["gid"].values.tolist() == list(range(110, 116))
+    assert ds["time"].values[0] == np.datetime64("2020-01-03")
+
+    data, matching_gids = load_data_by_gid(1, [110, 150], mirror)
+    expected = open_zarr_dataset(1, data_dir).sel(gid=[110], time=slice("2020-01-03", None))
+    assert matching_gids == [110]
+    np.testing.assert_array_equal(data["ghi"].values, expected["ghi"].values)
+
+    data, matching_gids = asyncio.run(aload_data_by_gid(1, [110, 150], mirror))
+    assert matching_gids == [110]
+    np.testing.assert_array_equal(data["ghi"].values, expected["ghi"].values)
+
+
+def test_rechunked_range_mirror_keeps_the_ranges(data_dir, tmp_path):
+    mirror = str(tmp_path / "mirror")
+    sync_zarr_store(1, mirror, gid_range=(110, 115), s3_bucket_path=data_dir)
+    rechunk_setup(1, mirror, "timeseries")
+
+    rechunked = open_zarr_dataset(1, mirror, layout="timeseries")
+    assert rechunked["gid"].values.tolist() == list(range(110, 116))
+    assert not rechunked["ghi"].isnull().any()
+
+
+def test_resync_transfers_nothing(data_dir, tmp_path):
+    mirror = str(tmp_path / "mirror")
+    sync_zarr_store(1, mirror, s3_bucket_path=data_dir)
+
+    summary = sync_zarr_store(1, mirror, s3_bucket_path=data_dir)
+
+    assert summary["transferred"] == 0
+    assert open_zarr_dataset(1, mirror).sizes == open_zarr_dataset(1, data_dir).sizes